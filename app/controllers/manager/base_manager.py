@@ -1,6 +1,8 @@
 import threading
 from typing import Callable, Any, Dict
 
+from app.services.cpu_budget import budget
+
 
 class TaskManager:
     def __init__(self, max_concurrent_tasks: int):
@@ -12,9 +14,13 @@ class TaskManager:
     def create_queue(self):
         raise NotImplementedError()
 
+    def can_run(self) -> bool:
+        # 同时运行的任务数还受 CPU 预算限制，每个任务至少分到 cpu_min_threads_per_task 个线程
+        return self.current_tasks < min(self.max_concurrent_tasks, budget.max_tasks())
+
     def add_task(self, func: Callable, *args: Any, **kwargs: Any):
         with self.lock:
-            if self.current_tasks < self.max_concurrent_tasks:
+            if self.can_run():
                 print(f"add task: {func.__name__}, current_tasks: {self.current_tasks}")
                 self.execute_task(func, *args, **kwargs)
             else:
@@ -33,16 +39,14 @@ class TaskManager:
         try:
             with self.lock:
                 self.current_tasks += 1
-            func(*args, **kwargs)  # 在这里调用函数，传递*args和**kwargs
+            with budget.task(kwargs.get("task_id")):
+                func(*args, **kwargs)  # 在这里调用函数，传递*args和**kwargs
         finally:
             self.task_done()
 
     def check_queue(self):
         with self.lock:
-            if (
-                self.current_tasks < self.max_concurrent_tasks
-                and not self.is_queue_empty()
-            ):
+            if self.can_run() and not self.is_queue_empty():
                 task_info = self.dequeue()
                 func = task_info["func"]
                 args = task_info.get("args", ())
@@ -1,3 +1,4 @@
+import asyncio
 import glob
 import os
 import pathlib
@@ -6,7 +7,7 @@ from typing import Union
 
 from fastapi import BackgroundTasks, Depends, Path, Request, UploadFile
 from fastapi.params import File
-from fastapi.responses import FileResponse, StreamingResponse
+from fastapi.responses import FileResponse, Response, StreamingResponse
 from loguru import logger
 
 from app.config import config
@@ -28,6 +29,7 @@ from app.models.schema import (
 )
 from app.services import state as sm
 from app.services import task as tm
+from app.services import video
 from app.utils import utils
 
 # 认证依赖项
@@ -40,6 +42,8 @@ _redis_port = config.app.get("redis_port", 6379)
 _redis_db = config.app.get("redis_db", 0)
 _redis_password = config.app.get("redis_password", None)
 _max_concurrent_tasks = config.app.get("max_concurrent_tasks", 5)
+# 流式播放正在写入的成片时，等待请求位置写入的最长时间（秒）
+_stream_wait_seconds = config.app.get("stream_wait_seconds", 10)
 
 redis_url = f"redis://:{_redis_password}@{_redis_host}:{_redis_port}/{_redis_db}"
 # 根据配置选择合适的任务管理器
@@ -115,7 +119,7 @@ def get_task(
 
         def file_to_uri(file):
             if not file.startswith(endpoint):
-                _uri_path = v.replace(task_dir, "tasks").replace("\\", "/")
+                _uri_path = file.replace(task_dir, "tasks").replace("\\", "/")
                 _uri_path = f"{endpoint}/{_uri_path}"
             else:
                 _uri_path = file
@@ -133,6 +137,8 @@ def get_task(
             for v in combined_videos:
                 urls.append(file_to_uri(v))
             task["combined_videos"] = urls
+        if "hls_playlists" in task:
+            task["hls_playlists"] = [file_to_uri(v) for v in task["hls_playlists"]]
         return utils.get_response(200, task)
 
     raise HttpException(
@@ -209,22 +215,46 @@ def upload_bgm_file(request: Request, file: UploadFile = File(...)):
 
 @router.get("/stream/{file_path:path}")
 async def stream_video(request: Request, file_path: str):
+    request_id = base.get_task_id(request)
     tasks_dir = utils.task_dir()
     video_path = os.path.join(tasks_dir, file_path)
     range_header = request.headers.get("Range")
-    video_size = os.path.getsize(video_path)
-    start, end = 0, video_size - 1
-
-    length = video_size
-    if range_header:
-        range_ = range_header.split("bytes=")[1]
-        start, end = [int(part) if part else None for part in range_.split("-")]
-        if start is None:
-            start = video_size - end
-            end = video_size - 1
-        if end is None:
-            end = video_size - 1
-        length = end - start + 1
+    # 成片仍在写入时（fragmented_output 输出分片 MP4）总长度未知，只返回已经写入的部分
+    growing = video.is_rendering(video_path)
+
+    def parse_range(size):
+        start, end = 0, size - 1
+        if range_header:
+            range_ = range_header.split("bytes=")[1]
+            start, end = [int(part) if part else None for part in range_.split("-")]
+            if start is None:
+                start = max(size - end, 0)
+                end = size - 1
+            if end is None or end >= size:
+                end = size - 1
+        return start, end
+
+    video_size = os.path.getsize(video_path) if os.path.exists(video_path) else 0
+    start, end = parse_range(video_size)
+    # 请求的位置还没有写入时，等待文件增长
+    waited = 0.0
+    while growing and start >= video_size and waited < _stream_wait_seconds:
+        await asyncio.sleep(0.5)
+        waited += 0.5
+        growing = video.is_rendering(video_path)
+        video_size = os.path.getsize(video_path) if os.path.exists(video_path) else 0
+        start, end = parse_range(video_size)
+
+    if not growing and not os.path.isfile(video_path):
+        # 文件不存在且没有在渲染，不是范围错误
+        raise HttpException(
+            "", status_code=404, message=f"{request_id}: file not found"
+        )
+
+    total = "*" if growing else str(video_size)
+    if start >= video_size:
+        return Response(status_code=416, headers={"Content-Range": f"bytes */{total}"})
+    length = end - start + 1
 
     def file_iterator(file_path, offset=0, bytes_to_read=None):
         with open(file_path, "rb") as f:
@@ -241,9 +271,11 @@ async def stream_video(request: Request, file_path: str):
     response = StreamingResponse(
         file_iterator(video_path, start, length), media_type="video/mp4"
     )
-    response.headers["Content-Range"] = f"bytes {start}-{end}/{video_size}"
+    response.headers["Content-Range"] = f"bytes {start}-{end}/{total}"
     response.headers["Accept-Ranges"] = "bytes"
     response.headers["Content-Length"] = str(length)
+    if growing:
+        response.headers["Cache-Control"] = "no-store"
     response.status_code = 206  # Partial Content
 
     return response
@@ -1,4 +1,5 @@
 import warnings
+from dataclasses import field
 from enum import Enum
 from typing import Any, List, Optional
 
@@ -33,6 +34,23 @@ class VideoAspect(str, Enum):
         return 1080, 1920
 
 
+class EncoderProfile(str, Enum):
+    draft = "draft"
+    standard = "standard"
+    archive = "archive"
+
+    def to_settings(self) -> dict:
+        """
+        返回编码配置：x264 preset、CRF、输出分辨率缩放比例和音频码率
+        draft 用于快速预览，standard 与 moviepy 默认编码参数一致
+        """
+        if self == EncoderProfile.draft.value:
+            return {"preset": "ultrafast", "crf": 30, "scale": 0.5, "audio_bitrate": "96k"}
+        elif self == EncoderProfile.archive.value:
+            return {"preset": "slow", "crf": 18, "scale": 1.0, "audio_bitrate": "192k"}
+        return {"preset": "medium", "crf": 23, "scale": 1.0, "audio_bitrate": None}
+
+
 class _Config:
     arbitrary_types_allowed = True
 
@@ -44,6 +62,47 @@ class MaterialInfo:
     duration: int = 0
 
 
+@pydantic.dataclasses.dataclass(config=_Config)
+class EditDecision:
+    """
+    剪辑决策列表（EDL）中的一个片段
+    """
+    path: str = ""  # 源视频路径
+    start: float = 0.0  # 入点（秒）
+    end: float = 0.0  # 出点（秒）
+    ost: bool = False  # 是否保留原声
+    width: int = 1080  # 目标画面宽度
+    height: int = 1920  # 目标画面高度
+
+
+@pydantic.dataclasses.dataclass(config=_Config)
+class MediaInfo:
+    """
+    媒体文件的基本信息，由 probe.media_info 读取
+    """
+    path: str = ""
+    duration: float = 0.0  # 时长（秒）
+    width: int = 0  # 显示宽度，已按旋转角度交换宽高
+    height: int = 0  # 显示高度
+    rotation: int = 0  # 显示时的旋转角度（0、90、180、270）
+    fps: float = 0.0
+    video_codec: str = ""
+    has_video: bool = False
+    has_audio: bool = False
+
+
+@pydantic.dataclasses.dataclass(config=_Config)
+class VideoAnalysis:
+    """
+    原视频的本地分析结果，由 analysis.analyze 生成，保存在视频旁的 .analysis.npz 中
+    """
+    path: str = ""
+    duration: float = 0.0  # 时长（秒）
+    shot_boundaries: List[float] = field(default_factory=list)  # 镜头切换时间点（秒）
+    motion: List[float] = field(default_factory=list)  # 每秒画面运动强度，0-1
+    audio_energy: List[float] = field(default_factory=list)  # 每秒音频能量，0-1
+
+
 # VoiceNames = [
 #     # zh-CN
 #     "female-zh-CN-XiaoxiaoNeural",
@@ -119,6 +178,7 @@ class VideoParams(BaseModel):
 
     subtitle_enabled: Optional[bool] = True
     subtitle_position: Optional[str] = "bottom"  # top, bottom, center
+    subtitle_renderer: Optional[str] = "textclip"  # textclip, ass, pillow
     custom_position: float = 70.0
     font_name: Optional[str] = "STHeitiMedium.ttc"
     text_fore_color: Optional[str] = "#FFFFFF"
@@ -127,6 +187,7 @@ class VideoParams(BaseModel):
     font_size: int = 60
     stroke_color: Optional[str] = "#000000"
     stroke_width: float = 1.5
+    encoder_profile: Optional[EncoderProfile] = EncoderProfile.standard.value  # draft, standard, archive
     n_threads: Optional[int] = 2
     paragraph_number: Optional[int] = 1
 
@@ -355,6 +416,7 @@ class VideoClipParams(BaseModel):
 
     subtitle_enabled: Optional[bool] = Field(default=True, description="是否启用字幕")
     subtitle_position: Optional[str] = Field(default="bottom", description="字幕位置")  # top, bottom, center
+    subtitle_renderer: Optional[str] = Field(default="textclip", description="字幕渲染方式")  # textclip, ass, pillow
     font_name: Optional[str] = Field(default="STHeitiMedium.ttc", description="字体名称")
     text_fore_color: Optional[str] = Field(default="#FFFFFF", description="文字前景色")
     text_background_color: Optional[str] = Field(default="transparent", description="文字背景色")
@@ -364,4 +426,10 @@ class VideoClipParams(BaseModel):
     stroke_width: float = Field(default=1.5, description="文字描边宽度")
     custom_position: float = Field(default=70.0, description="自定义位置")
 
+    save_combined_video: Optional[bool] = Field(default=False, description="是否保存中间合并视频 combined.mp4")
+
+    encoder_profile: Optional[EncoderProfile] = Field(default=EncoderProfile.standard.value, description="编码配置")  # draft, standard, archive
+    render_workers: Optional[int] = Field(default=None, description="最终视频并行渲染的进程数，大于 1 时按时间分段并行渲染，为空时使用 app.render_workers 配置")
+    render_backend: Optional[str] = Field(default="moviepy", description="最终视频的渲染后端，ffmpeg 后端将整个剪辑编译为一条滤镜图命令")  # moviepy, ffmpeg
+
     n_threads: Optional[int] = 8    # 线程数，有助于提升视频处理速度
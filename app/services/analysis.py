@@ -0,0 +1,334 @@
+import os
+import json
+import math
+import subprocess
+from typing import List, Optional, Union
+
+import numpy as np
+from loguru import logger
+
+from app.config import config
+from app.models.schema import VideoAnalysis
+from app.services import probe, proxy
+from app.utils import utils, ffmpeg_utils
+
+# 索引格式版本，分析算法变化时递增，旧索引自动失效
+_INDEX_VERSION = 1
+# 分析时的采样帧率和画面宽度，只需要低分辨率画面即可判断镜头切换
+_SAMPLE_FPS = 4
+_SAMPLE_WIDTH = 96
+# 每个通道的直方图分箱数
+_HIST_BINS = 16
+_AUDIO_RATE = 8000
+# 两次镜头切换之间的最小间隔（秒）
+_MIN_SHOT_SECONDS = 0.5
+# 提示词中的镜头列表最多包含的镜头数，长视频按比例合并相邻镜头
+_MAX_PROMPT_SHOTS = 200
+
+
+def index_file(video_path: str) -> str:
+    """
+    分析索引保存在原视频旁边，与视频同名
+    """
+    return f"{os.path.splitext(video_path)[0]}.analysis.npz"
+
+
+def _stat_key(video_path: str) -> np.ndarray:
+    stat = os.stat(video_path)
+    return np.array([_INDEX_VERSION, stat.st_mtime_ns, stat.st_size], dtype=np.int64)
+
+
+def load(video_path: str) -> Optional[VideoAnalysis]:
+    """
+    读取分析索引，索引不存在或原视频已变化时返回 None
+    """
+    path = index_file(video_path)
+    if not os.path.isfile(path):
+        return None
+    try:
+        with np.load(path) as data:
+            if not np.array_equal(data["key"], _stat_key(video_path)):
+                return None
+            return VideoAnalysis(
+                path=video_path,
+                duration=float(data["duration"]),
+                shot_boundaries=data["shot_boundaries"].tolist(),
+                motion=data["motion"].tolist(),
+                audio_energy=data["audio_energy"].tolist(),
+            )
+    except Exception as e:
+        logger.warning(f"读取分析索引失败: {path} => {str(e)}")
+        return None
+
+
+def _video_features(video_path: str, width: int, height: int):
+    """
+    解码低分辨率画面，逐批计算相邻帧的直方图差异和像素差异
+    Returns:
+        (hist_diff, pixel_diff)，第 i 个元素为第 i 帧与前一帧的差异，第 0 帧为 0
+    """
+    frame_size = width * height * 3
+    cmd = [
+        ffmpeg_utils.ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error",
+        "-i", video_path,
+        "-an",
+        "-vf", f"fps={_SAMPLE_FPS},scale={width}:{height}:flags=area",
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-",
+    ]
+    hist_diffs, pixel_diffs = [np.zeros(1, dtype=np.float32)], [np.zeros(1, dtype=np.float32)]
+    prev_hist, prev_gray = None, None
+    # 每个通道的分箱加上偏移，三个通道的直方图可以用一次 bincount 计算
+    offsets = np.arange(3, dtype=np.int64) * _HIST_BINS
+    batch = 256
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        while True:
+            data = process.stdout.read(frame_size * batch)
+            count = len(data) // frame_size
+            if count == 0:
+                break
+            frames = np.frombuffer(data[:count * frame_size], dtype=np.uint8).reshape(count, height * width, 3)
+            bins = (frames >> 4).astype(np.int64) + offsets
+            bins += (np.arange(count, dtype=np.int64) * 3 * _HIST_BINS)[:, None, None]
+            hist = np.bincount(bins.ravel(), minlength=count * 3 * _HIST_BINS).reshape(count, 3 * _HIST_BINS)
+            hist = hist.astype(np.float32) / (height * width)
+            gray = frames.mean(axis=2, dtype=np.float32)
+
+            if prev_hist is not None:
+                hist = np.concatenate([prev_hist, hist])
+                gray = np.concatenate([prev_gray, gray])
+            # 每个通道的直方图总和为 1，差异的一半除以通道数后位于 0-1
+            hist_diffs.append(np.abs(np.diff(hist, axis=0)).sum(axis=1) / 6)
+            pixel_diffs.append(np.abs(np.diff(gray, axis=0)).mean(axis=1) / 255)
+            prev_hist, prev_gray = hist[-1:], gray[-1:]
+    hist_diff = np.concatenate(hist_diffs)
+    pixel_diff = np.concatenate(pixel_diffs)
+    if prev_hist is None:
+        return hist_diff[:0], pixel_diff[:0]
+    return hist_diff, pixel_diff
+
+
+def _audio_energy(video_path: str, seconds: int) -> np.ndarray:
+    """
+    计算每秒音频的 RMS 能量，按 -60dB 到 0dB 映射到 0-1
+    """
+    cmd = [
+        ffmpeg_utils.ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error",
+        "-i", video_path,
+        "-vn", "-ac", "1", "-ar", str(_AUDIO_RATE),
+        "-f", "s16le", "-",
+    ]
+    energy = []
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE, stderr=subprocess.DEVNULL) as process:
+        while True:
+            data = process.stdout.read(_AUDIO_RATE * 2)
+            if len(data) < 2:
+                break
+            samples = np.frombuffer(data[:len(data) // 2 * 2], dtype=np.int16).astype(np.float32) / 32768
+            rms = math.sqrt(float(np.mean(samples * samples)))
+            energy.append(max(20 * math.log10(max(rms, 1e-6)) + 60, 0) / 60)
+    energy = np.asarray(energy, dtype=np.float32)[:seconds]
+    return np.pad(energy, (0, max(seconds - len(energy), 0)))
+
+
+def _shot_boundaries(hist_diff: np.ndarray, pixel_diff: np.ndarray) -> np.ndarray:
+    """
+    直方图和像素差异同时突变、且为局部最大值的位置视为镜头切换；
+    阈值取固定下限与 中位数 + 6 倍 MAD 中的较大者，以适应整体运动较多的视频
+    """
+    if len(hist_diff) < 2:
+        return np.zeros(0, dtype=np.float32)
+    score = 0.7 * hist_diff + 0.3 * pixel_diff
+    median = float(np.median(score))
+    mad = float(np.median(np.abs(score - median)))
+    threshold = max(float(config.app.get("shot_threshold", 0.25)), median + 6 * mad)
+    padded = np.pad(score, 1)
+    peaks = (score > threshold) & (score >= padded[:-2]) & (score >= padded[2:])
+    boundaries = []
+    for index in np.flatnonzero(peaks):
+        t = index / _SAMPLE_FPS
+        if t <= 0:
+            continue
+        if boundaries and t - boundaries[-1] < _MIN_SHOT_SECONDS:
+            continue
+        boundaries.append(t)
+    return np.asarray(boundaries, dtype=np.float32)
+
+
+def analyze(video_path: str, force: bool = False) -> VideoAnalysis:
+    """
+    分析原视频：镜头切换点、每秒画面运动强度和音频能量
+    开启代理时解码低分辨率的代理视频（时间轴与原视频一致），结果以 numpy 索引保存在原视频旁边，原视频未变化时直接读取
+    Args:
+        video_path: 原视频路径
+        force: 是否忽略已有索引重新分析
+
+    Returns:
+        VideoAnalysis
+    """
+    if not force:
+        cached = load(video_path)
+        if cached:
+            return cached
+
+    duration = probe.media_info(video_path).duration
+    source = proxy.preview_source(video_path)
+    info = probe.media_info(source)
+    width = _SAMPLE_WIDTH
+    height = max(int(round(width * info.height / info.width / 2)) * 2, 2) if info.width else width
+    seconds = max(int(math.ceil(duration)), 0)
+
+    hist_diff, pixel_diff = _video_features(source, width, height)
+    boundaries = _shot_boundaries(hist_diff, pixel_diff)
+
+    # 每秒的平均像素差异作为运动强度，镜头切换帧不计入
+    motion_diff = pixel_diff.copy()
+    cut_frames = np.round(boundaries * _SAMPLE_FPS).astype(np.int64)
+    motion_diff[cut_frames[cut_frames < len(motion_diff)]] = 0
+    motion = np.zeros(seconds, dtype=np.float32)
+    if len(motion_diff):
+        second_index = np.minimum(np.arange(len(motion_diff)) // _SAMPLE_FPS, max(seconds - 1, 0))
+        sums = np.bincount(second_index, weights=motion_diff, minlength=seconds)[:seconds]
+        counts = np.bincount(second_index, minlength=seconds)[:seconds]
+        motion = (sums / np.maximum(counts, 1)).astype(np.float32)
+        if motion.max() > 0:
+            motion /= motion.max()
+
+    audio_energy = _audio_energy(source, seconds) if info.has_audio else np.zeros(seconds, dtype=np.float32)
+
+    path = index_file(video_path)
+    with ffmpeg_utils.atomic_output(path) as tmp_file:
+        np.savez_compressed(
+            tmp_file,
+            key=_stat_key(video_path),
+            duration=np.float64(duration),
+            shot_boundaries=boundaries,
+            motion=motion.astype(np.float16),
+            audio_energy=audio_energy.astype(np.float16),
+        )
+    logger.info(f"视频分析完成: {video_path}, 镜头 {len(boundaries) + 1} 个, 索引: {path}")
+    return load(video_path)
+
+
+def _format_time(seconds: float, parts: int = 2) -> str:
+    seconds = int(round(seconds))
+    if parts == 3:
+        return f"{seconds // 3600:02d}:{seconds % 3600 // 60:02d}:{seconds % 60:02d}"
+    return f"{seconds // 60:02d}:{seconds % 60:02d}"
+
+
+def snap_timestamp(timestamp: str, result: VideoAnalysis, tolerance: float = 1.5) -> str:
+    """
+    将时间段的起止时间吸附到附近的镜头切换点，避免片段开头或结尾带上相邻镜头的几帧
+    Args:
+        timestamp: 时间段，如 '00:36-00:40'
+        result: 分析结果
+        tolerance: 吸附的最大距离（秒）
+
+    Returns:
+        吸附后的时间段，格式与输入一致
+    """
+    start, end = timestamp.split("-")
+    parts = len(start.split(":"))
+    start_time, end_time = utils.time_to_seconds(start), utils.time_to_seconds(end)
+    boundaries = np.asarray(result.shot_boundaries, dtype=np.float64)
+
+    def nearest(t):
+        if not len(boundaries):
+            return t
+        index = int(np.argmin(np.abs(boundaries - t)))
+        return float(boundaries[index]) if abs(boundaries[index] - t) <= tolerance else t
+
+    # 时间戳精确到秒：起点向后取整、终点向前取整，保证片段落在镜头内部
+    new_start = math.ceil(nearest(start_time) - 1e-3)
+    new_end = math.floor(nearest(end_time) + 1e-3)
+    if new_end - new_start < 1:
+        return timestamp
+    return f"{_format_time(new_start, parts)}-{_format_time(new_end, parts)}"
+
+
+def snap_script(script: Union[str, list], result: VideoAnalysis) -> Union[str, list]:
+    """
+    将脚本中每个片段的 timestamp 吸附到镜头切换点
+    Args:
+        script: 脚本 JSON 字符串或列表
+        result: 分析结果
+
+    Returns:
+        与输入类型一致的脚本，无法解析时原样返回
+    """
+    items = script
+    if isinstance(script, str):
+        try:
+            items = json.loads(utils.clean_model_output(script))
+        except Exception:
+            return script
+    for item in items:
+        try:
+            item["timestamp"] = snap_timestamp(item["timestamp"], result)
+        except Exception:
+            continue
+    if isinstance(script, str):
+        return json.dumps(items, ensure_ascii=False, indent=4)
+    return items
+
+
+def highlights(result: VideoAnalysis, duration: int = 20, count: int = 1) -> List[str]:
+    """
+    选出最精彩的若干个不重叠片段：窗口内的运动强度、音频能量和镜头切换密度综合得分最高
+    起止时间吸附到镜头切换点
+    Args:
+        result: 分析结果
+        duration: 片段时长（秒）
+        count: 片段数量
+
+    Returns:
+        时间段列表，如 ['01:20-01:40']
+    """
+    seconds = len(result.motion)
+    if seconds == 0:
+        return []
+    duration = min(duration, seconds)
+    cuts = np.bincount(
+        np.minimum(np.asarray(result.shot_boundaries, dtype=np.int64), seconds - 1), minlength=seconds
+    ).astype(np.float32)
+    score = (
+        np.asarray(result.motion, dtype=np.float32)
+        + np.asarray(result.audio_energy, dtype=np.float32)
+        + 0.5 * np.minimum(cuts, 1)
+    )
+    window = np.convolve(score, np.ones(duration, dtype=np.float32), mode="valid")
+    picked = []
+    for start in np.argsort(-window, kind="stable"):
+        if len(picked) >= count:
+            break
+        if any(abs(int(start) - p) < duration for p in picked):
+            continue
+        picked.append(int(start))
+    return [
+        snap_timestamp(f"{_format_time(start)}-{_format_time(start + duration)}", result)
+        for start in sorted(picked)
+    ]
+
+
+def shot_list(result: VideoAnalysis, per_minute: int = None) -> str:
+    """
+    生成紧凑的镜头列表文本，可作为提示词的一部分发送给大模型
+    相邻的短镜头合并为一段，每分钟最多 per_minute 段（默认通过 config.toml 中的 prompt_shots_per_minute 设置），
+    总数不超过 _MAX_PROMPT_SHOTS，长视频的提示词不会随镜头数量无限增长
+    """
+    if per_minute is None:
+        per_minute = int(config.app.get("prompt_shots_per_minute", 6))
+    min_length = max(60 / max(per_minute, 1), result.duration / _MAX_PROMPT_SHOTS, 1)
+
+    edges = [0.0]
+    for boundary in result.shot_boundaries:
+        if boundary - edges[-1] >= min_length:
+            edges.append(boundary)
+    # 最后一段不足 min_length 时并入前一段
+    if len(edges) > 1 and result.duration - edges[-1] < min_length:
+        edges.pop()
+    edges.append(result.duration)
+    return ", ".join(
+        f"{_format_time(start)}-{_format_time(end)}"
+        for start, end in zip(edges[:-1], edges[1:])
+    )
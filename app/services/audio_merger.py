@@ -6,7 +6,7 @@ from edge_tts import submaker
 from pydub import AudioSegment
 from typing import List, Dict
 from loguru import logger
-from app.utils import utils
+from app.services import scratch
 
 
 def check_ffmpeg():
@@ -26,7 +26,8 @@ def merge_audio_files(task_id: str, audio_file_paths: List[str], total_duration:
     :param total_duration: 最终音频文件的总时长（秒）
     :param video_script: JSON格式的视频脚本
     """
-    output_dir = utils.task_dir(task_id)
+    # 合并后的音频只在渲染时使用，写入任务的中间文件目录
+    output_dir = scratch.task_dir(task_id)
 
     if not check_ffmpeg():
         logger.error("错误：FFmpeg未安装。请安装FFmpeg后再运行此脚本。")
@@ -0,0 +1,193 @@
+import os
+import time
+import hashlib
+import threading
+from typing import Callable
+
+from loguru import logger
+
+from app.config import config
+from app.utils import utils, ffmpeg_utils
+
+# 源视频指纹只读取文件头、中间和尾部的数据块，避免对数 GB 的电影做全量哈希
+_SAMPLE_SIZE = 4 * 1024 * 1024
+# 锁文件记录持有者的主机名和 PID，持有进程已退出时锁立即失效；
+# 无法确认持有者（其他主机、锁文件内容不完整）时，超过该时间仍未完成的锁视为遗留的锁
+_STALE_LOCK_SECONDS = 600
+_LOCK_POLL_SECONDS = 0.5
+
+_fingerprints = {}
+_fingerprints_lock = threading.Lock()
+_quota_lock = threading.Lock()
+
+
+def cache_dir(save_dir: str = "") -> str:
+    """
+    片段缓存目录，未指定时为 storage/cache_videos
+    """
+    d = save_dir or utils.storage_dir("cache_videos")
+    os.makedirs(d, exist_ok=True)
+    return d
+
+
+def source_fingerprint(path: str) -> str:
+    """
+    计算源视频的内容指纹：文件大小加上头、中、尾三个数据块的哈希
+    同一进程内按 (路径, 修改时间, 大小) 缓存
+    """
+    stat = os.stat(path)
+    key = (os.path.abspath(path), stat.st_mtime_ns, stat.st_size)
+    with _fingerprints_lock:
+        fingerprint = _fingerprints.get(key)
+    if fingerprint:
+        return fingerprint
+
+    sha1 = hashlib.sha1(str(stat.st_size).encode("utf-8"))
+    with open(path, "rb") as f:
+        for offset in sorted({0, max(stat.st_size // 2 - _SAMPLE_SIZE // 2, 0), max(stat.st_size - _SAMPLE_SIZE, 0)}):
+            f.seek(offset)
+            sha1.update(f.read(_SAMPLE_SIZE))
+    fingerprint = sha1.hexdigest()
+    with _fingerprints_lock:
+        _fingerprints[key] = fingerprint
+    return fingerprint
+
+
+def clip_key(origin_video: str, timestamp: str, **encode_params) -> str:
+    """
+    生成片段缓存键：源视频内容指纹 + 时间段 + 编码参数
+    """
+    params = ",".join(f"{k}={encode_params[k]}" for k in sorted(encode_params))
+    raw = f"{source_fingerprint(origin_video)}|{timestamp}|{params}"
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def _acquire(lock_file: str) -> bool:
+    try:
+        fd = os.open(lock_file, os.O_CREAT | os.O_EXCL | os.O_WRONLY)
+    except FileExistsError:
+        return False
+    with os.fdopen(fd, "w") as f:
+        f.write(f"{os.getpid()}\n{config.hostname}\n")
+    return True
+
+
+def _pid_alive(pid: int) -> bool:
+    if os.name == "nt":
+        # Windows 上 os.kill 会直接结束进程，改为查询进程的退出码
+        import ctypes
+
+        kernel32 = ctypes.windll.kernel32
+        handle = kernel32.OpenProcess(0x1000, False, pid)  # PROCESS_QUERY_LIMITED_INFORMATION
+        if not handle:
+            return False
+        exit_code = ctypes.c_ulong()
+        kernel32.GetExitCodeProcess(handle, ctypes.byref(exit_code))
+        kernel32.CloseHandle(handle)
+        return exit_code.value == 259  # STILL_ACTIVE
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        # 进程存在，但属于其他用户
+        return True
+    return True
+
+
+def _lock_is_stale(lock_file: str) -> bool:
+    try:
+        with open(lock_file, "r", encoding="utf-8") as f:
+            pid, _, hostname = f.read().strip().partition("\n")
+        if pid.isdigit() and hostname == config.hostname:
+            return not _pid_alive(int(pid))
+        return time.time() - os.path.getmtime(lock_file) > _STALE_LOCK_SECONDS
+    except FileNotFoundError:
+        return False
+
+
+def get_or_create(key: str, create: Callable[[str], None], save_dir: str = "") -> str:
+    """
+    获取缓存的片段，不存在时调用 create 生成
+    多个线程或进程同时请求同一片段时，只有获得锁的一方执行 create，其余等待其完成后直接复用
+    Args:
+        key: 缓存键，参见 clip_key
+        create: 生成函数，参数为临时文件路径，生成完成后原子地重命名为缓存文件
+        save_dir: 缓存目录
+
+    Returns:
+        缓存文件路径
+    """
+    directory = cache_dir(save_dir)
+    video_path = os.path.join(directory, f"clip-{key}.mp4")
+    lock_file = f"{video_path}.lock"
+
+    while True:
+        if os.path.isfile(video_path) and os.path.getsize(video_path) > 0:
+            # 更新修改时间，作为 LRU 淘汰的依据
+            os.utime(video_path)
+            logger.info(f"video already exists: {video_path}")
+            return video_path
+        if _acquire(lock_file):
+            break
+        if _lock_is_stale(lock_file):
+            logger.warning(f"清理过期的缓存锁: {lock_file}")
+            try:
+                os.remove(lock_file)
+            except FileNotFoundError:
+                pass
+            continue
+        time.sleep(_LOCK_POLL_SECONDS)
+
+    try:
+        with ffmpeg_utils.atomic_output(video_path) as tmp_file:
+            create(tmp_file)
+    finally:
+        os.remove(lock_file)
+
+    enforce_quota(directory)
+    return video_path
+
+
+def enforce_quota(save_dir: str = "", max_bytes: int = None, prefix: str = "clip-", suffix: str = ".mp4"):
+    """
+    按最近使用时间淘汰缓存文件，使目录总大小不超过配额
+    配额默认通过 config.toml 中的 clip_cache_max_gb 设置，0 表示不限制
+    Args:
+        save_dir: 缓存目录
+        max_bytes: 配额（字节）
+        prefix: 缓存文件名前缀，只淘汰匹配的文件
+        suffix: 缓存文件扩展名
+    """
+    if max_bytes is None:
+        max_bytes = int(float(config.app.get("clip_cache_max_gb", 20)) * 1024 ** 3)
+    if max_bytes <= 0:
+        return
+
+    directory = cache_dir(save_dir)
+    with _quota_lock:
+        entries = []
+        for name in os.listdir(directory):
+            if not (name.startswith(prefix) and name.endswith(suffix)) or name.endswith(f".tmp{suffix}"):
+                continue
+            path = os.path.join(directory, name)
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= max_bytes:
+                break
+            if os.path.exists(f"{path}.lock"):
+                continue
+            try:
+                os.remove(path)
+                total -= size
+                logger.info(f"淘汰缓存文件: {path}")
+            except FileNotFoundError:
+                total -= size
+            except Exception as e:
+                logger.warning(f"淘汰缓存文件失败: {path} => {str(e)}")
@@ -0,0 +1,104 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Dict
+
+from loguru import logger
+
+from app.config import config
+from app.services import state as sm
+
+
+class CpuBudget:
+    """
+    节点级 CPU 预算
+    运行中的任务平分 cpu_budget 个线程，作为各自的编码线程数、whisper 线程数、并行裁剪数和并行渲染进程数；
+    任务开始和结束时重新分配，分配结果写入任务状态的 cpu_grant 字段
+    """
+
+    def __init__(self, total: int = None, min_threads: int = None):
+        self.total = max(int(total or config.app.get("cpu_budget", 0) or os.cpu_count() or 1), 1)
+        self.min_threads = max(int(min_threads or config.app.get("cpu_min_threads_per_task", 1)), 1)
+        self._tasks = []
+        self._grants = {}
+        self._lock = threading.Lock()
+
+    def max_tasks(self) -> int:
+        """
+        每个任务至少分到 min_threads 个线程时，最多可以同时运行的任务数
+        """
+        return max(self.total // self.min_threads, 1)
+
+    def _share(self, index: int, count: int) -> Dict[str, int]:
+        # 余数分给先开始的任务
+        threads = max(self.total // count + (1 if index < self.total % count else 0), 1)
+        return {
+            "encoder_threads": threads,
+            "whisper_threads": threads,
+            "clip_workers": max(min(threads, int(config.app.get("clip_workers", 4))), 1),
+            "render_workers": max(min(threads, int(config.app.get("render_workers", 1))), 1),
+        }
+
+    def _rebalance(self):
+        count = len(self._tasks)
+        self._grants = {task_id: self._share(index, count) for index, task_id in enumerate(self._tasks)}
+        for task_id, grant in self._grants.items():
+            try:
+                sm.state.update_fields(task_id, cpu_grant=grant)
+            except Exception as e:
+                logger.warning(f"写入线程分配失败: {task_id} => {str(e)}")
+        if count:
+            logger.info(f"重新分配 CPU 预算: {self.total} 线程, {count} 个任务")
+
+    def acquire(self, task_id: str):
+        with self._lock:
+            if task_id in self._tasks:
+                return
+            self._tasks.append(task_id)
+            self._rebalance()
+
+    def release(self, task_id: str):
+        with self._lock:
+            if task_id not in self._tasks:
+                return
+            self._tasks.remove(task_id)
+            self._rebalance()
+
+    @contextmanager
+    def task(self, task_id: str):
+        """
+        任务运行期间占用预算，结束（包括失败）后归还
+        """
+        if not task_id:
+            yield
+            return
+        self.acquire(task_id)
+        try:
+            yield
+        finally:
+            self.release(task_id)
+
+    def grant(self, task_id: str) -> Dict[str, int]:
+        """
+        任务当前分到的线程数，未登记的任务（如 webui 中直接调用）按新增一个任务计算
+        """
+        with self._lock:
+            grant = self._grants.get(task_id)
+            if grant is None:
+                grant = self._share(len(self._tasks), len(self._tasks) + 1)
+            return dict(grant)
+
+    def apply(self, task_id: str, params):
+        """
+        将编码线程数和并行渲染进程数写入任务参数，每个渲染阶段开始前调用，使用最新的分配结果
+        参数中已指定的并行渲染进程数同样不超过分到的线程数
+        """
+        grant = self.grant(task_id)
+        params.n_threads = grant["encoder_threads"]
+        if hasattr(params, "render_workers"):
+            params.render_workers = min(params.render_workers or grant["render_workers"], grant["encoder_threads"])
+        return params
+
+
+# Global budget
+budget = CpuBudget()
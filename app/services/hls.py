@@ -0,0 +1,116 @@
+import os
+import shutil
+from typing import List
+
+from loguru import logger
+
+from app.config import config
+from app.services import probe
+from app.utils import ffmpeg_utils
+
+# 各档位（画面短边像素）对应的视频和音频码率
+_LADDER = {
+    1080: ("5000k", "192k"),
+    720: ("2800k", "128k"),
+    480: ("1200k", "96k"),
+    360: ("800k", "64k"),
+}
+# 每个分片的时长（秒），关键帧按该间隔对齐，各档位可以在分片边界无缝切换
+_SEGMENT_SECONDS = 4
+
+
+def _renditions(width: int, height: int) -> List[tuple]:
+    """
+    根据源视频尺寸计算各档位的输出尺寸，不生成比源视频更大的档位
+    Returns:
+        [(名称, 宽, 高, 视频码率, 音频码率)]
+    """
+    short_side = min(width, height)
+    levels = [int(level) for level in config.app.get("hls_renditions", [1080, 720, 480]) if int(level) in _LADDER]
+    levels = sorted({min(level, short_side) for level in levels}, reverse=True)
+    renditions = []
+    for level in levels:
+        scale = level / short_side
+        w = ffmpeg_utils.even(round(width * scale))
+        h = ffmpeg_utils.even(round(height * scale))
+        bitrate = _LADDER.get(level) or next(v for k, v in sorted(_LADDER.items()) if k >= level)
+        renditions.append((f"{level}p", w, h, *bitrate))
+    return renditions
+
+
+def package_video(video_file: str, output_dir: str = "") -> str:
+    """
+    将成片打包为多码率 HLS（fMP4 分片）
+    只解码一次，通过 split 滤镜分发给各档位的编码器
+    Args:
+        video_file: 成片路径
+        output_dir: 输出目录，默认为成片所在目录下的 hls/<文件名>
+
+    Returns:
+        主播放列表 master.m3u8 的路径
+    """
+    info = probe.media_info(video_file)
+    if not info.has_video or not info.width or not info.height:
+        raise ValueError(f"无效的视频文件: {video_file}")
+    if not output_dir:
+        name = os.path.splitext(os.path.basename(video_file))[0]
+        output_dir = os.path.join(os.path.dirname(video_file), "hls", name)
+    # 清理上一次打包的结果，避免残留旧分片
+    shutil.rmtree(output_dir, ignore_errors=True)
+    os.makedirs(output_dir, exist_ok=True)
+
+    renditions = _renditions(info.width, info.height)
+    labels = [f"s{i}" for i in range(len(renditions))]
+    filters = [f"[0:v]split={len(renditions)}{''.join(f'[{label}]' for label in labels)}"]
+    for i, (_, w, h, _, _) in enumerate(renditions):
+        filters.append(f"[{labels[i]}]scale={w}:{h}[v{i}]")
+
+    args = ["-i", video_file, "-filter_complex", ";".join(filters)]
+    stream_map = []
+    for i, (name, _, _, video_bitrate, audio_bitrate) in enumerate(renditions):
+        args += ["-map", f"[v{i}]"]
+        args += [f"-b:v:{i}", video_bitrate, f"-maxrate:v:{i}", video_bitrate, f"-bufsize:v:{i}", video_bitrate]
+        if info.has_audio:
+            args += ["-map", "0:a:0", f"-b:a:{i}", audio_bitrate]
+            stream_map.append(f"v:{i},a:{i},name:{name}")
+        else:
+            stream_map.append(f"v:{i},name:{name}")
+
+    args += [
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-pix_fmt", "yuv420p",
+        "-force_key_frames", f"expr:gte(t,n_forced*{_SEGMENT_SECONDS})",
+    ]
+    if info.has_audio:
+        args += ["-c:a", "aac"]
+    args += [
+        "-f", "hls",
+        "-hls_time", str(_SEGMENT_SECONDS),
+        "-hls_playlist_type", "vod",
+        "-hls_segment_type", "fmp4",
+        "-hls_fmp4_init_filename", "init.mp4",
+        "-hls_segment_filename", os.path.join(output_dir, "%v", "seg_%03d.m4s"),
+        "-master_pl_name", "master.m3u8",
+        "-var_stream_map", " ".join(stream_map),
+        os.path.join(output_dir, "%v", "index.m3u8"),
+    ]
+    ffmpeg_utils.run_ffmpeg(args)
+    master = os.path.join(output_dir, "master.m3u8")
+    logger.info(f"HLS 打包完成: {video_file} => {master}, 档位: {', '.join(r[0] for r in renditions)}")
+    return master
+
+
+def package_videos(video_files: List[str]) -> List[str]:
+    """
+    逐个打包成片，打包失败的成片跳过
+    Returns:
+        主播放列表路径
+    """
+    playlists = []
+    for video_file in video_files:
+        try:
+            playlists.append(package_video(video_file))
+        except Exception as e:
+            logger.error(f"HLS 打包失败: {video_file} => {ffmpeg_utils.ffmpeg_error_text(e)}")
+    return playlists
@@ -0,0 +1,130 @@
+import os
+import hashlib
+from concurrent.futures import ThreadPoolExecutor
+from typing import List
+
+import cv2
+import numpy as np
+from loguru import logger
+from moviepy.video.io.ffmpeg_writer import FFMPEG_VideoWriter
+from PIL import Image
+
+from app.utils import utils, ffmpeg_utils
+
+# 每秒放大的比例，4 秒的图片素材从 100% 放大到 112%
+ZOOM_PER_SECOND = 0.03
+
+
+def _file_hash(path: str) -> str:
+    sha1 = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            sha1.update(chunk)
+    return sha1.hexdigest()
+
+
+def _load_image(image_path: str) -> np.ndarray:
+    with Image.open(image_path) as image:
+        image = image.convert("RGB")
+        width, height = image.size
+        image = image.crop((0, 0, ffmpeg_utils.even(width), ffmpeg_utils.even(height)))
+        return np.asarray(image)
+
+
+def _render_numpy(image_path: str, video_file: str, duration: float, fps: int):
+    """
+    将图片预先放大到最大缩放比例，每帧从中心裁剪对应区域后缩小到原尺寸
+    每帧只做一次区域插值缩小，不再对整张图片重复放大
+    """
+    image = _load_image(image_path)
+    height, width = image.shape[:2]
+    max_zoom = 1 + duration * ZOOM_PER_SECOND
+    big_w, big_h = int(round(width * max_zoom)), int(round(height * max_zoom))
+    big = cv2.resize(image, (big_w, big_h), interpolation=cv2.INTER_CUBIC)
+
+    frames = int(duration * fps)
+    writer = FFMPEG_VideoWriter(video_file, (width, height), fps, threads=1)
+    try:
+        for index in range(frames):
+            zoom = 1 + ZOOM_PER_SECOND * index / fps
+            # 放大 zoom 倍后可见区域在原图中的大小，换算到预放大的图片上
+            crop_w = min(big_w, width * max_zoom / zoom)
+            crop_h = min(big_h, height * max_zoom / zoom)
+            x = (big_w - crop_w) / 2
+            y = (big_h - crop_h) / 2
+            crop = big[int(y):int(round(y + crop_h)), int(x):int(round(x + crop_w))]
+            frame = cv2.resize(crop, (width, height), interpolation=cv2.INTER_AREA)
+            writer.write_frame(frame)
+    finally:
+        writer.close()
+
+
+def _render_zoompan(image_path: str, video_file: str, duration: float, fps: int):
+    """
+    使用 ffmpeg zoompan 滤镜生成缩放视频
+    zoompan 的裁剪坐标为整数，先放大 4 倍再计算可以避免画面抖动
+    """
+    with Image.open(image_path) as image:
+        width, height = image.size
+    width, height = ffmpeg_utils.even(width), ffmpeg_utils.even(height)
+    frames = int(duration * fps)
+    zoom = f"1+{duration * ZOOM_PER_SECOND:.6f}*on/{frames}"
+    ffmpeg_utils.run_ffmpeg([
+        "-i", image_path,
+        "-vf",
+        f"scale={width * 4}:{height * 4}:flags=bicubic,"
+        f"zoompan=z='{zoom}':x='iw/2-(iw/zoom/2)':y='ih/2-(ih/zoom/2)':d={frames}:s={width}x{height}:fps={fps},"
+        f"setsar=1,format=yuv420p",
+        "-frames:v", str(frames),
+        "-c:v", "libx264",
+        video_file,
+    ])
+
+
+def image_to_video(image_path: str, duration: float, fps: int = 30, method: str = "numpy") -> str:
+    """
+    将图片转换为带缓慢放大效果的视频
+    结果按 (图片内容哈希, 时长, 帧率, 生成方式) 缓存在 storage/cache_images 中，同一图片重复使用时直接返回
+    Args:
+        image_path: 图片路径
+        duration: 视频时长（秒）
+        fps: 帧率
+        method: numpy（预放大后逐帧裁剪）或 zoompan（ffmpeg 滤镜）
+
+    Returns:
+        视频文件路径
+    """
+    key = hashlib.sha1(
+        repr((_file_hash(image_path), duration, fps, ZOOM_PER_SECOND, method)).encode("utf-8")
+    ).hexdigest()
+    video_file = os.path.join(utils.storage_dir("cache_images", create=True), f"{key}.mp4")
+    if os.path.isfile(video_file):
+        logger.info(f"使用缓存的图片视频: {image_path} => {video_file}")
+        return video_file
+
+    with ffmpeg_utils.atomic_output(video_file) as tmp_file:
+        if method == "zoompan":
+            _render_zoompan(image_path, tmp_file, duration, fps)
+        else:
+            _render_numpy(image_path, tmp_file, duration, fps)
+    return video_file
+
+
+def images_to_videos(image_paths: List[str], duration: float, fps: int = 30, method: str = "numpy") -> List[str]:
+    """
+    并行将多张图片转换为视频，返回与输入顺序一致的视频路径，转换失败的图片返回空字符串
+    """
+    def convert(image_path):
+        try:
+            video_file = image_to_video(image_path, duration, fps=fps, method=method)
+            logger.success(f"completed: {image_path} => {video_file}")
+            return video_file
+        except Exception as e:
+            logger.error(f"failed to convert image: {image_path} => {str(e)}")
+            return ""
+
+    if not image_paths:
+        return []
+    workers = min(len(image_paths), os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        return list(executor.map(convert, image_paths))
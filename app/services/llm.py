@@ -16,6 +16,8 @@ from google.generativeai.types import *
 import subprocess
 
 from app.config import config
+from app.models.schema import VideoAnalysis
+from app.services import analysis, proxy
 from app.utils.utils import clean_model_output
 
 _max_retries = 5
@@ -428,7 +430,8 @@ def generate_script(
     try:
         # 1. 压缩视频
         compressed_video_path = f"{os.path.splitext(video_path)[0]}_compressed.mp4"
-        compress_video(video_path, compressed_video_path)
+        # 开启代理时从低分辨率代理视频压缩，解码更快
+        compress_video(proxy.preview_source(video_path), compressed_video_path)
 
         # 在关键步骤更新进度
         if progress_callback:
@@ -454,7 +457,16 @@ def generate_script(
 
         # 4. 文案匹配画面
         if transcription != "":
-            matched_script = screen_matching(huamian=transcription, wenan=script, llm_provider=config.app["video_llm_provider"])
+            # 本地分析原视频的镜头切换和精彩片段，用于提示大模型并校正其给出的时间戳
+            video_analysis = analysis.analyze(video_path) if config.app.get("video_analysis", False) else None
+            matched_script = screen_matching(
+                huamian=transcription,
+                wenan=script,
+                llm_provider=config.app["video_llm_provider"],
+                video_analysis=video_analysis,
+            )
+            if video_analysis and matched_script:
+                matched_script = analysis.snap_script(matched_script, video_analysis)
             # 在关键步骤更新进度
             if progress_callback:
                 progress_callback(80, "匹配成功")
@@ -726,9 +738,14 @@ def writing_short_play(video_plot: str, video_name: str, llm_provider: str, coun
         return handle_exception(err)
 
 
-def screen_matching(huamian: str, wenan: str, llm_provider: str):
+def screen_matching(huamian: str, wenan: str, llm_provider: str, video_analysis: VideoAnalysis = None):
     """
     画面匹配（一次性匹配）
+    Args:
+        huamian: 视频转录脚本
+        wenan: 解说文案
+        llm_provider: 大模型提供商
+        video_analysis: 原视频的本地分析结果，提供时附带镜头列表和精彩片段候选
     """
     if not huamian:
         raise ValueError("画面不能为空")
@@ -768,6 +785,11 @@ def screen_matching(huamian: str, wenan: str, llm_provider: str):
     - 注意，第一个画面一定是原声播放并且时长不少于 20 s，为了吸引观众，第一段一定是整个转录脚本中最精彩的片段。
     - 请以严格的 JSON 格式返回数据，不要包含任何注释、标记或其他字符。数据应符合 JSON 语法，可以被 json.loads() 函数直接解析， 不要添加 ```json 或其他标记。
     """ % (huamian, wenan)
+    if video_analysis:
+        prompt += """
+    本地分析得到的镜头列表（时间戳尽量与镜头边界对齐）：%s
+    本地分析得到的精彩片段候选（第一段原声可优先从中选择）：%s
+    """ % (analysis.shot_list(video_analysis), ", ".join(analysis.highlights(video_analysis, duration=20, count=3)))
 
     try:
         response = _generate_response(prompt, llm_provider)
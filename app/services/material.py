@@ -1,20 +1,32 @@
 import os
+import bisect
 import subprocess
 import random
 from urllib.parse import urlencode
 
+import numpy as np
 import requests
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing import List
 from loguru import logger
+from moviepy.tools import cvsecs
 from moviepy.video.io.VideoFileClip import VideoFileClip
 
 from app.config import config
-from app.models.schema import VideoAspect, VideoConcatMode, MaterialInfo
-from app.utils import utils
+from app.models.schema import EncoderProfile, VideoAspect, VideoConcatMode, MaterialInfo
+from app.services import clip_cache, mezzanine, probe, scratch
+from app.services.cpu_budget import budget
+from app.utils import utils, ffmpeg_utils
 
 requested_count = 0
 
 
+class InvalidClipError(Exception):
+    """
+    裁剪结果不是有效的视频文件
+    """
+
+
 def get_api_key(cfg_key: str):
     api_keys = config.app.get(cfg_key)
     if not api_keys:
@@ -169,11 +181,8 @@ def save_video(video_url: str, save_dir: str = "") -> str:
 
     if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
         try:
-            clip = VideoFileClip(video_path)
-            duration = clip.duration
-            fps = clip.fps
-            clip.close()
-            if duration > 0 and fps > 0:
+            info = probe.media_info(video_path)
+            if info.duration > 0 and info.fps > 0:
                 return video_path
         except Exception as e:
             try:
@@ -237,6 +246,9 @@ def download_videos(
             if saved_video_path:
                 logger.info(f"video saved: {saved_video_path}")
                 video_paths.append(saved_video_path)
+                if mezzanine.enabled():
+                    # 后台转码为标准化素材，之后的任务可以直接流复制拼接
+                    mezzanine.submit(saved_video_path, video_aspect)
                 seconds = min(max_clip_duration, item.duration)
                 total_duration += seconds
                 if total_duration > audio_duration:
@@ -247,98 +259,300 @@ def download_videos(
         except Exception as e:
             logger.error(f"failed to download video: {utils.to_json(item)} => {str(e)}")
     logger.success(f"downloaded {len(video_paths)} videos")
+    if mezzanine.enabled():
+        video_paths = mezzanine.resolve(video_paths, video_aspect)
     return video_paths
 
 
-def save_clip_video(timestamp: str, origin_video: str, save_dir: str = "") -> dict:
+_VERIFY_SIZE = (64, 36)
+
+
+def _gray_frames(video: str, seek: float = None, frames: int = None) -> np.ndarray:
+    """
+    解码为缩小的灰度帧，用于逐帧比对画面
+    """
+    width, height = _VERIFY_SIZE
+    args = ["-ss", f"{seek:.6f}"] if seek is not None else []
+    args += ["-i", video, "-map", "0:v:0"]
+    if frames is not None:
+        args += ["-frames:v", str(frames)]
+    args += ["-fps_mode", "passthrough", "-vf", f"scale={width}:{height}", "-pix_fmt", "gray", "-f", "rawvideo", "pipe:1"]
+    data = ffmpeg_utils.run_ffmpeg(args).stdout
+    return np.frombuffer(data, np.uint8).reshape(-1, height, width).astype(np.int16)
+
+
+def _verify_cut(origin_video: str, video_path: str, seek: float, frames: int) -> bool:
+    """
+    将剪切结果与原视频直接解码的参考帧逐帧比对：帧数必须一致，
+    每一帧与参考帧的差异不超过轻微的编码损失，或不大于与相邻参考帧的差异（静止画面中错位一帧不影响观感）
+    """
+    output = _gray_frames(video_path)
+    reference = _gray_frames(origin_video, seek, frames)
+    if len(output) != frames or len(reference) != frames:
+        logger.warning(f"智能剪切帧数不一致: 输出 {len(output)} 帧, 预期 {frames} 帧, 参考 {len(reference)} 帧")
+        return False
+    diff = np.abs(output - reference).mean(axis=(1, 2))
+    for index in np.nonzero(diff > 2.0)[0]:
+        neighbors = [
+            np.abs(output[index] - reference[i]).mean() for i in (index - 1, index + 1) if 0 <= i < frames
+        ]
+        if not neighbors or diff[index] > min(neighbors):
+            logger.warning(f"智能剪切画面不一致: 第 {index} 帧, 差异 {diff[index]:.2f}")
+            return False
+    return True
+
+
+def smart_cut_video(origin_video: str, start: float, end: float, video_path: str,
+                    encoder_profile: str = EncoderProfile.standard.value) -> bool:
+    """
+    关键帧感知的智能剪切（实验性）：区间内完整的 GOP 直接流复制，只重新编码区间首尾不完整的 GOP
+    各片段按帧数而不是时间截取，最后重新封装一遍以重建连续的时间戳；
+    剪切结果会与原视频解码出的参考帧逐帧比对，帧数或画面不一致时返回 False，由调用方回退到完整重新编码
+    画面按帧精确裁剪，音轨整段重新编码为 AAC
+    Args:
+        origin_video: 原视频路径
+        start: 开始时间（秒）
+        end: 结束时间（秒）
+        video_path: 输出路径
+        encoder_profile: 首尾重新编码部分使用的编码配置
+
+    Returns:
+        是否剪切成功，不支持（非 H.264 或区间内没有完整 GOP）、失败或校验不通过时返回 False
+    """
+    info = probe.media_info(origin_video)
+    # 重新编码的首尾会被 ffmpeg 自动旋转，流复制的部分保持原始方向，带旋转信息的视频无法拼接
+    if info.video_codec != "h264" or info.fps <= 0 or info.rotation:
+        return False
+    end = min(end, info.duration)
+    times = probe.keyframes(origin_video)
+    inner = times[bisect.bisect_left(times, start):bisect.bisect_right(times, end)]
+    if len(inner) < 2:
+        return False
+
+    fps = info.fps
+    settings = EncoderProfile(encoder_profile).to_settings()
+    # 关键帧时间相对于文件起始时间，第一帧不一定在 0 秒（如 B 帧延迟或带起始偏移的文件），按第一帧对齐帧序号
+    first_frame = times[0]
+
+    def frame_index(t):
+        return int(round((t - first_frame) * fps))
+
+    def seek_to(index):
+        # 解码时 -ss 丢弃时间戳更早的帧，定位到目标帧之前半帧，不受时间戳取整误差影响
+        return max(first_frame + (index - 0.5) / fps, 0)
+
+    # 与完整重新编码一致，从 start 时刻正在显示的帧开始
+    first = max(int(np.floor((start - first_frame) * fps + 1e-3)), 0)
+    total = int(round((end - start) * fps))
+    k1, k2 = frame_index(inner[0]), frame_index(inner[-1])
+    last = first + total
+    if not first <= k1 < k2 <= last:
+        return False
+
+    base_name = os.path.splitext(video_path)[0]
+    segments = []
+
+    def encode(index, frames, segment_path):
+        # 每个关键帧都携带 SPS/PPS，重新编码的参数与原视频不同时，拼接后解码器也能正确切换
+        ffmpeg_utils.run_ffmpeg([
+            "-ss", f"{seek_to(index):.6f}",
+            "-i", origin_video,
+            "-map", "0:v:0",
+            "-frames:v", str(frames),
+            # 定位点与第一帧之间有半帧的间隔，不按恒定帧率补帧，否则第一帧会重复
+            "-fps_mode", "passthrough",
+            "-c:v", "libx264",
+            "-preset", settings["preset"],
+            "-crf", str(settings["crf"]),
+            "-x264-params", "repeat-headers=1",
+            segment_path,
+        ])
+        segments.append(segment_path)
+
+    try:
+        if k1 > first:
+            encode(first, k1 - first, f"{base_name}.head.mp4")
+
+        # 流复制从关键帧 k1 开始，按帧数截取到 k2 之前；
+        # mp4toannexb 在每个关键帧前插入原视频的 SPS/PPS，mp4 封装时会转换回长度前缀格式
+        ffmpeg_utils.run_ffmpeg([
+            "-ss", f"{inner[0]:.6f}",
+            "-i", origin_video,
+            "-map", "0:v:0",
+            "-frames:v", str(k2 - k1),
+            "-c:v", "copy",
+            "-bsf:v", "h264_mp4toannexb",
+            "-avoid_negative_ts", "make_zero",
+            f"{base_name}.middle.mp4",
+        ])
+        segments.append(f"{base_name}.middle.mp4")
+
+        if last > k2:
+            encode(k2, last - k2, f"{base_name}.tail.mp4")
+
+        # concat 按各片段的时长顺延时间戳，重新封装为连续的时间轴
+        args = [
+            "-f", "concat",
+            "-safe", "0",
+            "-protocol_whitelist", "file,pipe",
+            "-i", "pipe:0",
+        ]
+        if info.has_audio:
+            args += [
+                "-ss", f"{start:.6f}",
+                "-t", f"{end - start:.6f}",
+                "-i", origin_video,
+                "-map", "0:v:0",
+                "-map", "1:a:0",
+                "-c:a", "aac",
+            ]
+            if settings["audio_bitrate"]:
+                args += ["-b:a", settings["audio_bitrate"]]
+        else:
+            args += ["-map", "0:v:0"]
+        args += ["-c:v", "copy", video_path]
+        ffmpeg_utils.run_ffmpeg(args, input_data=ffmpeg_utils.concat_list(segments))
+
+        if not _verify_cut(origin_video, video_path, seek_to(first), total):
+            os.remove(video_path)
+            return False
+        logger.info(f"智能剪切: {start:.2f}-{end:.2f}, 流复制 {inner[0]:.2f}-{inner[-1]:.2f}")
+        return True
+    except Exception as e:
+        logger.warning(f"智能剪切失败，回退到重新编码: {ffmpeg_utils.ffmpeg_error_text(e)}")
+        if os.path.exists(video_path):
+            os.remove(video_path)
+        return False
+    finally:
+        for segment in segments:
+            if os.path.exists(segment):
+                os.remove(segment)
+
+
+def save_clip_video(timestamp: str, origin_video: str, save_dir: str = "",
+                    encoder_profile: str = EncoderProfile.standard.value, smart_cut: bool = False) -> dict:
     """
     保存剪辑后的视频
+    片段按 (源视频内容指纹, 时间段, 编码参数) 缓存，不同源视频的相同时间段不会互相覆盖，
+    并发请求同一片段时只编码一次，缓存目录超出配额时按最近使用时间淘汰
     Args:
         timestamp: 需要裁剪的单个时间戳，如：'00:36-00:40'
         origin_video: 原视频路径
         save_dir: 存储目录
+        encoder_profile: 编码配置
+        smart_cut: 是否使用关键帧感知的智能剪切，只重新编码首尾不完整的 GOP
 
     Returns:
         裁剪后的视频路径
     """
-    if not save_dir:
-        save_dir = utils.storage_dir("cache_videos")
-
-    if not os.path.exists(save_dir):
-        os.makedirs(save_dir)
-
-    video_id = f"vid-{timestamp.replace(':', '_')}"
-    video_path = f"{save_dir}/{video_id}.mp4"
+    encoder_profile = EncoderProfile(encoder_profile or EncoderProfile.standard.value)
+    key = clip_cache.clip_key(
+        origin_video, timestamp, encoder_profile=encoder_profile.value, smart_cut=bool(smart_cut)
+    )
 
-    if os.path.exists(video_path) and os.path.getsize(video_path) > 0:
-        logger.info(f"video already exists: {video_path}")
-        return {timestamp: video_path}
+    def create(video_path):
+        # 剪辑视频
+        start, end = utils.split_timestamp(timestamp)
+        if not (smart_cut and smart_cut_video(origin_video, cvsecs(start), cvsecs(end), video_path, encoder_profile)):
+            info = probe.media_info(origin_video)
+            # moviepy 读不到 displaymatrix 中的旋转角度，需要显式指定显示尺寸
+            origin_clip = VideoFileClip(
+                origin_video, target_resolution=(info.height, info.width) if info.rotation % 180 else None
+            )
+            video = origin_clip.subclip(start, end)
+            settings = encoder_profile.to_settings()
+            video.write_videofile(
+                video_path,
+                logger=None,  # 禁用 MoviePy 的内置日志
+                preset=settings["preset"],
+                audio_bitrate=settings["audio_bitrate"],
+                ffmpeg_params=["-crf", str(settings["crf"])],
+            )
+            origin_clip.close()
 
-    # 剪辑视频
-    start, end = utils.split_timestamp(timestamp)
-    video = VideoFileClip(origin_video).subclip(start, end)
-    video.write_videofile(video_path, logger=None)  # 禁用 MoviePy 的内置日志
+        info = probe.media_info(video_path) if os.path.getsize(video_path) > 0 else None
+        if not info or info.duration <= 0 or info.fps <= 0:
+            raise InvalidClipError(f"无效的视频文件: {video_path}")
 
-    if os.path.getsize(video_path) > 0 and os.path.exists(video_path):
-        try:
-            clip = VideoFileClip(video_path)
-            duration = clip.duration
-            fps = clip.fps
-            clip.close()
-            if duration > 0 and fps > 0:
-                return {timestamp: video_path}
-        except Exception as e:
-            try:
-                os.remove(video_path)
-            except Exception as e:
-                logger.warning(str(e))
-            logger.warning(f"无效的视频文件: {video_path}")
-    return {}
+    try:
+        video_path = clip_cache.get_or_create(key, create, save_dir)
+    except InvalidClipError as e:
+        logger.warning(str(e))
+        return {}
+    return {timestamp: video_path}
 
 
-def clip_videos(task_id: str, timestamp_terms: List[str], origin_video: str, progress_callback=None):
+def clip_videos(task_id: str, timestamp_terms: List[str], origin_video: str, progress_callback=None,
+                encoder_profile: str = EncoderProfile.standard.value):
     """
     剪辑视频
+    各时间段在有上限的线程池中并行裁剪（实际的解码和编码在 ffmpeg 子进程中进行），
+    进度回调在调用线程中按完成顺序触发
     Args:
         task_id: 任务id
         timestamp_terms: 需要剪辑的时间戳列表，如:['00:00-00:20', '00:36-00:40', '07:07-07:22']
         origin_video: 原视频路径
         progress_callback: 进度回调函数
+        encoder_profile: 编码配置，与最终渲染使用同一配置，片段按编码配置分别缓存
 
     Returns:
-        剪辑后的视频路径
+        剪辑后的视频路径，{时间戳: 路径}，顺序与 timestamp_terms 一致
     """
-    video_paths = {}
-    total_items = len(timestamp_terms)
-    for index, item in enumerate(timestamp_terms):
-        material_directory = config.app.get("material_directory", "").strip()
-        if material_directory == "task":
-            material_directory = utils.task_dir(task_id)
-        elif material_directory and not os.path.isdir(material_directory):
-            material_directory = ""
+    material_directory = config.app.get("material_directory", "").strip()
+    if material_directory == "task":
+        material_directory = utils.task_dir(task_id)
+    elif material_directory and not os.path.isdir(material_directory):
+        material_directory = ""
 
-        try:
-            saved_video_path = save_clip_video(timestamp=item, origin_video=origin_video, save_dir=material_directory)
-            if saved_video_path:
-                logger.info(f"video saved: {saved_video_path}")
-                video_paths.update(saved_video_path)
-            
-            # 更新进度
-            if progress_callback:
-                progress_callback(index + 1, total_items)
-        except Exception as e:
-            logger.error(f"视频裁剪失败: {utils.to_json(item)} => {str(e)}")
-            return {}
+    # 重复的时间戳只裁剪一次，避免多个线程写同一个文件
+    unique_terms = list(dict.fromkeys(timestamp_terms))
+    smart_cut = config.app.get("smart_cut", False)
+    # 并行裁剪数受 CPU 预算限制，多个任务同时运行时按各自分到的线程数裁剪
+    max_workers = max(1, min(len(unique_terms), budget.grant(task_id)["clip_workers"], os.cpu_count() or 1))
+
+    results = {}
+    total_items = len(unique_terms)
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        futures = {
+            executor.submit(
+                save_clip_video,
+                timestamp=item,
+                origin_video=origin_video,
+                save_dir=material_directory,
+                encoder_profile=encoder_profile,
+                smart_cut=smart_cut,
+            ): item
+            for item in unique_terms
+        }
+        for index, future in enumerate(as_completed(futures)):
+            item = futures[future]
+            try:
+                saved_video_path = future.result()
+                if saved_video_path:
+                    logger.info(f"video saved: {saved_video_path}")
+                    results.update(saved_video_path)
+
+                # 更新进度
+                if progress_callback:
+                    progress_callback(index + 1, total_items)
+            except Exception as e:
+                logger.error(f"视频裁剪失败: {utils.to_json(item)} => {str(e)}")
+                for f in futures:
+                    f.cancel()
+                return {}
+    # 按完成顺序收集的结果恢复为脚本顺序，调用方按位置与原声标记和脚本片段对应
+    video_paths = {item: results[item] for item in unique_terms if item in results}
     logger.success(f"裁剪 {len(video_paths)} videos")
     return video_paths
 
 
-def merge_videos(video_paths, ost_list):
+def merge_videos(video_paths, ost_list, output_file: str = "combined.mp4"):
     """
     合并多个视频为一个视频，可选择是否保留每个视频的原声。
 
     :param video_paths: 视频文件路径列表
     :param ost_list: 是否保留原声的布尔值列表
+    :param output_file: 合并后的视频文件路径
     :return: 合并后的视频文件路径
     """
     if len(video_paths) != len(ost_list):
@@ -347,20 +561,20 @@ def merge_videos(video_paths, ost_list):
     if not video_paths:
         raise ValueError("视频路径列表不能为空")
 
-    # 准备临时文件列表
-    temp_file = "temp_file_list.txt"
+    # 文件列表和无声视频写入中间文件目录
+    work_dir = scratch.work_dir(os.path.dirname(os.path.abspath(output_file)))
+    temp_file = os.path.join(work_dir, "temp_file_list.txt")
     with open(temp_file, "w") as f:
         for video_path, keep_ost in zip(video_paths, ost_list):
             if keep_ost:
-                f.write(f"file '{video_path}'\n")
+                f.write(f"file '{os.path.abspath(video_path)}'\n")
             else:
                 # 如果不保留原声，创建一个无声的临时视频
-                silent_video = f"silent_{os.path.basename(video_path)}"
+                silent_video = os.path.join(work_dir, f"silent_{os.path.basename(video_path)}")
                 subprocess.run(["ffmpeg", "-i", video_path, "-c:v", "copy", "-an", silent_video], check=True)
                 f.write(f"file '{silent_video}'\n")
 
     # 合并视频
-    output_file = "combined.mp4"
     ffmpeg_cmd = [
         "ffmpeg",
         "-f", "concat",
@@ -383,7 +597,7 @@ def merge_videos(video_paths, ost_list):
         os.remove(temp_file)
         for video_path, keep_ost in zip(video_paths, ost_list):
             if not keep_ost:
-                silent_video = f"silent_{os.path.basename(video_path)}"
+                silent_video = os.path.join(work_dir, f"silent_{os.path.basename(video_path)}")
                 if os.path.exists(silent_video):
                     os.remove(silent_video)
 
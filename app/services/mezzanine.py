@@ -0,0 +1,145 @@
+import os
+import threading
+from concurrent.futures import Future, ThreadPoolExecutor
+from typing import Dict, List
+
+from loguru import logger
+
+from app.config import config
+from app.models.schema import VideoAspect
+from app.services import clip_cache, probe
+from app.utils import utils, ffmpeg_utils
+
+# 标准化素材的帧率和关键帧间隔（秒），片段按整秒切分时入点都落在关键帧上，可以直接流复制
+FPS = 30
+GOP_SECONDS = 1
+
+_executor = None
+_pending: Dict[str, Future] = {}
+_lock = threading.Lock()
+
+
+def enabled() -> bool:
+    return bool(config.app.get("mezzanine_enabled", False))
+
+
+def mezzanine_file(video_path: str, video_width: int, video_height: int) -> str:
+    """
+    标准化素材按原素材的内容指纹和目标分辨率保存在 storage/cache_mezzanine 中
+    """
+    fingerprint = clip_cache.source_fingerprint(video_path)
+    return os.path.join(
+        utils.storage_dir("cache_mezzanine", create=True), f"mez-{fingerprint}-{video_width}x{video_height}.mp4"
+    )
+
+
+def is_mezzanine(video_path: str, video_width: int, video_height: int) -> bool:
+    """
+    是否为目标分辨率的标准化素材，所有标准化素材的编码参数相同，可以互相流复制拼接
+    """
+    directory = os.path.abspath(utils.storage_dir("cache_mezzanine"))
+    return (
+        os.path.dirname(os.path.abspath(video_path)) == directory
+        and os.path.basename(video_path).startswith("mez-")
+        and video_path.endswith(f"-{video_width}x{video_height}.mp4")
+    )
+
+
+def normalize(video_path: str, video_aspect: VideoAspect = VideoAspect.portrait) -> str:
+    """
+    将素材转码为目标比例的分辨率、30fps、短 GOP 的标准化素材，不同比例的画面居中补黑边
+    Args:
+        video_path: 下载的素材路径
+        video_aspect: 视频比例
+
+    Returns:
+        标准化素材路径，已存在时直接返回
+    """
+    video_width, video_height = VideoAspect(video_aspect).to_resolution()
+    video_file = mezzanine_file(video_path, video_width, video_height)
+    if os.path.isfile(video_file) and os.path.getsize(video_file) > 0:
+        return video_file
+
+    info = probe.media_info(video_path)
+    new_width, new_height = ffmpeg_utils.fit_size(info.width, info.height, video_width, video_height)
+    flags = "bilinear" if new_width > info.width or new_height > info.height else "area"
+    vf = f"scale={new_width}:{new_height}:flags={flags}"
+    if (new_width, new_height) != (video_width, video_height):
+        x = int((video_width - new_width) / 2)
+        y = int((video_height - new_height) / 2)
+        vf += f",pad={video_width}:{video_height}:{x}:{y}:black"
+    vf += f",setsar=1,fps={FPS}"
+
+    args = [
+        "-i", video_path,
+        "-map", "0:v:0",
+        "-vf", vf,
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-crf", "18",
+        "-pix_fmt", "yuv420p",
+        # 固定 GOP 且不使用 B 帧，流复制时入点和出点都可以精确到帧
+        "-g", str(FPS * GOP_SECONDS),
+        "-keyint_min", str(FPS * GOP_SECONDS),
+        "-sc_threshold", "0",
+        "-bf", "0",
+        "-force_key_frames", f"expr:gte(t,n_forced*{GOP_SECONDS})",
+        "-video_track_timescale", str(FPS * 512),
+    ]
+    if info.has_audio:
+        # 时长以画面为准，避免音轨略长导致按时长切分时出现没有画面的片段
+        args += ["-map", "0:a:0", "-c:a", "aac", "-ar", "44100", "-ac", "2", "-b:a", "128k", "-shortest"]
+    with ffmpeg_utils.atomic_output(video_file) as tmp_file:
+        ffmpeg_utils.run_ffmpeg(args + [tmp_file])
+    logger.info(f"生成标准化素材: {video_path} => {video_file}")
+    return video_file
+
+
+def _normalize_quietly(video_path: str, video_aspect: VideoAspect) -> str:
+    try:
+        return normalize(video_path, video_aspect)
+    except Exception as e:
+        logger.warning(f"生成标准化素材失败: {video_path} => {ffmpeg_utils.ffmpeg_error_text(e)}")
+        return ""
+
+
+def submit(video_path: str, video_aspect: VideoAspect = VideoAspect.portrait) -> Future:
+    """
+    在后台线程中生成标准化素材，同一素材同一比例只提交一次
+    后台线程数通过 config.toml 中的 mezzanine_workers 设置
+    """
+    global _executor
+    video_width, video_height = VideoAspect(video_aspect).to_resolution()
+    key = f"{os.path.abspath(video_path)}|{video_width}x{video_height}"
+    with _lock:
+        future = _pending.get(key)
+        if future is not None:
+            return future
+        if _executor is None:
+            workers = max(int(config.app.get("mezzanine_workers", 1)), 1)
+            _executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="mezzanine")
+        future = _executor.submit(_normalize_quietly, video_path, video_aspect)
+        _pending[key] = future
+    future.add_done_callback(lambda _: _pending.pop(key, None))
+    return future
+
+
+def resolve(video_paths: List[str], video_aspect: VideoAspect = VideoAspect.portrait) -> List[str]:
+    """
+    将素材替换为已生成的标准化素材，尚未生成完成的素材保持不变，不等待后台转码
+    """
+    video_width, video_height = VideoAspect(video_aspect).to_resolution()
+    resolved = []
+    for video_path in video_paths:
+        try:
+            video_file = mezzanine_file(video_path, video_width, video_height)
+        except OSError:
+            video_file = ""
+        if video_file and os.path.isfile(video_file) and os.path.getsize(video_file) > 0:
+            resolved.append(video_file)
+        else:
+            resolved.append(video_path)
+    normalized = sum(1 for a, b in zip(video_paths, resolved) if a != b)
+    if normalized:
+        logger.info(f"使用标准化素材: {normalized}/{len(video_paths)}")
+    return resolved
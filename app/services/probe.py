@@ -0,0 +1,260 @@
+import os
+import re
+import json
+import sqlite3
+import subprocess
+import threading
+from typing import List
+
+from loguru import logger
+from moviepy.video.io.ffmpeg_reader import ffmpeg_parse_infos
+
+from app.models.schema import MediaInfo
+from app.utils import utils, ffmpeg_utils
+
+# 进程内缓存，避免同一任务中反复查询数据库
+_memory_cache = {}
+_memory_cache_lock = threading.Lock()
+
+
+def _db_file() -> str:
+    return os.path.join(utils.storage_dir("cache_probe", create=True), "probe.db")
+
+
+def _connect() -> sqlite3.Connection:
+    conn = sqlite3.connect(_db_file(), timeout=30)
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS probe ("
+        "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, info TEXT)"
+    )
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS keyframes ("
+        "path TEXT PRIMARY KEY, mtime_ns INTEGER, size INTEGER, times TEXT)"
+    )
+    return conn
+
+
+def _ffmpeg_video_stream(path: str) -> dict:
+    """
+    从 ffmpeg -i 输出的第一条视频流信息中读取编码格式、像素格式、时间基和旋转角度，如：
+    Stream #0:0(und): Video: h264 (High) (avc1 / 0x31637661), yuv420p(progressive), 640x360, 25 fps, 25 tbr, 12800 tbn
+    """
+    cmd = [ffmpeg_utils.ffmpeg_binary(), "-hide_banner", "-nostdin", "-i", path]
+    # 没有指定输出文件，ffmpeg 打印输入信息后以非零状态退出
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    stderr = result.stderr.decode("utf-8", "ignore")
+    line = next((l for l in stderr.splitlines() if " Video: " in l), "")
+    stream = {}
+    codec = re.search(r" Video: (\w+)", line)
+    if codec:
+        stream["codec_name"] = codec.group(1)
+    pix_fmt = re.search(r" Video: [^,]*, (\w+)", line)
+    if pix_fmt:
+        stream["pix_fmt"] = pix_fmt.group(1)
+    tbn = re.search(r"([\d.]+)(k?) tbn", line)
+    if tbn:
+        stream["time_base"] = f"1/{int(float(tbn.group(1)) * (1000 if tbn.group(2) else 1))}"
+    # 旋转角度位于视频流信息之后的 Side data（displaymatrix）或 Metadata（旧版本的 rotate 标签）中
+    stream["side_data_list"] = []
+    details = stderr.split(line, 1)[1].split("  Stream #", 1)[0] if line else ""
+    rotation = re.search(r"(?:displaymatrix: rotation of|rotate\s*:)\s*(-?[\d.]+)", details)
+    if rotation:
+        stream["side_data_list"].append({"side_data_type": "Display Matrix", "rotation": float(rotation.group(1))})
+    return stream
+
+
+def _ffmpeg_probe(path: str) -> dict:
+    """
+    没有 ffprobe 时（如只安装了 imageio-ffmpeg）改为解析 ffmpeg -i 的输出，
+    转换为与 ffprobe 相同的结构，包含流复制合并时需要比较的编码格式、像素格式和时间基
+    """
+    infos = ffmpeg_parse_infos(path)
+    streams = []
+    if infos.get("video_found"):
+        width, height = infos.get("video_size") or (0, 0)
+        streams.append({
+            "codec_type": "video",
+            "codec_name": None,
+            "width": width,
+            "height": height,
+            "r_frame_rate": str(infos.get("video_fps") or 0),
+            "duration": str(infos.get("video_duration") or infos.get("duration") or 0),
+            **_ffmpeg_video_stream(path),
+        })
+    if infos.get("audio_found"):
+        streams.append({"codec_type": "audio", "sample_rate": str(infos.get("audio_fps") or 0)})
+    return {"format": {"duration": str(infos.get("duration") or 0)}, "streams": streams}
+
+
+def probe(path: str) -> dict:
+    """
+    读取媒体文件的 format 和 streams 信息（ffprobe 的 JSON 结构）
+    结果按 (路径, 修改时间, 文件大小) 缓存在 storage/cache_probe/probe.db 中，文件未变化时不再启动 ffprobe
+    Args:
+        path: 媒体文件路径
+
+    Returns:
+        ffprobe 输出的字典，读取失败时抛出异常
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+
+    with _memory_cache_lock:
+        info = _memory_cache.get(key)
+    if info is not None:
+        return info
+
+    try:
+        with _connect() as conn:
+            row = conn.execute(
+                "SELECT info FROM probe WHERE path = ? AND mtime_ns = ? AND size = ?", key
+            ).fetchone()
+        if row:
+            info = json.loads(row[0])
+            # 旧版本解析 ffmpeg -i 输出时没有记录编码格式和旋转角度（ffprobe 的结果带有 index），重新读取
+            if any(
+                s.get("codec_type") == "video"
+                and (not s.get("codec_name") or ("index" not in s and "side_data_list" not in s))
+                for s in info.get("streams", [])
+            ):
+                info = None
+    except Exception as e:
+        logger.warning(f"媒体信息缓存读取失败: {str(e)}")
+
+    if info is None:
+        try:
+            info = ffmpeg_utils.ffprobe(path)
+        except FileNotFoundError:
+            info = _ffmpeg_probe(path)
+        try:
+            with _connect() as conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO probe (path, mtime_ns, size, info) VALUES (?, ?, ?, ?)",
+                    (*key, json.dumps(info)),
+                )
+        except Exception as e:
+            logger.warning(f"媒体信息缓存写入失败: {str(e)}")
+
+    with _memory_cache_lock:
+        _memory_cache[key] = info
+    return info
+
+
+def _rotation(stream: dict) -> int:
+    """
+    视频流的旋转角度，取 ffprobe 的 Display Matrix 或旧版本的 rotate 标签，归一化为 0、90、180、270
+    """
+    rotation = 0.0
+    for side_data in stream.get("side_data_list") or []:
+        if "rotation" in side_data:
+            rotation = float(side_data["rotation"])
+            break
+    else:
+        rotation = float((stream.get("tags") or {}).get("rotate") or 0)
+    return int(round(rotation)) % 360
+
+
+def media_info(path: str) -> MediaInfo:
+    """
+    读取媒体文件的时长、画面尺寸、帧率以及是否包含音视频流
+    画面尺寸为显示尺寸：旋转 90 度或 270 度的视频（如竖拍的手机视频）交换宽高，与 ffmpeg 自动旋转后的画面一致
+    """
+    info = probe(path)
+    streams = info.get("streams", [])
+    video_streams = [s for s in streams if s.get("codec_type") == "video"]
+    audio_streams = [s for s in streams if s.get("codec_type") == "audio"]
+    duration = float(info.get("format", {}).get("duration") or 0)
+
+    result = MediaInfo(path=path, duration=duration, has_video=bool(video_streams), has_audio=bool(audio_streams))
+    if video_streams:
+        v = video_streams[0]
+        result.width = int(v.get("width") or 0)
+        result.height = int(v.get("height") or 0)
+        result.rotation = _rotation(v)
+        if result.rotation % 180:
+            result.width, result.height = result.height, result.width
+        result.fps = ffmpeg_utils.parse_rate(v.get("r_frame_rate"))
+        result.video_codec = v.get("codec_name") or ""
+        if not result.duration:
+            result.duration = float(v.get("duration") or 0)
+    return result
+
+
+def _ffprobe_keyframes(path: str) -> List[float]:
+    """
+    使用 ffprobe 读取视频流的关键帧时间，只解析数据包，不解码画面
+    """
+    cmd = [
+        ffmpeg_utils.ffprobe_binary(),
+        "-v", "error",
+        "-select_streams", "v:0",
+        "-show_entries", "packet=pts_time,flags",
+        "-of", "csv=p=0",
+        path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    # 数据包时间戳包含文件的起始时间，转换为与 -ss 一致的相对时间
+    start_time = float(probe(path).get("format", {}).get("start_time") or 0)
+    times = []
+    for line in result.stdout.decode("utf-8").splitlines():
+        pts_time, _, flags = line.partition(",")
+        if "K" in flags and pts_time not in ("", "N/A"):
+            times.append(float(pts_time) - start_time)
+    return sorted(times)
+
+
+def _ffmpeg_keyframes(path: str) -> List[float]:
+    """
+    没有 ffprobe 时，让 ffmpeg 只解码关键帧并通过 showinfo 滤镜输出时间
+    """
+    cmd = [
+        ffmpeg_utils.ffmpeg_binary(),
+        "-hide_banner", "-nostdin",
+        "-skip_frame", "nokey",
+        "-i", path,
+        "-an",
+        "-vf", "showinfo",
+        "-f", "null", "-",
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    times = re.findall(r"pts_time:\s*([-\d.]+)", result.stderr.decode("utf-8", "ignore"))
+    return sorted(float(t) for t in times)
+
+
+def keyframes(path: str) -> List[float]:
+    """
+    读取视频的关键帧时间索引（秒），按与 probe 相同的方式缓存
+    Args:
+        path: 视频文件路径
+
+    Returns:
+        升序排列的关键帧时间列表
+    """
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (path, stat.st_mtime_ns, stat.st_size)
+
+    try:
+        with _connect() as conn:
+            row = conn.execute(
+                "SELECT times FROM keyframes WHERE path = ? AND mtime_ns = ? AND size = ?", key
+            ).fetchone()
+        if row:
+            return json.loads(row[0])
+    except Exception as e:
+        logger.warning(f"关键帧缓存读取失败: {str(e)}")
+
+    try:
+        times = _ffprobe_keyframes(path)
+    except FileNotFoundError:
+        times = _ffmpeg_keyframes(path)
+    try:
+        with _connect() as conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO keyframes (path, mtime_ns, size, times) VALUES (?, ?, ?, ?)",
+                (*key, json.dumps(times)),
+            )
+    except Exception as e:
+        logger.warning(f"关键帧缓存写入失败: {str(e)}")
+    return times
@@ -0,0 +1,80 @@
+import os
+
+from loguru import logger
+
+from app.config import config
+from app.services import clip_cache, probe
+from app.utils import utils, ffmpeg_utils
+
+# 代理视频的关键帧间隔（帧），GOP 越短，预览时跳转和裁剪越快
+_PROXY_GOP = 12
+
+
+def enabled() -> bool:
+    return bool(config.app.get("proxy_enabled", False))
+
+
+def proxy_file(origin_video: str) -> str:
+    """
+    代理视频按原视频的内容指纹保存在 storage/cache_proxy 中
+    """
+    fingerprint = clip_cache.source_fingerprint(origin_video)
+    return os.path.join(utils.storage_dir("cache_proxy", create=True), f"proxy-{fingerprint}.mp4")
+
+
+def create_proxy(origin_video: str) -> str:
+    """
+    生成低分辨率、短 GOP 的代理视频，帧率和时间轴与原视频一致，时间戳可以直接通用
+    Args:
+        origin_video: 原视频路径
+
+    Returns:
+        代理视频路径，已存在时直接返回
+    """
+    video_file = proxy_file(origin_video)
+    if os.path.isfile(video_file) and os.path.getsize(video_file) > 0:
+        return video_file
+
+    info = probe.media_info(origin_video)
+    height = int(config.app.get("proxy_height", 360))
+    # 按画面短边缩放，不放大
+    if info.width and info.height and min(info.width, info.height) <= height:
+        scale = "scale=trunc(iw/2)*2:trunc(ih/2)*2"
+    elif info.width >= info.height:
+        scale = f"scale=-2:{height}"
+    else:
+        scale = f"scale={height}:-2"
+
+    args = [
+        "-i", origin_video,
+        "-map", "0:v:0",
+        "-vf", scale,
+        "-c:v", "libx264",
+        "-preset", "veryfast",
+        "-crf", "28",
+        "-g", str(_PROXY_GOP),
+        "-keyint_min", str(_PROXY_GOP),
+        "-sc_threshold", "0",
+        "-pix_fmt", "yuv420p",
+    ]
+    if info.has_audio:
+        args += ["-map", "0:a:0", "-c:a", "aac", "-b:a", "64k"]
+    with ffmpeg_utils.atomic_output(video_file) as tmp_file:
+        ffmpeg_utils.run_ffmpeg(args + [tmp_file])
+    logger.info(f"生成代理视频: {origin_video} => {video_file}")
+    return video_file
+
+
+def preview_source(origin_video: str) -> str:
+    """
+    预览操作使用的视频：开启代理时返回代理视频（不存在时生成），否则返回原视频
+    生成代理失败时回退到原视频
+    """
+    if not enabled() or not origin_video or not os.path.isfile(origin_video):
+        return origin_video
+    try:
+        return create_proxy(origin_video)
+    except Exception as e:
+        logger.warning(f"生成代理视频失败，使用原视频: {ffmpeg_utils.ffmpeg_error_text(e)}")
+        return origin_video
+
@@ -0,0 +1,121 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, List, Tuple
+
+from loguru import logger
+from moviepy.video.VideoClip import VideoClip
+from moviepy.video.io.VideoFileClip import VideoFileClip
+
+from app.config import config
+from app.services import probe
+
+
+class ReaderPool:
+    """
+    源视频解码器池
+    片段只记录 (源视频, 起始时间, 时长)，第一次取帧时才打开对应的解码器；
+    同时打开的解码器不超过 max_readers，超出时关闭最久未使用的；
+    按时间线顺序取帧时，源视频在最后一次被使用之后立即关闭
+    """
+
+    def __init__(self, max_readers: int = None):
+        self.max_readers = max(int(max_readers or config.app.get("max_open_readers", 4)), 1)
+        self._readers = OrderedDict()
+        self._last_use = {}
+        self._lock = threading.Lock()
+
+    def plan(self, timeline: List[Tuple[str, float, float]]):
+        """
+        记录时间线中每个源视频最后一次被使用的片段序号
+        Args:
+            timeline: [(源视频路径, 起始时间, 时长)]
+        """
+        self._last_use = {}
+        for index, (path, _, _) in enumerate(timeline):
+            self._last_use[path] = index
+
+    def _reader(self, path: str) -> VideoFileClip:
+        reader = self._readers.get(path)
+        if reader is not None:
+            self._readers.move_to_end(path)
+            return reader
+        while len(self._readers) >= self.max_readers:
+            old_path, old_reader = self._readers.popitem(last=False)
+            old_reader.close()
+            logger.debug(f"关闭解码器: {old_path}")
+        info = probe.media_info(path)
+        # moviepy 读不到 displaymatrix 中的旋转角度，会把 ffmpeg 自动旋转后的画面按原始宽高缩放，需要显式指定显示尺寸
+        target_resolution = (info.height, info.width) if info.rotation % 180 else None
+        reader = VideoFileClip(path, audio=False, target_resolution=target_resolution)
+        self._readers[path] = reader
+        return reader
+
+    def _release_before(self, index: int):
+        for path in [p for p in self._readers if self._last_use.get(p, index) < index]:
+            self._readers.pop(path).close()
+            logger.debug(f"源视频已使用完毕，关闭解码器: {path}")
+
+    def get_frame(self, index: int, path: str, t: float):
+        with self._lock:
+            self._release_before(index)
+            return self._reader(path).get_frame(t)
+
+    def clip(self, index: int, path: str, start: float, duration: float,
+             size: tuple = None, transform: Callable = None) -> VideoClip:
+        """
+        创建延迟打开的片段，画面尺寸通过 probe 读取，不打开解码器
+        moviepy 的 fl/fl_image/resize 会立即取第一帧来确定尺寸，逐帧处理需要通过 transform 传入
+        Args:
+            index: 片段在时间线中的序号
+            path: 源视频路径
+            start: 在源视频中的起始时间
+            duration: 时长
+            size: transform 输出的画面尺寸，默认为源视频尺寸
+            transform: 逐帧处理函数，如缩放
+        """
+        info = probe.media_info(path)
+
+        def make_frame(t):
+            frame = self.get_frame(index, path, start + t)
+            return transform(frame) if transform else frame
+
+        # VideoClip 构造时传入 make_frame 同样会立即取第一帧，因此构造后再设置
+        clip = VideoClip(duration=duration)
+        clip.make_frame = make_frame
+        clip.size = size or (info.width, info.height)
+        clip.fps = info.fps
+        return clip
+
+    def close(self):
+        with self._lock:
+            while self._readers:
+                self._readers.popitem(last=False)[1].close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+
+
+def seek_ordered(segments: List[Tuple[str, float, float]]) -> List[Tuple[str, float, float]]:
+    """
+    保持各源视频在时间线中占据的位置不变，把同一源视频的片段按起始时间重新排列，
+    使每个解码器只需要向后读取，不会来回跳转
+    Args:
+        segments: 已打乱的 [(源视频路径, 起始时间, 结束时间)]
+
+    Returns:
+        重新排列后的片段列表
+    """
+    by_source = {}
+    for segment in segments:
+        by_source.setdefault(segment[0], []).append(segment)
+    for path in by_source:
+        by_source[path].sort(key=lambda s: s[1])
+    positions = {path: 0 for path in by_source}
+    ordered = []
+    for path, _, _ in segments:
+        ordered.append(by_source[path][positions[path]])
+        positions[path] += 1
+    return ordered
@@ -0,0 +1,142 @@
+import os
+import time
+
+import proglog
+from loguru import logger
+
+from app.config import config
+from app.services import state as sm
+
+
+class RenderProgress(proglog.ProgressBarLogger):
+    """
+    渲染进度和编码速度
+    作为 moviepy write_videofile 的 logger 接收逐帧进度，或通过 ffmpeg_callback 接收 ffmpeg -progress 的输出；
+    按 render_progress_interval 节流写入任务状态的 render_progress 字段，同时把任务进度推进到 progress_range 内的对应位置；
+    finish() 把本次渲染的摘要追加到任务状态的 renders 字段
+    """
+
+    def __init__(self, task_id: str, stage: str, progress_range: tuple = None, output_file: str = "", fps: int = 30):
+        # 只跟踪画面帧，moviepy 写入音轨时的 chunk 进度条不处理
+        super().__init__(ignored_bars=("chunk",))
+        self.task_id = task_id
+        self.stage = stage
+        self.progress_range = progress_range
+        self.output_file = output_file
+        self.fps = fps
+        self.interval = float(config.app.get("render_progress_interval", 1.0))
+        self.total_frames = 0
+        self.frame = 0
+        self.bitrate = ""
+        self.started = None
+        self._last_push = 0.0
+
+    def begin(self, duration: float = 0):
+        """
+        开始计时，duration 为输出时长（秒），用于计算百分比和剩余时间
+        """
+        if duration:
+            self.total_frames = int(duration * self.fps)
+        if self.started is None:
+            self.started = time.time()
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if bar != "t":
+            return
+        if attr == "total":
+            # 新的一次写入（如 ffmpeg 后端失败后回退到 moviepy）重新计时
+            self.total_frames = int(value)
+            self.frame = 0
+            self.bitrate = ""
+            self.started = time.time()
+        elif attr == "index":
+            self.update(int(value))
+
+    def ffmpeg_callback(self, fields: dict):
+        """
+        接收 ffmpeg -progress 输出的一组字段，如 frame、bitrate、out_time_us、progress
+        """
+        frame = fields.get("frame", "")
+        out_time_us = fields.get("out_time_us", "")
+        if frame.isdigit():
+            frame = int(frame)
+        elif out_time_us.isdigit():
+            frame = int(int(out_time_us) / 1000000 * self.fps)
+        else:
+            frame = self.frame
+        bitrate = fields.get("bitrate", "")
+        self.update(frame, bitrate=bitrate if bitrate and bitrate != "N/A" else "", force=fields.get("progress") == "end")
+
+    def update(self, frame: int, bitrate: str = "", force: bool = False):
+        self.begin()
+        self.frame = max(frame, self.frame)
+        if bitrate:
+            self.bitrate = bitrate
+        now = time.time()
+        if not force and now - self._last_push < self.interval:
+            return
+        self._last_push = now
+        self._push()
+
+    def _output_bitrate(self, seconds: float) -> str:
+        # moviepy 不输出码率，按已写入的文件大小估算
+        if self.bitrate or not self.output_file or not seconds:
+            return self.bitrate
+        try:
+            return f"{os.path.getsize(self.output_file) * 8 / seconds / 1000:.1f}kbits/s"
+        except OSError:
+            return ""
+
+    def snapshot(self) -> dict:
+        elapsed = max(time.time() - (self.started or time.time()), 1e-6)
+        seconds = self.frame / self.fps
+        fps = self.frame / elapsed
+        eta = (self.total_frames - self.frame) / fps if fps and self.total_frames else None
+        return {
+            "stage": self.stage,
+            "frame": self.frame,
+            "total_frames": self.total_frames,
+            "percent": round(min(self.frame / self.total_frames, 1) * 100, 1) if self.total_frames else None,
+            "fps": round(fps, 2),
+            "speed": round(seconds / elapsed, 3),
+            "bitrate": self._output_bitrate(seconds),
+            "elapsed": round(elapsed, 1),
+            "eta": round(eta, 1) if eta is not None else None,
+        }
+
+    def _push(self):
+        if not self.task_id:
+            return
+        snapshot = self.snapshot()
+        fields = {"render_progress": snapshot}
+        if self.progress_range and snapshot["percent"] is not None:
+            start, end = self.progress_range
+            fields["progress"] = int(start + (end - start) * snapshot["percent"] / 100)
+        try:
+            sm.state.update_fields(self.task_id, **fields)
+        except Exception as e:
+            logger.warning(f"写入渲染进度失败: {self.task_id} => {str(e)}")
+
+    def finish(self) -> dict:
+        """
+        记录本次渲染的摘要：帧数、时长、耗时、平均帧率、相对实时的倍速和码率
+        """
+        self.begin()
+        summary = self.snapshot()
+        summary.pop("eta")
+        summary["output_file"] = self.output_file
+        logger.info(
+            f"渲染完成 [{self.stage}]: {summary['frame']} 帧, 耗时 {summary['elapsed']} s, "
+            f"{summary['fps']} fps, {summary['speed']}x, {summary['bitrate']}"
+        )
+        if self.task_id:
+            try:
+                task = sm.state.get_task(self.task_id) or {}
+                renders = list(task.get("renders") or []) + [summary]
+                fields = {"render_progress": summary, "renders": renders}
+                if self.progress_range:
+                    fields["progress"] = int(self.progress_range[1])
+                sm.state.update_fields(self.task_id, **fields)
+            except Exception as e:
+                logger.warning(f"写入渲染摘要失败: {self.task_id} => {str(e)}")
+        return summary
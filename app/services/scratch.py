@@ -0,0 +1,130 @@
+import os
+import shutil
+import threading
+from contextlib import contextmanager
+
+from loguru import logger
+
+from app.config import config
+from app.utils import utils
+
+# 任务目录 => 任务开始时选定的中间文件目录，任务运行期间不再重新检查配额
+_task_dirs = {}
+_lock = threading.Lock()
+
+
+def root() -> str:
+    """
+    中间文件的根目录，通过 config.toml 中的 scratch_dir 设置（如 tmpfs 或本地 SSD），默认为 storage/scratch
+    """
+    d = config.app.get("scratch_dir", "").strip() or utils.storage_dir("scratch")
+    os.makedirs(d, exist_ok=True)
+    return d
+
+
+def usage() -> int:
+    """
+    中间文件目录当前占用的字节数
+    """
+    total = 0
+    for dirpath, _, filenames in os.walk(root()):
+        for filename in filenames:
+            try:
+                total += os.path.getsize(os.path.join(dirpath, filename))
+            except OSError:
+                pass
+    return total
+
+
+def _dir_for(target_dir: str) -> str:
+    target_dir = os.path.abspath(target_dir)
+    return os.path.join(root(), f"{os.path.basename(target_dir)}-{utils.md5(target_dir)[:8]}")
+
+
+def _within_root(path: str) -> bool:
+    try:
+        return os.path.commonpath([os.path.abspath(path), os.path.abspath(root())]) == os.path.abspath(root())
+    except ValueError:
+        # Windows 下不同盘符的路径
+        return False
+
+
+def _choose(target_dir: str) -> str:
+    # 超过 scratch_max_gb 配额时改用 target_dir 下的 scratch 子目录，同样在任务结束后整体删除
+    max_gb = float(config.app.get("scratch_max_gb", 0) or 0)
+    if max_gb > 0 and usage() >= max_gb * 1024 ** 3:
+        d = os.path.join(target_dir, "scratch")
+        logger.warning(f"中间文件目录超过配额 {max_gb} GB，写入: {d}")
+    else:
+        d = _dir_for(target_dir)
+    os.makedirs(d, exist_ok=True)
+    return d
+
+
+def work_dir(target_dir: str) -> str:
+    """
+    target_dir（如任务目录）对应的中间文件目录，target_dir 已是中间文件目录时原样返回
+    task() 运行期间使用任务开始时选定的目录；其他目录每次调用时按 scratch_max_gb 配额选择
+    """
+    target_dir = os.path.abspath(target_dir)
+    if _within_root(target_dir):
+        return target_dir
+    with _lock:
+        d = _task_dirs.get(target_dir)
+        if d is None and target_dir in _task_dirs.values():
+            d = target_dir
+    return d or _choose(target_dir)
+
+
+def task_dir(task_id: str) -> str:
+    """
+    任务的中间文件目录
+    """
+    return work_dir(utils.task_dir(task_id))
+
+
+def temp_path(output_file: str, suffix: str) -> str:
+    """
+    输出文件的中间文件路径，如 final-1.mp4 的 ASS 字幕 <中间文件目录>/final-1.ass
+    """
+    name = os.path.splitext(os.path.basename(output_file))[0]
+    return os.path.join(work_dir(os.path.dirname(output_file)), f"{name}{suffix}")
+
+
+def publish(path: str, target_dir: str) -> str:
+    """
+    将需要保留的中间文件移动到 target_dir
+    Returns:
+        移动后的路径
+    """
+    target = os.path.join(target_dir, os.path.basename(path))
+    if os.path.abspath(path) != os.path.abspath(target):
+        shutil.move(path, target)
+    return target
+
+
+def cleanup(d: str):
+    """
+    删除中间文件目录
+    """
+    if os.path.isdir(d):
+        shutil.rmtree(d, ignore_errors=True)
+        logger.info(f"清理中间文件: {d}")
+
+
+@contextmanager
+def task(task_id: str):
+    """
+    任务运行期间使用中间文件目录，结束（包括失败）后清理
+    中间文件目录在任务开始时按配额选定一次，同一任务的中间文件不会分散在两个目录中
+    """
+    target_dir = os.path.abspath(utils.task_dir(task_id))
+    d = _choose(target_dir)
+    with _lock:
+        _task_dirs[target_dir] = d
+    try:
+        yield d
+    finally:
+        with _lock:
+            _task_dirs.pop(target_dir, None)
+        cleanup(d)
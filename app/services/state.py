@@ -10,6 +10,10 @@ class BaseState(ABC):
     def update_task(self, task_id: str, state: int, progress: int = 0, **kwargs):
         pass
 
+    @abstractmethod
+    def update_fields(self, task_id: str, **kwargs):
+        pass
+
     @abstractmethod
     def get_task(self, task_id: str):
         pass
@@ -31,11 +35,11 @@ class MemoryState(BaseState):
         if progress > 100:
             progress = 100
 
-        self._tasks[task_id] = {
-            "state": state,
-            "progress": progress,
-            **kwargs,
-        }
+        # 与 RedisState 一致，只更新传入的字段，保留其他字段（如线程分配）
+        self.update_fields(task_id, state=state, progress=progress, **kwargs)
+
+    def update_fields(self, task_id: str, **kwargs):
+        self._tasks.setdefault(task_id, {}).update(kwargs)
 
     def get_task(self, task_id: str):
         return self._tasks.get(task_id, None)
@@ -63,13 +67,10 @@ class RedisState(BaseState):
         if progress > 100:
             progress = 100
 
-        fields = {
-            "state": state,
-            "progress": progress,
-            **kwargs,
-        }
+        self.update_fields(task_id, state=state, progress=progress, **kwargs)
 
-        for field, value in fields.items():
+    def update_fields(self, task_id: str, **kwargs):
+        for field, value in kwargs.items():
             self._redis.hset(task_id, field, str(value))
 
     def get_task(self, task_id: str):
@@ -18,13 +18,15 @@ compute_type = config.whisper.get("compute_type", "int8")
 model = None
 
 
-def create(audio_file, subtitle_file: str = ""):
+def create(audio_file, subtitle_file: str = "", cpu_threads: int = 0):
     """
     为给定的音频文件创建字幕文件。
 
     参数:
     - audio_file: 音频文件的路径。
     - subtitle_file: 字幕文件的输出路径（可选）。如果未提供，将根据音频文件的路径生成字幕文件。
+    - cpu_threads: 加载模型时使用的 CPU 线程数（可选），0 表示使用 faster-whisper 的默认值。
+      模型只加载一次，之后的调用沿用首次加载时的线程数。
 
     返回:
     无返回值，但会在指定路径生成字幕文件。
@@ -44,13 +46,14 @@ def create(audio_file, subtitle_file: str = ""):
             return None
 
         logger.info(
-            f"加载模型: {model_path}, 设备: {device}, 计算类型: {compute_type}"
+            f"加载模型: {model_path}, 设备: {device}, 计算类型: {compute_type}, 线程数: {cpu_threads}"
         )
         try:
             model = WhisperModel(
                 model_size_or_path=model_path,
                 device=device,
                 compute_type=compute_type,
+                cpu_threads=cpu_threads,
                 local_files_only=True
             )
         except Exception as e:
@@ -0,0 +1,476 @@
+import os
+import math
+import bisect
+import hashlib
+import itertools
+import threading
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Union
+
+import numpy as np
+from loguru import logger
+from moviepy.video.tools.subtitles import file_to_subtitles
+from PIL import Image, ImageColor, ImageDraw, ImageFont
+
+from app.config import config
+from app.models.schema import VideoParams, VideoClipParams
+from app.services import clip_cache
+from app.utils import utils, ffmpeg_utils
+
+# 内存中缓存的字幕位图上限（字节），超出后按最近最少使用淘汰
+_BITMAP_CACHE_MAX_BYTES = 512 * 1024 * 1024
+_bitmap_cache = OrderedDict()
+_bitmap_cache_bytes = 0
+_bitmap_cache_lock = threading.Lock()
+# 每写入多少个字幕位图检查一次磁盘缓存配额
+_DISK_QUOTA_CHECK_WRITES = 64
+_disk_writes = itertools.count(1)
+
+
+@lru_cache(maxsize=32)
+def load_font(font_path: str, font_size: int) -> ImageFont.FreeTypeFont:
+    """
+    加载字体，同一字体和字号只加载一次
+    """
+    return ImageFont.truetype(font_path, font_size)
+
+
+def wrap_text(text, max_width, font="Arial", fontsize=60):
+    # 创建字体对象，同一字体和字号只加载一次
+    font = load_font(font, fontsize)
+
+    def get_text_size(inner_text):
+        inner_text = inner_text.strip()
+        left, top, right, bottom = font.getbbox(inner_text)
+        return right - left, bottom - top
+
+    width, height = get_text_size(text)
+    if width <= max_width:
+        return text, height
+
+    # logger.warning(f"wrapping text, max_width: {max_width}, text_width: {width}, text: {text}")
+
+    # 逐个累加单词/字符的宽度，避免反复测量不断增长的前缀
+    lengths = {}
+
+    def get_length(inner_text):
+        if inner_text not in lengths:
+            lengths[inner_text] = font.getlength(inner_text)
+        return lengths[inner_text]
+
+    processed = True
+
+    _wrapped_lines_ = []
+    words = text.split(" ")
+    space_width = get_length(" ")
+    _txt_ = ""
+    _width = 0
+    for word in words:
+        word_width = get_length(word)
+        _next_width = _width + space_width + word_width if _txt_ else word_width
+        if _next_width <= max_width:
+            _txt_ = f"{_txt_} {word}" if _txt_ else word
+            _width = _next_width
+            continue
+        if not _txt_:
+            # 单个单词就超出宽度（如中文长句），改为按字符折行
+            processed = False
+            break
+        _wrapped_lines_.append(_txt_)
+        if word_width > max_width:
+            processed = False
+            break
+        _txt_ = word
+        _width = word_width
+    _wrapped_lines_.append(_txt_)
+    if processed:
+        _wrapped_lines_ = [line.strip() for line in _wrapped_lines_]
+        result = "\n".join(_wrapped_lines_).strip()
+        height = len(_wrapped_lines_) * height
+        # logger.warning(f"wrapped text: {result}")
+        return result, height
+
+    _wrapped_lines_ = []
+    _txt_ = ""
+    _width = 0
+    for char in text:
+        _txt_ += char
+        _width += get_length(char)
+        if _width <= max_width:
+            continue
+        else:
+            _wrapped_lines_.append(_txt_)
+            _txt_ = ""
+            _width = 0
+    _wrapped_lines_.append(_txt_)
+    result = "\n".join(_wrapped_lines_).strip()
+    height = len(_wrapped_lines_) * height
+    # logger.warning(f"wrapped text: {result}")
+    return result, height
+
+
+def font_family_name(font_path: str) -> str:
+    """
+    读取字体文件中的字体族名称，libass 通过族名称在 fontsdir 中查找字体
+    """
+    try:
+        return load_font(font_path, 10).getname()[0]
+    except Exception as e:
+        logger.warning(f"无法读取字体名称: {font_path} => {str(e)}")
+        return os.path.splitext(os.path.basename(font_path))[0]
+
+
+def ass_color(color: str) -> str:
+    """
+    将 #RRGGBB 颜色转换为 ASS 的 &HAABBGGRR 格式，transparent 转换为完全透明
+    """
+    if not color or color == "transparent":
+        return "&HFF000000"
+    color = color.lstrip("#")
+    if len(color) == 3:
+        color = "".join(c * 2 for c in color)
+    if len(color) != 6:
+        logger.warning(f"不支持的颜色格式: {color}，使用白色代替")
+        color = "FFFFFF"
+    r, g, b = color[0:2], color[2:4], color[4:6]
+    return f"&H00{b}{g}{r}".upper()
+
+
+def ass_timestamp(seconds: float) -> str:
+    """
+    将秒数转换为 ASS 时间格式 H:MM:SS.cc
+    """
+    centiseconds = int(round(max(seconds, 0) * 100))
+    hours, centiseconds = divmod(centiseconds, 360000)
+    minutes, centiseconds = divmod(centiseconds, 6000)
+    secs, centiseconds = divmod(centiseconds, 100)
+    return f"{hours:d}:{minutes:02d}:{secs:02d}.{centiseconds:02d}"
+
+
+def srt_to_ass(
+    subtitle_path: str,
+    ass_path: str,
+    font_path: str,
+    params: Union[VideoParams, VideoClipParams],
+    video_width: int,
+    video_height: int,
+    max_duration: float = 0,
+) -> str:
+    """
+    将 SRT 字幕和字幕样式转换为 ASS 文件，供 ffmpeg 的 ass 滤镜在编码时直接烧录
+    换行和位置与 TextClip 渲染保持一致：按 90% 画面宽度折行，底部/顶部预留 5% 边距
+    Args:
+        subtitle_path: SRT 字幕路径
+        ass_path: ASS 输出路径
+        font_path: 字体文件路径
+        params: 视频参数，使用其中的字体、颜色、描边和位置配置
+        video_width: 视频宽度
+        video_height: 视频高度
+        max_duration: 视频时长，超出部分的字幕会被丢弃，0 表示不限制
+
+    Returns:
+        ASS 文件路径
+    """
+    margin_v = int(round(video_height * 0.05))
+    alignment = {"top": 8, "center": 5, "custom": 8}.get(params.subtitle_position, 2)
+    border_style = 1
+    outline_color = ass_color(params.stroke_color)
+    if params.text_background_color and params.text_background_color != "transparent":
+        # 不透明背景框，ASS 使用描边颜色作为背景框颜色
+        border_style = 3
+        outline_color = ass_color(params.text_background_color)
+
+    header = [
+        "[Script Info]",
+        "ScriptType: v4.00+",
+        f"PlayResX: {video_width}",
+        f"PlayResY: {video_height}",
+        "WrapStyle: 2",
+        "ScaledBorderAndShadow: yes",
+        "",
+        "[V4+ Styles]",
+        "Format: Name, Fontname, Fontsize, PrimaryColour, SecondaryColour, OutlineColour, BackColour, "
+        "Bold, Italic, Underline, StrikeOut, ScaleX, ScaleY, Spacing, Angle, BorderStyle, Outline, Shadow, "
+        "Alignment, MarginL, MarginR, MarginV, Encoding",
+        f"Style: Default,{font_family_name(font_path)},{params.font_size},{ass_color(params.text_fore_color)},"
+        f"&H000000FF,{outline_color},&H00000000,0,0,0,0,100,100,0,0,{border_style},"
+        # ImageMagick 的描边以字形边缘为中心，向外只延伸一半宽度
+        f"{params.stroke_width / 2:.2f},0,{alignment},0,0,{margin_v},1",
+        "",
+        "[Events]",
+        "Format: Layer, Start, End, Style, Name, MarginL, MarginR, MarginV, Effect, Text",
+    ]
+
+    events = []
+    max_width = video_width * 0.9
+    for (start, end), text in file_to_subtitles(subtitle_path, encoding="utf-8"):
+        if max_duration:
+            if start >= max_duration:
+                continue
+            end = min(end, max_duration)
+        wrapped_txt, txt_height = wrap_text(
+            text, max_width=max_width, font=font_path, fontsize=params.font_size
+        )
+        override = ""
+        if params.subtitle_position == "custom":
+            # 确保字幕完全在屏幕内
+            margin = 10
+            max_y = video_height - txt_height - margin
+            custom_y = (video_height - txt_height) * (params.custom_position / 100)
+            custom_y = max(margin, min(custom_y, max_y))
+            override = f"{{\\pos({video_width / 2:.0f},{custom_y:.0f})}}"
+        ass_text = wrapped_txt.replace("\r", "").replace("\n", "\\N")
+        events.append(
+            f"Dialogue: 0,{ass_timestamp(start)},{ass_timestamp(end)},Default,,0,0,0,,{override}{ass_text}"
+        )
+
+    with open(ass_path, "w", encoding="utf-8") as f:
+        f.write("\n".join(header + events) + "\n")
+    logger.info(f"生成 ASS 字幕: {ass_path}, {len(events)} 条")
+    return ass_path
+
+
+def ass_filter(ass_path: str) -> str:
+    """
+    生成 ffmpeg ass 滤镜参数，字体从项目字体目录中加载
+    """
+    filename = ffmpeg_utils.escape_filter_path(ass_path)
+    fonts_dir = ffmpeg_utils.escape_filter_path(utils.font_dir())
+    return f"ass=filename={filename}:fontsdir={fonts_dir}"
+
+
+def _bitmap_key(*args) -> str:
+    return hashlib.sha1(repr(args).encode("utf-8")).hexdigest()
+
+
+def _cache_get(key: str):
+    with _bitmap_cache_lock:
+        bitmap = _bitmap_cache.get(key)
+        if bitmap is not None:
+            _bitmap_cache.move_to_end(key)
+        return bitmap
+
+
+def _cache_put(key: str, bitmap: np.ndarray):
+    global _bitmap_cache_bytes
+    with _bitmap_cache_lock:
+        if key in _bitmap_cache:
+            return
+        _bitmap_cache[key] = bitmap
+        _bitmap_cache_bytes += bitmap.nbytes
+        while _bitmap_cache_bytes > _BITMAP_CACHE_MAX_BYTES and len(_bitmap_cache) > 1:
+            _, evicted = _bitmap_cache.popitem(last=False)
+            _bitmap_cache_bytes -= evicted.nbytes
+
+
+def _rgba(color: str, default=(255, 255, 255, 255)):
+    if not color:
+        return default
+    if color == "transparent":
+        return 0, 0, 0, 0
+    try:
+        rgba = ImageColor.getrgb(color)
+        return rgba if len(rgba) == 4 else rgba + (255,)
+    except ValueError:
+        logger.warning(f"不支持的颜色格式: {color}")
+        return default
+
+
+def render_subtitle(
+    text: str,
+    font_path: str,
+    font_size: int,
+    color: str,
+    stroke_color: str,
+    stroke_width: float,
+    max_width: float,
+    bg_color: str = "transparent",
+) -> np.ndarray:
+    """
+    在进程内使用 Pillow 将字幕折行并渲染为 RGBA 位图，不启动 ImageMagick 子进程
+    渲染结果按内容寻址缓存在内存和 storage/cache_subtitles 中，重复的字幕行和同一任务的重新渲染直接复用
+    Args:
+        text: 字幕文本
+        font_path: 字体文件路径
+        font_size: 字号
+        color: 文字颜色
+        stroke_color: 描边颜色
+        stroke_width: 描边宽度
+        max_width: 折行宽度
+        bg_color: 背景颜色，transparent 表示透明
+
+    Returns:
+        形如 (h, w, 4) 的 uint8 数组
+    """
+    key = _bitmap_key(text, font_path, font_size, color, stroke_color, stroke_width, int(max_width), bg_color)
+    bitmap = _cache_get(key)
+    if bitmap is not None:
+        return bitmap
+
+    cache_dir = utils.storage_dir("cache_subtitles", create=True)
+    cache_file = os.path.join(cache_dir, f"{key}.npy")
+    if os.path.isfile(cache_file):
+        try:
+            bitmap = np.load(cache_file)
+            # 更新修改时间，作为 LRU 淘汰的依据
+            os.utime(cache_file)
+            _cache_put(key, bitmap)
+            return bitmap
+        except Exception as e:
+            logger.warning(f"字幕缓存读取失败: {cache_file} => {str(e)}")
+
+    wrapped_txt, _ = wrap_text(text, max_width=max_width, font=font_path, fontsize=font_size)
+    font = load_font(font_path, font_size)
+    # ImageMagick 的描边以字形边缘为中心，向外只延伸一半宽度
+    stroke = int(round(stroke_width / 2)) if stroke_width else 0
+
+    measure = ImageDraw.Draw(Image.new("RGBA", (1, 1)))
+    left, top, right, bottom = measure.multiline_textbbox(
+        (0, 0), wrapped_txt, font=font, align="center", stroke_width=stroke
+    )
+    left, top = math.floor(left), math.floor(top)
+    width, height = max(math.ceil(right) - left, 1), max(math.ceil(bottom) - top, 1)
+
+    image = Image.new("RGBA", (width, height), _rgba(bg_color, (0, 0, 0, 0)))
+    draw = ImageDraw.Draw(image)
+    draw.multiline_text(
+        (-left, -top),
+        wrapped_txt,
+        font=font,
+        fill=_rgba(color),
+        align="center",
+        stroke_width=stroke,
+        stroke_fill=_rgba(stroke_color, (0, 0, 0, 255)),
+    )
+    bitmap = np.asarray(image, dtype=np.uint8)
+
+    _cache_put(key, bitmap)
+    try:
+        with ffmpeg_utils.atomic_output(cache_file) as tmp_file:
+            np.save(tmp_file, bitmap)
+    except Exception as e:
+        logger.warning(f"字幕缓存写入失败: {cache_file} => {str(e)}")
+    if next(_disk_writes) % _DISK_QUOTA_CHECK_WRITES == 1:
+        # 磁盘缓存按最近使用时间淘汰，配额通过 config.toml 中的 subtitle_cache_max_mb 设置
+        max_bytes = int(float(config.app.get("subtitle_cache_max_mb", 512)) * 1024 ** 2)
+        clip_cache.enforce_quota(cache_dir, max_bytes=max_bytes, prefix="", suffix=".npy")
+    return bitmap
+
+
+class SubtitleOverlay:
+    """
+    字幕叠加层，替代将所有字幕片段叠加到一个 CompositeVideoClip 中
+
+    CompositeVideoClip 每一帧都要遍历全部字幕图层，开销为 帧数 × 字幕条数。
+    这里将字幕位图按开始时间排序建立区间索引，每帧二分查找出当前显示的字幕，
+    只对字幕所在区域做整数 alpha 混合，写入预先分配的帧缓冲区
+    """
+
+    def __init__(self, width: int, height: int):
+        self.width = width
+        self.height = height
+        self._items = []
+        self._starts = []
+        self._max_ends = []
+        self._frame = None
+        self._scratch = None
+
+    def __len__(self):
+        return len(self._items)
+
+    def add(self, start: float, end: float, rgb: np.ndarray, alpha: np.ndarray, x: int, y: int):
+        """
+        添加一条字幕
+        Args:
+            start: 开始时间（秒）
+            end: 结束时间（秒）
+            rgb: 形如 (h, w, 3) 的 uint8 位图
+            alpha: 形如 (h, w) 的 uint8 透明度
+            x: 左上角横坐标，可以超出画面，超出部分会被裁剪
+            y: 左上角纵坐标
+        """
+        if end <= start:
+            return
+        h, w = rgb.shape[:2]
+        # 预先裁剪到画面范围内，混合时不再做边界判断
+        x1, y1 = max(x, 0), max(y, 0)
+        x2, y2 = min(x + w, self.width), min(y + h, self.height)
+        if x1 >= x2 or y1 >= y2:
+            return
+        rgb = np.ascontiguousarray(rgb[y1 - y:y2 - y, x1 - x:x2 - x, :3], dtype=np.uint8)
+        alpha = np.ascontiguousarray(alpha[y1 - y:y2 - y, x1 - x:x2 - x], dtype=np.uint8)[:, :, None]
+        item = (start, end, x1, y1, rgb, alpha, 255 - alpha)
+
+        index = bisect.bisect_right(self._starts, start)
+        self._starts.insert(index, start)
+        self._items.insert(index, item)
+        # 前缀最大结束时间，查询时据此提前结束向前扫描
+        self._max_ends = list(itertools.accumulate((i[1] for i in self._items), max))
+        self._scratch = None
+
+    def add_clip(self, clip):
+        """
+        从已设置起止时间和位置的字幕片段（TextClip/ImageClip）中提取位图并添加
+        """
+        rgb = clip.get_frame(0)
+        if clip.mask is not None:
+            alpha = np.round(clip.mask.get_frame(0) * 255)
+        else:
+            alpha = np.full(rgb.shape[:2], 255)
+        h, w = rgb.shape[:2]
+        # 与 moviepy 合成时的定位规则保持一致
+        x, y = clip.pos(0)
+        if x == "center":
+            x = (self.width - w) / 2
+        if y == "center":
+            y = (self.height - h) / 2
+        self.add(clip.start, clip.end, rgb, alpha.astype(np.uint8), int(x), int(y))
+
+    def active(self, t: float) -> list:
+        """
+        返回 t 时刻正在显示的字幕，按开始时间排序
+        """
+        result = []
+        index = bisect.bisect_right(self._starts, t) - 1
+        while index >= 0 and self._max_ends[index] > t:
+            item = self._items[index]
+            if item[1] > t:
+                result.append(item)
+            index -= 1
+        result.reverse()
+        return result
+
+    def apply(self, get_frame, t):
+        """
+        作为 clip.fl 的处理函数，将当前字幕混合到视频帧上
+        """
+        frame = get_frame(t)
+        items = self.active(t)
+        if not items:
+            return frame
+
+        if self._frame is None or self._frame.shape != frame.shape:
+            self._frame = np.empty(frame.shape, dtype=np.uint8)
+        np.copyto(self._frame, frame, casting="unsafe")
+        if self._scratch is None:
+            max_h = max(i[4].shape[0] for i in self._items)
+            max_w = max(i[4].shape[1] for i in self._items)
+            self._scratch = (
+                np.empty((max_h, max_w, 3), dtype=np.uint16),
+                np.empty((max_h, max_w, 3), dtype=np.uint16),
+            )
+
+        for _, _, x, y, rgb, alpha, inv_alpha in items:
+            h, w = rgb.shape[:2]
+            region = self._frame[y:y + h, x:x + w]
+            fg = self._scratch[0][:h, :w]
+            bg = self._scratch[1][:h, :w]
+            # (fg * a + bg * (255 - a) + 127) // 255
+            np.multiply(rgb, alpha, out=fg, dtype=np.uint16)
+            np.multiply(region, inv_alpha, out=bg, dtype=np.uint16)
+            fg += bg
+            fg += 127
+            np.floor_divide(fg, 255, out=fg)
+            np.copyto(region, fg, casting="unsafe")
+        return self._frame
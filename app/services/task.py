@@ -9,7 +9,9 @@ from loguru import logger
 from app.config import config
 from app.models import const
 from app.models.schema import VideoConcatMode, VideoParams, VideoClipParams
-from app.services import llm, material, subtitle, video, voice, audio_merger
+from app.services import llm, material, subtitle, video, voice, audio_merger, hls, proxy, scratch
+from app.services.cpu_budget import budget
+from app.services.render_progress import RenderProgress
 from app.services import state as sm
 from app.utils import utils
 
@@ -112,7 +114,11 @@ def generate_subtitle(task_id, params, video_script, sub_maker, audio_file):
             logger.warning("subtitle file not found, fallback to whisper")
 
     if subtitle_provider == "whisper" or subtitle_fallback:
-        subtitle.create(audio_file=audio_file, subtitle_file=subtitle_path)
+        subtitle.create(
+            audio_file=audio_file,
+            subtitle_file=subtitle_path,
+            cpu_threads=budget.grant(task_id)["whisper_threads"],
+        )
         logger.info("\n\n## correcting subtitle")
         subtitle.correct(subtitle_file=subtitle_path, video_script=video_script)
 
@@ -167,10 +173,16 @@ def generate_final_videos(
     )
 
     _progress = 50
+    # 按当前的 CPU 预算确定编码线程数
+    budget.apply(task_id, params)
+    if params.video_count > 1:
+        return generate_video_variants(task_id, params, downloaded_videos, audio_file, subtitle_path)
+
     for i in range(params.video_count):
         index = i + 1
+        # 合并视频先写入中间文件目录，成片生成后再移动到任务目录
         combined_video_path = path.join(
-            utils.task_dir(task_id), f"combined-{index}.mp4"
+            scratch.task_dir(task_id), f"combined-{index}.mp4"
         )
         logger.info(f"\n\n## combining video: {index} => {combined_video_path}")
         video.combine_videos(
@@ -181,6 +193,10 @@ def generate_final_videos(
             video_concat_mode=video_concat_mode,
             max_clip_duration=params.video_clip_duration,
             threads=params.n_threads,
+            encoder_profile=params.encoder_profile,
+            progress=RenderProgress(
+                task_id, f"combine-{index}", (_progress, _progress + 50 / params.video_count / 2), combined_video_path
+            ),
         )
 
         _progress += 50 / params.video_count / 2
@@ -195,18 +211,75 @@ def generate_final_videos(
             subtitle_path=subtitle_path,
             output_file=final_video_path,
             params=params,
+            progress=RenderProgress(
+                task_id, f"final-{index}", (_progress, _progress + 50 / params.video_count / 2), final_video_path
+            ),
         )
 
         _progress += 50 / params.video_count / 2
         sm.state.update_task(task_id, progress=_progress)
 
         final_video_paths.append(final_video_path)
-        combined_video_paths.append(combined_video_path)
+        combined_video_paths.append(scratch.publish(combined_video_path, utils.task_dir(task_id)))
+
+    return final_video_paths, combined_video_paths
+
+
+def generate_video_variants(
+        task_id, params, downloaded_videos, audio_file, subtitle_path
+):
+    """
+    生成多个随机顺序的视频：素材片段只编码一次，字幕只构建一次，各变体的成片并行编码
+    """
+    combined_video_paths = [
+        path.join(scratch.task_dir(task_id), f"combined-{i + 1}.mp4") for i in range(params.video_count)
+    ]
+    final_video_paths = [
+        path.join(utils.task_dir(task_id), f"final-{i + 1}.mp4") for i in range(params.video_count)
+    ]
+
+    logger.info(f"\n\n## combining {params.video_count} videos")
+    video.combine_video_variants(
+        combined_video_paths=combined_video_paths,
+        video_paths=downloaded_videos,
+        audio_file=audio_file,
+        video_aspect=params.video_aspect,
+        max_clip_duration=params.video_clip_duration,
+        threads=params.n_threads,
+        encoder_profile=params.encoder_profile,
+        progress=RenderProgress(task_id, "combine", (50, 75)),
+    )
+    sm.state.update_task(task_id, progress=75)
 
+    def progress_callback(done, total):
+        sm.state.update_task(task_id, progress=75 + 25 * done / total)
+
+    logger.info(f"\n\n## generating {params.video_count} videos")
+    # 合并阶段可能耗时较长，成片渲染前按最新的 CPU 预算重新确定编码线程数
+    budget.apply(task_id, params)
+    final_video_paths = video.generate_video_variants(
+        video_paths=combined_video_paths,
+        audio_path=audio_file,
+        subtitle_path=subtitle_path,
+        output_files=final_video_paths,
+        params=params,
+        progress_callback=progress_callback,
+    )
+    combined_video_paths = [
+        scratch.publish(combined_video_path, utils.task_dir(task_id))
+        for combined_video_path in combined_video_paths
+        if path.exists(combined_video_path)
+    ]
     return final_video_paths, combined_video_paths
 
 
 def start(task_id, params: VideoParams, stop_at: str = "video"):
+    # 中间文件写入 scratch 目录，任务结束（包括失败）后清理，只有成片等结果保留在任务目录
+    with scratch.task(task_id):
+        return _start(task_id, params, stop_at)
+
+
+def _start(task_id, params: VideoParams, stop_at: str = "video"):
     logger.info(f"start task: {task_id}, stop_at: {stop_at}")
     sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=5)
 
@@ -318,6 +391,9 @@ def start(task_id, params: VideoParams, stop_at: str = "video"):
         "subtitle_path": subtitle_path,
         "materials": downloaded_videos,
     }
+    if config.app.get("hls_enabled", False):
+        # 可选的后处理：打包为多码率 HLS，通过 /tasks 静态目录提供播放列表
+        kwargs["hls_playlists"] = hls.package_videos(final_video_paths)
     sm.state.update_task(
         task_id, state=const.TASK_STATE_COMPLETE, progress=100, **kwargs
     )
@@ -333,6 +409,12 @@ def start_subclip(task_id: str, params: VideoClipParams, subclip_path_videos: li
         subclip_path_videos: 视频文件路径
 
     """
+    # 中间文件写入 scratch 目录，任务结束（包括失败）后清理，只有成片等结果保留在任务目录
+    with scratch.task(task_id):
+        return _start_subclip(task_id, params, subclip_path_videos)
+
+
+def _start_subclip(task_id: str, params: VideoClipParams, subclip_path_videos: list):
     logger.info(f"\n\n## 开始任务: {task_id}")
     sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=5)
 
@@ -390,7 +472,11 @@ def start_subclip(task_id: str, params: VideoClipParams, subclip_path_videos: li
         subtitle_provider = config.app.get("subtitle_provider", "").strip().lower()
         logger.info(f"\n\n## 3. 生成字幕、提供程序是: {subtitle_provider}")
         # 使用 faster-whisper-large-v2 模型生成字幕
-        subtitle.create(audio_file=audio_file, subtitle_file=subtitle_path)
+        subtitle.create(
+            audio_file=audio_file,
+            subtitle_file=subtitle_path,
+            cpu_threads=budget.grant(task_id)["whisper_threads"],
+        )
 
         subtitle_lines = subtitle.file_to_subtitles(subtitle_path)
         if not subtitle_lines:
@@ -400,6 +486,15 @@ def start_subclip(task_id: str, params: VideoClipParams, subclip_path_videos: li
     sm.state.update_task(task_id, state=const.TASK_STATE_PROCESSING, progress=40)
 
     logger.info("\n\n## 4. 裁剪视频")
+    if proxy.enabled() and params.video_origin_path:
+        # 预览阶段的片段来自低分辨率代理视频，最终渲染改用原视频重新裁剪
+        logger.info(f"从原视频重新裁剪片段: {params.video_origin_path}")
+        subclip_path_videos = material.clip_videos(
+            task_id=task_id,
+            timestamp_terms=list(subclip_path_videos.keys()),
+            origin_video=params.video_origin_path,
+            encoder_profile=params.encoder_profile,
+        )
     subclip_videos = [x for x in subclip_path_videos.values()]
     logger.debug(f"\n\n## 裁剪后的视频文件列表: \n{subclip_videos}")
 
@@ -416,16 +511,22 @@ def start_subclip(task_id: str, params: VideoClipParams, subclip_path_videos: li
 
     _progress = 50
     index = 1
-    combined_video_path = path.join(utils.task_dir(task_id), f"combined.mp4")
+    combined_video_path = path.join(scratch.task_dir(task_id), f"combined.mp4")
     logger.info(f"\n\n## 5. 合并视频: => {combined_video_path}")
 
-    video.combine_clip_videos(
+    # 按当前的 CPU 预算确定编码线程数
+    budget.apply(task_id, params)
+    # 不保存 combined.mp4 时不重新编码合并视频（可以流复制时仍流复制合并），由最后一步直接渲染，避免两次有损编码
+    video_source = video.combine_clip_videos(
         combined_video_path=combined_video_path,
         video_paths=subclip_videos,
         video_ost_list=video_ost,
         list_script=list_script,
         video_aspect=params.video_aspect,
-        threads=params.n_threads  # 多线程
+        threads=params.n_threads,  # 多线程
+        edl_only=not params.save_combined_video,
+        encoder_profile=params.encoder_profile,
+        progress=RenderProgress(task_id, "combine", (_progress, _progress + 50 / 2), combined_video_path),
     )
 
     _progress += 50 / 2
@@ -434,20 +535,23 @@ def start_subclip(task_id: str, params: VideoClipParams, subclip_path_videos: li
     final_video_path = path.join(utils.task_dir(task_id), f"final-{index}.mp4")
 
     logger.info(f"\n\n## 6. 最后一步: {index} => {final_video_path}")
+    budget.apply(task_id, params)
     # 把所有东西合到在一起
     video.generate_video_v2(
-        video_path=combined_video_path,
+        video_path=video_source,
         audio_path=audio_file,
         subtitle_path=subtitle_path,
         output_file=final_video_path,
         params=params,
+        progress=RenderProgress(task_id, f"final-{index}", (_progress, _progress + 50 / 2), final_video_path),
     )
 
     _progress += 50 / 2
     sm.state.update_task(task_id, progress=_progress)
 
     final_video_paths.append(final_video_path)
-    combined_video_paths.append(combined_video_path)
+    if params.save_combined_video:
+        combined_video_paths.append(scratch.publish(combined_video_path, utils.task_dir(task_id)))
 
     logger.success(f"任务 {task_id} 已完成, 生成 {len(final_video_paths)} 个视频.")
 
@@ -455,6 +559,9 @@ def start_subclip(task_id: str, params: VideoClipParams, subclip_path_videos: li
         "videos": final_video_paths,
         "combined_videos": combined_video_paths
     }
+    if config.app.get("hls_enabled", False):
+        # 可选的后处理：打包为多码率 HLS，通过 /tasks 静态目录提供播放列表
+        kwargs["hls_playlists"] = hls.package_videos(final_video_paths)
     sm.state.update_task(task_id, state=const.TASK_STATE_COMPLETE, progress=100, **kwargs)
     return kwargs
 
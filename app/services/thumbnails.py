@@ -0,0 +1,137 @@
+import os
+import json
+import subprocess
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from loguru import logger
+
+from app.services import probe
+from app.utils import utils, ffmpeg_utils
+
+# 每个片段的雪碧图帧数，中间一帧作为缩略图
+SPRITE_FRAMES = 5
+THUMB_WIDTH = 240
+
+
+def index_files(task_id: str) -> Tuple[str, str]:
+    """
+    任务的缩略图索引：帧数据（.npy，按内存映射读取）和 片段 => 行号 的映射（.json）
+    """
+    task_dir = utils.task_dir(task_id)
+    return os.path.join(task_dir, "thumbnails.npy"), os.path.join(task_dir, "thumbnails.json")
+
+
+def create_index(task_id: str, keys: List[str], origin_video: str) -> np.memmap:
+    """
+    创建空的缩略图索引，每个片段占一行，形状为 (片段数, SPRITE_FRAMES, 高, 宽, 3)
+    各行可以由多个线程并行写入
+    Args:
+        task_id: 任务 id
+        keys: 片段标识，如时间戳
+        origin_video: 原视频或片段，用于确定缩略图的宽高比
+
+    Returns:
+        可写的内存映射数组
+    """
+    info = probe.media_info(origin_video)
+    width = THUMB_WIDTH
+    height = max(int(round(width * info.height / info.width / 2)) * 2, 2) if info.width else width * 9 // 16
+    data_file, keys_file = index_files(task_id)
+    index = np.lib.format.open_memmap(
+        data_file, mode="w+", dtype=np.uint8, shape=(len(keys), SPRITE_FRAMES, height, width, 3)
+    )
+    with open(keys_file, "w", encoding="utf-8") as f:
+        json.dump({key: row for row, key in enumerate(keys)}, f, ensure_ascii=False)
+    return index
+
+
+def extract_frames(video_path: str, width: int, height: int, count: int = SPRITE_FRAMES) -> np.ndarray:
+    """
+    在片段中均匀抽取 count 帧，缩放并补黑边到 width x height
+    """
+    duration = probe.media_info(video_path).duration or 1
+    cmd = [
+        ffmpeg_utils.ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error",
+        "-i", video_path,
+        "-an",
+        "-vf",
+        f"fps={count / duration:.6f},"
+        f"scale={width}:{height}:force_original_aspect_ratio=decrease:flags=area,"
+        f"pad={width}:{height}:(ow-iw)/2:(oh-ih)/2",
+        "-frames:v", str(count),
+        "-f", "rawvideo", "-pix_fmt", "rgb24", "-",
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    frame_size = width * height * 3
+    available = len(result.stdout) // frame_size
+    frames = np.zeros((count, height, width, 3), dtype=np.uint8)
+    if available:
+        decoded = np.frombuffer(result.stdout[:available * frame_size], dtype=np.uint8)
+        frames[:available] = decoded.reshape(available, height, width, 3)
+        # 片段过短时用最后一帧补齐
+        frames[available:] = frames[available - 1]
+    return frames
+
+
+def write(index: np.memmap, row: int, video_path: str):
+    """
+    生成片段的雪碧图帧并写入索引的指定行
+    """
+    _, _, height, width, _ = index.shape
+    try:
+        index[row] = extract_frames(video_path, width, height, index.shape[1])
+    except Exception as e:
+        logger.warning(f"生成缩略图失败: {video_path} => {str(e)}")
+
+
+def build_index(task_id: str, clips: Dict[str, str], workers: int = 1):
+    """
+    为裁剪好的片段生成任务的缩略图索引，供 webui 的 Video Check 面板使用
+    各片段的抽帧在线程池中并行执行（解码在 ffmpeg 子进程中进行），失败时只记录警告
+    Args:
+        task_id: 任务 id
+        clips: 片段标识 => 片段路径，如 clip_videos 的返回值
+        workers: 并行抽帧数
+    """
+    if not clips:
+        return
+    try:
+        # 片段与原视频的宽高比相同，以第一个片段确定缩略图尺寸
+        index = create_index(task_id, list(clips), next(iter(clips.values())))
+        with ThreadPoolExecutor(max_workers=max(workers, 1)) as executor:
+            for row, video_path in enumerate(clips.values()):
+                executor.submit(write, index, row, video_path)
+        index.flush()
+    except Exception as e:
+        logger.warning(f"创建缩略图索引失败: {str(e)}")
+
+
+def load_index(task_id: str) -> Optional[Tuple[np.memmap, Dict[str, int]]]:
+    """
+    以只读内存映射方式打开任务的缩略图索引，只有实际访问的行才会从磁盘读取
+    Returns:
+        (帧数据, 片段 => 行号)，索引不存在时返回 None
+    """
+    if not task_id:
+        return None
+    data_file, keys_file = index_files(task_id)
+    if not (os.path.isfile(data_file) and os.path.isfile(keys_file)):
+        return None
+    try:
+        with open(keys_file, "r", encoding="utf-8") as f:
+            keys = json.load(f)
+        return np.load(data_file, mmap_mode="r"), keys
+    except Exception as e:
+        logger.warning(f"读取缩略图索引失败: {data_file} => {str(e)}")
+        return None
+
+
+def sprite(index: np.ndarray, row: int) -> np.ndarray:
+    """
+    将一行的各帧横向拼接为雪碧图
+    """
+    frames = np.asarray(index[row])
+    count, height, width, channels = frames.shape
+    return frames.transpose(1, 0, 2, 3).reshape(height, count * width, channels)
@@ -1,18 +1,37 @@
 import re
 import os
 import glob
+import math
 import random
+import multiprocessing
+from contextlib import contextmanager
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor, as_completed, wait
 from typing import List
 from typing import Union
 
+import cv2
+import numpy as np
+import proglog
 from loguru import logger
 from moviepy.editor import *
-from moviepy.video.tools.subtitles import SubtitlesClip
-from PIL import ImageFont
+from moviepy.video.tools.subtitles import file_to_subtitles
+from PIL import Image, ImageFont
 
+from app.config import config
 from app.models import const
-from app.models.schema import MaterialInfo, VideoAspect, VideoConcatMode, VideoParams, VideoClipParams
-from app.utils import utils
+from app.models.schema import (
+    EditDecision, EncoderProfile, MaterialInfo, VideoAspect, VideoConcatMode, VideoParams, VideoClipParams
+)
+from app.services import image_clip, mezzanine, probe, reader_pool, scratch, subtitle_render
+from app.services.render_progress import RenderProgress
+from app.utils import utils, ffmpeg_utils
+
+# 分段并行渲染时的关键帧间隔（秒），分段边界按该间隔对齐
+_CHUNK_GOP_SECONDS = 2
+# 分片 MP4 的关键帧间隔（秒），每个关键帧开始一个新分片
+_FRAGMENT_SECONDS = 2
+# 成片仍在写入时存在的标记文件后缀，/stream 接口据此按增长中的文件处理
+RENDERING_SUFFIX = ".rendering"
 
 
 def get_bgm_file(bgm_type: str = "random", bgm_file: str = ""):
@@ -31,6 +50,192 @@ def get_bgm_file(bgm_type: str = "random", bgm_file: str = ""):
     return ""
 
 
+def encoder_kwargs(encoder_profile: str, ffmpeg_params: list = None, progressive: bool = False) -> dict:
+    """
+    根据编码配置生成 write_videofile 的编码参数
+    Args:
+        encoder_profile: 编码配置名称，参见 EncoderProfile
+        ffmpeg_params: 额外的 ffmpeg 参数，如字幕滤镜
+        progressive: 是否为成片，config.toml 中开启 fragmented_output 时输出分片 MP4
+
+    Returns:
+        preset、audio_bitrate 和 ffmpeg_params
+    """
+    settings = EncoderProfile(encoder_profile or EncoderProfile.standard.value).to_settings()
+    params = ["-crf", str(settings["crf"]), *(ffmpeg_params or [])]
+    if progressive and config.app.get("fragmented_output", False):
+        # moov 写在文件开头，之后每个关键帧追加一个 moof+mdat 分片，文件写入过程中即可播放
+        params += [
+            "-movflags", "+frag_keyframe+empty_moov+default_base_moof",
+            "-force_key_frames", f"expr:gte(t,n_forced*{_FRAGMENT_SECONDS})",
+        ]
+    return {
+        "preset": settings["preset"],
+        "audio_bitrate": settings["audio_bitrate"],
+        "ffmpeg_params": params,
+    }
+
+
+@contextmanager
+def rendering(output_file: str):
+    """
+    成片写入期间创建标记文件，写入结束（包括失败）后删除
+    """
+    marker = f"{output_file}{RENDERING_SUFFIX}"
+    with open(marker, "w") as f:
+        f.write(str(os.getpid()))
+    try:
+        yield
+    finally:
+        if os.path.exists(marker):
+            os.remove(marker)
+
+
+def is_rendering(output_file: str) -> bool:
+    """
+    成片是否仍在写入
+    """
+    return os.path.exists(f"{output_file}{RENDERING_SUFFIX}")
+
+
+def scaled_resolution(video_aspect: VideoAspect, encoder_profile: str):
+    """
+    根据视频比例和编码配置计算输出分辨率
+    Returns:
+        (video_width, video_height, scale)
+    """
+    video_width, video_height = VideoAspect(video_aspect).to_resolution()
+    scale = EncoderProfile(encoder_profile or EncoderProfile.standard.value).to_settings()["scale"]
+    if scale != 1:
+        video_width = ffmpeg_utils.even(video_width * scale)
+        video_height = ffmpeg_utils.even(video_height * scale)
+    return video_width, video_height, scale
+
+
+def render_params(params: Union[VideoParams, VideoClipParams]):
+    """
+    根据编码配置计算输出分辨率，分辨率缩小时字号和描边同比缩小
+    Returns:
+        (params, video_width, video_height)，缩放时返回参数的副本
+    """
+    video_width, video_height, scale = scaled_resolution(params.video_aspect, params.encoder_profile)
+    if scale == 1:
+        return params, video_width, video_height
+    params = params.model_copy(update={
+        "font_size": max(int(round(params.font_size * scale)), 1),
+        "stroke_width": params.stroke_width * scale,
+    })
+    return params, video_width, video_height
+
+
+def _split_segments(video_paths: List[str], max_clip_duration: int, video_concat_mode: VideoConcatMode) -> list:
+    """
+    只根据时长把素材切分为 (源视频, 起始时间, 结束时间)，不打开解码器
+    """
+    raw_segments = []
+    for video_path in video_paths:
+        clip_duration = probe.media_info(video_path).duration
+        start_time = 0
+
+        while start_time < clip_duration:
+            end_time = min(start_time + max_clip_duration, clip_duration)
+            raw_segments.append((video_path, start_time, end_time))
+            start_time = end_time
+            if video_concat_mode.value == VideoConcatMode.sequential.value:
+                break
+    return raw_segments
+
+
+def _fill_timeline(raw_segments: list, audio_duration: float, req_dur: float, max_clip_duration: int,
+                   trim_last: bool = True) -> list:
+    """
+    循环使用素材片段直到覆盖音频时长
+    Returns:
+        [(源视频, 起始时间, 时长)]，trim_last 为 False 时最后一个片段不按剩余时长截断
+    """
+    timeline = []
+    video_duration = 0
+    # Add downloaded clips over and over until the duration of the audio (max_duration) has been reached
+    while video_duration < audio_duration and raw_segments:
+        for video_path, start_time, end_time in raw_segments:
+            if video_duration >= audio_duration:
+                break
+            duration = end_time - start_time
+            # Check if clip is longer than the remaining audio
+            if trim_last and (audio_duration - video_duration) < duration:
+                duration = audio_duration - video_duration
+            # Only shorten clips if the calculated clip length (req_dur) is shorter than the actual clip to prevent still image
+            elif req_dur < duration:
+                duration = req_dur
+            duration = min(duration, max_clip_duration)
+            timeline.append((video_path, start_time, duration))
+            video_duration += duration
+    return timeline
+
+
+def _fit_transform(video_path: str, video_width: int, video_height: int):
+    """
+    素材尺寸与输出尺寸不一致时返回逐帧缩放函数，否则返回 None
+    """
+    info = probe.media_info(video_path)
+
+    # Not all videos are same size, so we need to resize them
+    clip_w, clip_h = info.width, info.height
+    if clip_w == video_width and clip_h == video_height:
+        return None
+
+    new_width, new_height = ffmpeg_utils.fit_size(clip_w, clip_h, video_width, video_height)
+    logger.info(
+        f"resizing video to {video_width} x {video_height}, clip size: {clip_w} x {clip_h}"
+    )
+    # 缩放在取帧时完成，对片段调用 resize/fl_image 会立即解码第一帧
+    return letterbox_frame(new_width, new_height, video_width, video_height)
+
+
+def concat_mezzanine(output_file: str, timeline: list, video_width: int, video_height: int,
+                     duration: float = 0) -> bool:
+    """
+    时间线中的片段全部来自目标分辨率的标准化素材且入点落在关键帧上时，
+    使用 concat demuxer 的 inpoint/outpoint 直接流复制拼接，不解码也不重新编码
+    Args:
+        output_file: 输出路径（不含音轨）
+        timeline: [(源视频, 起始时间, 时长)]
+        video_width: 输出宽度
+        video_height: 输出高度
+        duration: 截断到指定时长，0 表示不截断
+
+    Returns:
+        是否拼接成功，失败时调用方应回退到逐帧渲染
+    """
+    if not timeline or not all(mezzanine.is_mezzanine(path, video_width, video_height) for path, _, _ in timeline):
+        return False
+    try:
+        for path, start_time, _ in timeline:
+            if not any(abs(start_time - t) < 0.001 for t in probe.keyframes(path)):
+                logger.info(f"片段入点不在关键帧上，无法流复制: {path} {start_time}")
+                return False
+        args = [
+            "-f", "concat",
+            "-safe", "0",
+            "-protocol_whitelist", "file,pipe",
+            "-i", "pipe:0",
+        ]
+        if duration:
+            args += ["-t", f"{duration:.6f}"]
+        args += ["-map", "0:v:0", "-c", "copy", output_file]
+        ffmpeg_utils.run_ffmpeg(args, input_data=ffmpeg_utils.concat_list(
+            [path for path, _, _ in timeline],
+            [(start_time, start_time + length) for _, start_time, length in timeline],
+        ))
+    except Exception as e:
+        logger.warning(f"标准化素材流复制拼接失败，回退到重新编码: {ffmpeg_utils.ffmpeg_error_text(e)}")
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        return False
+    logger.info(f"标准化素材流复制拼接: {len(timeline)} 个片段 => {output_file}")
+    return True
+
+
 def combine_videos(
     combined_video_path: str,
     video_paths: List[str],
@@ -39,167 +244,297 @@ def combine_videos(
     video_concat_mode: VideoConcatMode = VideoConcatMode.random,
     max_clip_duration: int = 5,
     threads: int = 2,
+    encoder_profile: str = EncoderProfile.standard.value,
+    progress: RenderProgress = None,
 ) -> str:
-    audio_clip = AudioFileClip(audio_file)
-    audio_duration = audio_clip.duration
+    audio_duration = probe.media_info(audio_file).duration
     logger.info(f"max duration of audio: {audio_duration} seconds")
     # Required duration of each clip
     req_dur = audio_duration / len(video_paths)
     req_dur = max_clip_duration
     logger.info(f"each clip will be maximum {req_dur} seconds long")
-    output_dir = os.path.dirname(combined_video_path)
+    # moviepy 的临时音频写入中间文件目录
+    output_dir = scratch.work_dir(os.path.dirname(combined_video_path))
 
-    aspect = VideoAspect(video_aspect)
-    video_width, video_height = aspect.to_resolution()
+    # 直接按成片分辨率合并，草稿模式下不再先以全分辨率编码
+    video_width, video_height, _ = scaled_resolution(video_aspect, encoder_profile)
 
     clips = []
-    video_duration = 0
-
-    raw_clips = []
-    for video_path in video_paths:
-        clip = VideoFileClip(video_path).without_audio()
-        clip_duration = clip.duration
-        start_time = 0
 
-        while start_time < clip_duration:
-            end_time = min(start_time + max_clip_duration, clip_duration)
-            split_clip = clip.subclip(start_time, end_time)
-            raw_clips.append(split_clip)
-            # logger.info(f"splitting from {start_time:.2f} to {end_time:.2f}, clip duration {clip_duration:.2f}, split_clip duration {split_clip.duration:.2f}")
-            start_time = end_time
-            if video_concat_mode.value == VideoConcatMode.sequential.value:
-                break
+    raw_segments = _split_segments(video_paths, max_clip_duration, video_concat_mode)
 
     # random video_paths order
     if video_concat_mode.value == VideoConcatMode.random.value:
-        random.shuffle(raw_clips)
-
-    # Add downloaded clips over and over until the duration of the audio (max_duration) has been reached
-    while video_duration < audio_duration:
-        for clip in raw_clips:
-            # Check if clip is longer than the remaining audio
-            if (audio_duration - video_duration) < clip.duration:
-                clip = clip.subclip(0, (audio_duration - video_duration))
-            # Only shorten clips if the calculated clip length (req_dur) is shorter than the actual clip to prevent still image
-            elif req_dur < clip.duration:
-                clip = clip.subclip(0, req_dur)
-            clip = clip.set_fps(30)
-
-            # Not all videos are same size, so we need to resize them
-            clip_w, clip_h = clip.size
-            if clip_w != video_width or clip_h != video_height:
-                clip_ratio = clip.w / clip.h
-                video_ratio = video_width / video_height
-
-                if clip_ratio == video_ratio:
-                    # 等比例缩放
-                    clip = clip.resize((video_width, video_height))
-                else:
-                    # 等比缩放视频
-                    if clip_ratio > video_ratio:
-                        # 按照目标宽度等比缩放
-                        scale_factor = video_width / clip_w
-                    else:
-                        # 按照目标高度等比缩放
-                        scale_factor = video_height / clip_h
-
-                    new_width = int(clip_w * scale_factor)
-                    new_height = int(clip_h * scale_factor)
-                    clip_resized = clip.resize(newsize=(new_width, new_height))
-
-                    background = ColorClip(
-                        size=(video_width, video_height), color=(0, 0, 0)
-                    )
-                    clip = CompositeVideoClip(
-                        [
-                            background.set_duration(clip.duration),
-                            clip_resized.set_position("center"),
-                        ]
-                    )
-
-                logger.info(
-                    f"resizing video to {video_width} x {video_height}, clip size: {clip_w} x {clip_h}"
-                )
-
-            if clip.duration > max_clip_duration:
-                clip = clip.subclip(0, max_clip_duration)
+        random.shuffle(raw_segments)
+        # 同一源视频的片段按时间先后读取，避免解码器来回跳转
+        raw_segments = reader_pool.seek_ordered(raw_segments)
+
+    timeline = _fill_timeline(raw_segments, audio_duration, req_dur, max_clip_duration)
+
+    # 素材已标准化为目标分辨率时直接流复制拼接
+    if concat_mezzanine(combined_video_path, timeline, video_width, video_height):
+        logger.success("completed")
+        return combined_video_path
+
+    pool = reader_pool.ReaderPool()
+    pool.plan(timeline)
+    for index, (video_path, start_time, duration) in enumerate(timeline):
+        transform = _fit_transform(video_path, video_width, video_height)
+        clip = pool.clip(
+            index, video_path, start_time, duration,
+            size=(video_width, video_height) if transform else None, transform=transform,
+        )
+        clip = clip.set_fps(30)
 
-            clips.append(clip)
-            video_duration += clip.duration
+        clips.append(clip)
 
-    video_clip = concatenate_videoclips(clips)
-    video_clip = video_clip.set_fps(30)
-    logger.info("writing")
-    # https://github.com/harry0703/NarratoAI/issues/111#issuecomment-2032354030
-    video_clip.write_videofile(
-        filename=combined_video_path,
-        threads=threads,
-        logger=None,
-        temp_audiofile_path=output_dir,
-        audio_codec="aac",
-        fps=30,
-    )
-    video_clip.close()
+    try:
+        video_clip = concatenate_videoclips(clips)
+        video_clip = video_clip.set_fps(30)
+        logger.info("writing")
+        # https://github.com/harry0703/NarratoAI/issues/111#issuecomment-2032354030
+        video_clip.write_videofile(
+            filename=combined_video_path,
+            threads=threads,
+            logger=progress,
+            temp_audiofile_path=output_dir,
+            audio_codec="aac",
+            fps=30,
+            **encoder_kwargs(encoder_profile),
+        )
+        video_clip.close()
+        if progress:
+            progress.finish()
+    finally:
+        pool.close()
     logger.success("completed")
     return combined_video_path
 
 
-def wrap_text(text, max_width, font="Arial", fontsize=60):
-    # 创建字体对象
-    font = ImageFont.truetype(font, fontsize)
+def combine_video_variants(
+    combined_video_paths: List[str],
+    video_paths: List[str],
+    audio_file: str,
+    video_aspect: VideoAspect = VideoAspect.portrait,
+    max_clip_duration: int = 5,
+    threads: int = 2,
+    encoder_profile: str = EncoderProfile.standard.value,
+    progress: RenderProgress = None,
+) -> List[str]:
+    """
+    一次生成多个随机顺序的合并视频
+    每个用到的素材片段只解码、缩放、编码一次，各个变体按各自的随机顺序对这些片段流复制拼接
+    Args:
+        combined_video_paths: 各个变体的输出路径
+        video_paths: 素材视频路径
+        audio_file: 配音文件，决定合并视频的时长
+        video_aspect: 视频比例
+        max_clip_duration: 单个片段的最大时长
+        threads: 编码线程数
+        encoder_profile: 编码配置
+        progress: 渲染进度，按共用片段的编码帧数推进
+
+    Returns:
+        合并视频路径列表
+    """
+    audio_duration = probe.media_info(audio_file).duration
+    logger.info(f"max duration of audio: {audio_duration} seconds, variants: {len(combined_video_paths)}")
+    # 片段直接按成片分辨率编码，生成成片时无需再次缩放
+    video_width, video_height, _ = scaled_resolution(video_aspect, encoder_profile)
+    raw_segments = _split_segments(video_paths, max_clip_duration, VideoConcatMode.random)
+
+    # 最后一个片段不截断，拼接时统一按音频时长截断，使所有变体共用同一批片段文件
+    timelines = []
+    for _ in combined_video_paths:
+        shuffled = random.sample(raw_segments, len(raw_segments))
+        timelines.append(_fill_timeline(shuffled, audio_duration, max_clip_duration, max_clip_duration, trim_last=False))
+
+    # 素材已标准化为成片分辨率时，各变体直接从标准化素材流复制拼接；
+    # 逐个尝试，只有无法流复制的变体才编码共用片段
+    pending = [
+        (combined_video_path, timeline)
+        for combined_video_path, timeline in zip(combined_video_paths, timelines)
+        if not concat_mezzanine(combined_video_path, timeline, video_width, video_height, duration=audio_duration)
+    ]
+    if not pending:
+        if progress:
+            progress.finish()
+        logger.success("completed")
+        return combined_video_paths
+
+    # 按源视频和起始时间排序，每个解码器只向后读取
+    segments = sorted({segment for _, timeline in pending for segment in timeline})
+    segment_dir = os.path.join(scratch.work_dir(os.path.dirname(combined_video_paths[0])), "segments")
+    os.makedirs(segment_dir, exist_ok=True)
+    segment_files = {}
+    if progress:
+        progress.begin(sum(duration for _, _, duration in segments))
+    encoded_frames = 0
+    pool = reader_pool.ReaderPool()
+    pool.plan(segments)
+    try:
+        for index, (video_path, start_time, duration) in enumerate(segments):
+            transform = _fit_transform(video_path, video_width, video_height)
+            clip = pool.clip(
+                index, video_path, start_time, duration,
+                size=(video_width, video_height) if transform else None, transform=transform,
+            )
+            segment_file = os.path.join(segment_dir, f"segment-{index}.mp4")
+            # 所有片段使用相同的编码参数，拼接时可以直接流复制
+            clip.set_fps(30).write_videofile(
+                segment_file,
+                threads=threads,
+                logger=None,
+                audio=False,
+                fps=30,
+                **encoder_kwargs(encoder_profile),
+            )
+            segment_files[(video_path, start_time, duration)] = segment_file
+            encoded_frames += int(duration * 30)
+            if progress:
+                progress.update(encoded_frames)
+    finally:
+        pool.close()
+    logger.info(f"encoded {len(segments)} shared segments for {len(pending)} variants")
+
+    try:
+        for combined_video_path, timeline in pending:
+            ffmpeg_utils.run_ffmpeg([
+                "-f", "concat",
+                "-safe", "0",
+                "-protocol_whitelist", "file,pipe",
+                "-i", "pipe:0",
+                "-t", f"{audio_duration:.6f}",
+                "-c", "copy",
+                combined_video_path,
+            ], input_data=ffmpeg_utils.concat_list([segment_files[segment] for segment in timeline]))
+            logger.info(f"combined variant: {combined_video_path}")
+    finally:
+        for segment_file in segment_files.values():
+            if os.path.exists(segment_file):
+                os.remove(segment_file)
+        if not os.listdir(segment_dir):
+            os.rmdir(segment_dir)
+    if progress:
+        progress.finish()
+    logger.success("completed")
+    return combined_video_paths
+
 
-    def get_text_size(inner_text):
-        inner_text = inner_text.strip()
-        left, top, right, bottom = font.getbbox(inner_text)
-        return right - left, bottom - top
+def subtitle_font_path(params: Union[VideoParams, VideoClipParams]) -> str:
+    """
+    字幕字体文件路径，未启用字幕时返回空字符串
+    """
+    if not params.subtitle_enabled:
+        return ""
+    if not params.font_name:
+        params.font_name = "STHeitiMedium.ttc"
+    font_path = os.path.join(utils.font_dir(), params.font_name)
+    if os.name == "nt":
+        font_path = font_path.replace("\\", "/")
+    logger.info(f"使用字体: {font_path}")
+    return font_path
 
-    width, height = get_text_size(text)
-    if width <= max_width:
-        return text, height
 
-    # logger.warning(f"wrapping text, max_width: {max_width}, text_width: {width}, text: {text}")
+def create_text_clip(
+    subtitle_item,
+    params: Union[VideoParams, VideoClipParams],
+    font_path: str,
+    video_width: int,
+    video_height: int,
+):
+    """
+    为一条字幕生成字幕片段，并按字幕时间和 subtitle_position 设置起止时间和位置
+    Args:
+        subtitle_item: file_to_subtitles 返回的 ((start, end), text)
+        params: 视频参数（已按 render_params 缩放）
+        font_path: 字体文件路径
+        video_width: 视频宽度
+        video_height: 视频高度
+    """
+    phrase = subtitle_item[1]
+    max_width = video_width * 0.9
+    if params.subtitle_renderer == "pillow":
+        # 进程内渲染字幕位图，不启动 ImageMagick
+        _clip = ImageClip(subtitle_render.render_subtitle(
+            phrase,
+            font_path=font_path,
+            font_size=params.font_size,
+            color=params.text_fore_color,
+            stroke_color=params.stroke_color,
+            stroke_width=params.stroke_width,
+            max_width=max_width,
+            bg_color=params.text_background_color,
+        ))
+    else:
+        wrapped_txt, txt_height = subtitle_render.wrap_text(
+            phrase, max_width=max_width, font=font_path, fontsize=params.font_size
+        )
+        _clip = TextClip(
+            wrapped_txt,
+            font=font_path,
+            fontsize=params.font_size,
+            color=params.text_fore_color,
+            bg_color=params.text_background_color,
+            stroke_color=params.stroke_color,
+            stroke_width=params.stroke_width,
+            print_cmd=False,
+        )
+    duration = subtitle_item[0][1] - subtitle_item[0][0]
+    _clip = _clip.set_start(subtitle_item[0][0])
+    _clip = _clip.set_end(subtitle_item[0][1])
+    _clip = _clip.set_duration(duration)
+    if params.subtitle_position == "bottom":
+        _clip = _clip.set_position(("center", video_height * 0.95 - _clip.h))
+    elif params.subtitle_position == "top":
+        _clip = _clip.set_position(("center", video_height * 0.05))
+    elif params.subtitle_position == "custom":
+        # 确保字幕完全在屏幕内
+        margin = 10  # 额外的边距，单位为像素
+        max_y = video_height - _clip.h - margin
+        min_y = margin
+        custom_y = (video_height - _clip.h) * (params.custom_position / 100)
+        custom_y = max(min_y, min(custom_y, max_y))  # 限制 y 值在有效范围内
+        _clip = _clip.set_position(("center", custom_y))
+    else:  # center
+        _clip = _clip.set_position(("center", "center"))
+    return _clip
+
+
+def build_subtitles(
+    subtitle_path: str,
+    ass_path: str,
+    params: Union[VideoParams, VideoClipParams],
+    video_width: int,
+    video_height: int,
+):
+    """
+    构建字幕，多个视频共用同一份字幕时只需构建一次
+    Args:
+        subtitle_path: 字幕文件路径
+        ass_path: ass 渲染器生成的 .ass 文件路径
+        params: 视频参数（已按 render_params 缩放）
+        video_width: 视频宽度
+        video_height: 视频高度
 
-    processed = True
+    Returns:
+        (ffmpeg_params, text_clips)：ass 渲染器返回字幕滤镜参数，其他渲染器返回字幕片段
+    """
+    font_path = subtitle_font_path(params)
 
-    _wrapped_lines_ = []
-    words = text.split(" ")
-    _txt_ = ""
-    for word in words:
-        _before = _txt_
-        _txt_ += f"{word} "
-        _width, _height = get_text_size(_txt_)
-        if _width <= max_width:
-            continue
-        else:
-            if _txt_.strip() == word.strip():
-                processed = False
-                break
-            _wrapped_lines_.append(_before)
-            _txt_ = f"{word} "
-    _wrapped_lines_.append(_txt_)
-    if processed:
-        _wrapped_lines_ = [line.strip() for line in _wrapped_lines_]
-        result = "\n".join(_wrapped_lines_).strip()
-        height = len(_wrapped_lines_) * height
-        # logger.warning(f"wrapped text: {result}")
-        return result, height
-
-    _wrapped_lines_ = []
-    chars = list(text)
-    _txt_ = ""
-    for word in chars:
-        _txt_ += word
-        _width, _height = get_text_size(_txt_)
-        if _width <= max_width:
-            continue
-        else:
-            _wrapped_lines_.append(_txt_)
-            _txt_ = ""
-    _wrapped_lines_.append(_txt_)
-    result = "\n".join(_wrapped_lines_).strip()
-    height = len(_wrapped_lines_) * height
-    # logger.warning(f"wrapped text: {result}")
-    return result, height
+    ffmpeg_params = None
+    text_clips = []
+    if subtitle_path and os.path.exists(subtitle_path) and params.subtitle_renderer == "ass":
+        subtitle_render.srt_to_ass(
+            subtitle_path, ass_path, font_path, params, video_width, video_height
+        )
+        ffmpeg_params = ["-vf", subtitle_render.ass_filter(ass_path)]
+    elif subtitle_path and os.path.exists(subtitle_path):
+        # 只解析字幕文件，SubtitlesClip 在初始化时会用默认样式额外渲染一次 TextClip
+        subtitle_items = file_to_subtitles(subtitle_path, encoding="utf-8")
+        for item in subtitle_items:
+            text_clips.append(create_text_clip(item, params, font_path, video_width, video_height))
+    return ffmpeg_params, text_clips
 
 
 def generate_video(
@@ -208,9 +543,10 @@ def generate_video(
     subtitle_path: str,
     output_file: str,
     params: Union[VideoParams, VideoClipParams],
+    subtitles: tuple = None,
+    progress: RenderProgress = None,
 ):
-    aspect = VideoAspect(params.video_aspect)
-    video_width, video_height = aspect.to_resolution()
+    params, video_width, video_height = render_params(params)
 
     logger.info(f"start, video size: {video_width} x {video_height}")
     logger.info(f"  ① video: {video_path}")
@@ -218,64 +554,19 @@ def generate_video(
     logger.info(f"  ③ subtitle: {subtitle_path}")
     logger.info(f"  ④ output: {output_file}")
 
-    # 写入与输出文件相同的目录
-    output_dir = os.path.dirname(output_file)
-
-    font_path = ""
-    if params.subtitle_enabled:
-        if not params.font_name:
-            params.font_name = "STHeitiMedium.ttc"
-        font_path = os.path.join(utils.font_dir(), params.font_name)
-        if os.name == "nt":
-            font_path = font_path.replace("\\", "/")
-
-        logger.info(f"using font: {font_path}")
-
-    def create_text_clip(subtitle_item):
-        phrase = subtitle_item[1]
-        max_width = video_width * 0.9
-        wrapped_txt, txt_height = wrap_text(
-            phrase, max_width=max_width, font=font_path, fontsize=params.font_size
-        )
-        _clip = TextClip(
-            wrapped_txt,
-            font=font_path,
-            fontsize=params.font_size,
-            color=params.text_fore_color,
-            bg_color=params.text_background_color,
-            stroke_color=params.stroke_color,
-            stroke_width=params.stroke_width,
-            print_cmd=False,
-        )
-        duration = subtitle_item[0][1] - subtitle_item[0][0]
-        _clip = _clip.set_start(subtitle_item[0][0])
-        _clip = _clip.set_end(subtitle_item[0][1])
-        _clip = _clip.set_duration(duration)
-        if params.subtitle_position == "bottom":
-            _clip = _clip.set_position(("center", video_height * 0.95 - _clip.h))
-        elif params.subtitle_position == "top":
-            _clip = _clip.set_position(("center", video_height * 0.05))
-        elif params.subtitle_position == "custom":
-            # 确保字幕完全在屏幕内
-            margin = 10  # 额外的边距，单位为像素
-            max_y = video_height - _clip.h - margin
-            min_y = margin
-            custom_y = (video_height - _clip.h) * (params.custom_position / 100)
-            custom_y = max(min_y, min(custom_y, max_y))  # 限制 y 值在有效范围内
-            _clip = _clip.set_position(("center", custom_y))
-        else:  # center
-            _clip = _clip.set_position(("center", "center"))
-        return _clip
+    # 临时音频和字幕写入中间文件目录
+    output_dir = scratch.work_dir(os.path.dirname(output_file))
 
     video_clip = VideoFileClip(video_path)
+    if tuple(video_clip.size) != (video_width, video_height):
+        video_clip = video_clip.resize((video_width, video_height))
     audio_clip = AudioFileClip(audio_path).volumex(params.voice_volume)
 
-    if subtitle_path and os.path.exists(subtitle_path):
-        sub = SubtitlesClip(subtitles=subtitle_path, encoding="utf-8")
-        text_clips = []
-        for item in sub.subtitles:
-            clip = create_text_clip(subtitle_item=item)
-            text_clips.append(clip)
+    if subtitles is None:
+        ass_path = scratch.temp_path(output_file, ".ass")
+        subtitles = build_subtitles(subtitle_path, ass_path, params, video_width, video_height)
+    ffmpeg_params, text_clips = subtitles
+    if text_clips:
         video_clip = CompositeVideoClip([video_clip, *text_clips])
 
     bgm_file = get_bgm_file(bgm_type=params.bgm_type, bgm_file=params.bgm_file)
@@ -290,119 +581,209 @@ def generate_video(
             logger.error(f"failed to add bgm: {str(e)}")
 
     video_clip = video_clip.set_audio(audio_clip)
-    video_clip.write_videofile(
-        output_file,
-        audio_codec="aac",
-        temp_audiofile_path=output_dir,
-        threads=params.n_threads,
-        logger=None,
-        fps=30,
-    )
+    with rendering(output_file):
+        video_clip.write_videofile(
+            output_file,
+            audio_codec="aac",
+            temp_audiofile_path=output_dir,
+            threads=params.n_threads,
+            logger=progress,
+            fps=30,
+            **encoder_kwargs(params.encoder_profile, ffmpeg_params, progressive=True),
+        )
+    if progress:
+        progress.finish()
     video_clip.close()
     del video_clip
     logger.success(""
                    "completed")
 
 
+def generate_video_variants(
+    video_paths: List[str],
+    audio_path: str,
+    subtitle_path: str,
+    output_files: List[str],
+    params: Union[VideoParams, VideoClipParams],
+    progress_callback=None,
+) -> List[str]:
+    """
+    并行生成多个变体的成片，字幕只构建一次，所有变体共用
+    Args:
+        video_paths: 各个变体的合并视频路径
+        audio_path: 配音文件路径
+        subtitle_path: 字幕文件路径
+        output_files: 各个变体的输出路径
+        params: 视频参数，n_threads 为任务分到的编码线程数（budget.apply），决定并行数
+        progress_callback: 进度回调函数，参数为 (已完成数量, 总数)，在调用线程中触发
+
+    Returns:
+        生成成功的成片路径，顺序与输入一致
+    """
+    # generate_video 内部会再次按编码配置缩放参数，这里只用缩放后的副本构建字幕
+    scaled_params, video_width, video_height = render_params(params)
+    ass_path = os.path.join(scratch.work_dir(os.path.dirname(output_files[0])), "subtitle.ass")
+    subtitles = build_subtitles(subtitle_path, ass_path, scaled_params, video_width, video_height)
+
+    # 并行数不超过任务分到的编码线程数，编码线程在各个变体之间平分
+    threads = params.n_threads or os.cpu_count() or 1
+    workers = max(min(len(output_files), threads), 1)
+    variant_params = params.model_copy(update={"n_threads": max(threads // workers, 1)})
+    results = {}
+    done = 0
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = {
+            executor.submit(
+                generate_video, video_path, audio_path, subtitle_path, output_file, variant_params, subtitles
+            ): output_file
+            for video_path, output_file in zip(video_paths, output_files)
+        }
+        for future in as_completed(futures):
+            output_file = futures[future]
+            try:
+                future.result()
+                results[output_file] = True
+            except Exception as e:
+                logger.error(f"failed to generate video: {output_file} => {str(e)}")
+            done += 1
+            if progress_callback:
+                progress_callback(done, len(output_files))
+    return [output_file for output_file in output_files if output_file in results]
+
+
 def generate_video_v2(
-        video_path: str,
+        video_path: Union[str, List[EditDecision]],
         audio_path: str,
         subtitle_path: str,
         output_file: str,
         params: Union[VideoParams, VideoClipParams],
+        progress: RenderProgress = None,
 ):
     """
     合并所有素材
     Args:
-        video_path: 视频路径
+        video_path: 视频路径，或 combine_clip_videos 生成的剪辑决策列表（直接渲染，省去中间编码）
         audio_path: 单个音频文件路径
         subtitle_path: 字幕文件路径
         output_file: 输出文件路径
         params: 视频参数
+        progress: 渲染进度，接收逐帧进度和编码速度
 
     Returns:
 
     """
-    aspect = VideoAspect(params.video_aspect)
-    video_width, video_height = aspect.to_resolution()
+    _, video_width, video_height = render_params(params)
 
     logger.info(f"开始，视频尺寸: {video_width} x {video_height}")
-    logger.info(f"  ① 视频: {video_path}")
+    if isinstance(video_path, str):
+        logger.info(f"  ① 视频: {video_path}")
+    else:
+        logger.info(f"  ① 视频: 剪辑决策列表, {len(video_path)} 个片段")
     logger.info(f"  ② 音频: {audio_path}")
     logger.info(f"  ③ 字幕: {subtitle_path}")
     logger.info(f"  ④ 输出: {output_file}")
 
-    # 写入与输出文件相同的目录
-    output_dir = os.path.dirname(output_file)
-
-    # 字体设置部分保持不变
-    font_path = ""
-    if params.subtitle_enabled:
-        if not params.font_name:
-            params.font_name = "STHeitiMedium.ttc"
-        font_path = os.path.join(utils.font_dir(), params.font_name)
-        if os.name == "nt":
-            font_path = font_path.replace("\\", "/")
-        logger.info(f"使用字体: {font_path}")
-
-    # create_text_clip 函数保持不变
-    def create_text_clip(subtitle_item):
-        phrase = subtitle_item[1]
-        max_width = video_width * 0.9
-        wrapped_txt, txt_height = wrap_text(
-            phrase, max_width=max_width, font=font_path, fontsize=params.font_size
-        )
-        _clip = TextClip(
-            wrapped_txt,
-            font=font_path,
-            fontsize=params.font_size,
-            color=params.text_fore_color,
-            bg_color=params.text_background_color,
-            stroke_color=params.stroke_color,
-            stroke_width=params.stroke_width,
-            print_cmd=False,
+    if getattr(params, "render_backend", "moviepy") == "ffmpeg" and render_video_ffmpeg(
+        video_path, audio_path, subtitle_path, output_file, params, progress
+    ):
+        logger.success("完成")
+        return
+
+    render_workers = getattr(params, "render_workers", None) or 1
+    if render_workers > 1 and render_video_chunked(
+        video_path, audio_path, subtitle_path, output_file, params, render_workers, progress
+    ):
+        logger.success("完成")
+        return
+
+    video_clip, vf, source_clips = compose_video_v2(video_path, audio_path, subtitle_path, output_file, params)
+    with rendering(output_file):
+        video_clip.write_videofile(
+            output_file,
+            audio_codec="aac",
+            temp_audiofile_path=scratch.work_dir(os.path.dirname(output_file)),
+            threads=params.n_threads,
+            logger=progress,
+            fps=30,
+            **encoder_kwargs(params.encoder_profile, ["-vf", vf] if vf else None, progressive=True),
         )
-        duration = subtitle_item[0][1] - subtitle_item[0][0]
-        _clip = _clip.set_start(subtitle_item[0][0])
-        _clip = _clip.set_end(subtitle_item[0][1])
-        _clip = _clip.set_duration(duration)
-        if params.subtitle_position == "bottom":
-            _clip = _clip.set_position(("center", video_height * 0.95 - _clip.h))
-        elif params.subtitle_position == "top":
-            _clip = _clip.set_position(("center", video_height * 0.05))
-        elif params.subtitle_position == "custom":
-            # 确保字幕完全在屏幕内
-            margin = 10  # 额外的边距，单位为像素
-            max_y = video_height - _clip.h - margin
-            min_y = margin
-            custom_y = (video_height - _clip.h) * (params.custom_position / 100)
-            custom_y = max(min_y, min(custom_y, max_y))  # 限制 y 值在有效范围内
-            _clip = _clip.set_position(("center", custom_y))
-        else:  # center
-            _clip = _clip.set_position(("center", "center"))
-        return _clip
+    if progress:
+        progress.finish()
+    video_clip.close()
+    for clip in source_clips:
+        clip.close()
+    del video_clip
+    logger.success("完成")
 
-    video_clip = VideoFileClip(video_path)
+
+def compose_video_v2(
+        video_path: Union[str, List[EditDecision]],
+        audio_path: str,
+        subtitle_path: str,
+        output_file: str,
+        params: Union[VideoParams, VideoClipParams],
+        with_audio: bool = True,
+        time_range: tuple = None,
+):
+    """
+    构建最终视频的 moviepy 剪辑（视频、字幕和音频），不写入文件
+    Args:
+        video_path: 视频路径或剪辑决策列表
+        audio_path: 单个音频文件路径
+        subtitle_path: 字幕文件路径，为空时不添加字幕
+        output_file: 输出文件路径，ASS 字幕写入同名 .ass 文件
+        params: 视频参数
+        with_audio: 是否合成音轨
+        time_range: (start, end)，只叠加与该时间段重叠的字幕，用于分段渲染
+
+    Returns:
+        (video_clip, vf, source_clips)，vf 为需要在编码时附加的 ffmpeg 视频滤镜（ASS 字幕），
+        source_clips 需要在写入完成后由调用方关闭
+    """
+    params, video_width, video_height = render_params(params)
+
+    font_path = subtitle_font_path(params)
+
+    source_clips = []
+    if isinstance(video_path, str):
+        video_clip = VideoFileClip(video_path)
+        if tuple(video_clip.size) != (video_width, video_height):
+            video_clip = video_clip.resize((video_width, video_height))
+    else:
+        source_clips = edl_to_clips(video_path, size=(video_width, video_height))
+        video_clip = concatenate_videoclips(source_clips).set_fps(30)
     original_audio = video_clip.audio  # 保存原始视频的音轨
     video_duration = video_clip.duration
 
-    # 处理新的音频文件
-    new_audio = AudioFileClip(audio_path).volumex(params.voice_volume)
-
     # 字幕处理部分
-    if subtitle_path and os.path.exists(subtitle_path):
-        sub = SubtitlesClip(subtitles=subtitle_path, encoding="utf-8")
-        text_clips = []
+    vf = None
+    if subtitle_path and os.path.exists(subtitle_path) and params.subtitle_renderer == "ass":
+        # 转换为 ASS 字幕，在编码时由 ffmpeg 直接烧录
+        ass_path = scratch.temp_path(output_file, ".ass")
+        subtitle_render.srt_to_ass(
+            subtitle_path, ass_path, font_path, params, video_width, video_height, max_duration=video_duration
+        )
+        vf = subtitle_render.ass_filter(ass_path)
+    elif subtitle_path and os.path.exists(subtitle_path):
+        # 只解析字幕文件，SubtitlesClip 在初始化时会用默认样式额外渲染一次 TextClip
+        subtitle_items = file_to_subtitles(subtitle_path, encoding="utf-8")
+        overlay = subtitle_render.SubtitleOverlay(video_width, video_height)
         
-        for item in sub.subtitles:
-            clip = create_text_clip(subtitle_item=item)
-            
+        for item in subtitle_items:
+            (item_start, item_end), _ = item
+
             # 确保字幕的开始时间不早于视频开始
-            start_time = max(clip.start, 0)
+            start_time = max(item_start, 0)
             
             # 如果字幕的开始时间晚于视频结束时间，则跳过此字幕
             if start_time >= video_duration:
                 continue
+
+            # 分段渲染时跳过不在当前分段内的字幕，只渲染本段需要的字幕
+            if time_range and (item_end <= time_range[0] or start_time >= time_range[1]):
+                continue
+
+            clip = create_text_clip(item, params, font_path, video_width, video_height)
             
             # 调整字幕的结束时间，但不要超过视频长度
             end_time = min(clip.end, video_duration)
@@ -410,18 +791,25 @@ def generate_video_v2(
             # 调整字幕的时间范围
             clip = clip.set_start(start_time).set_end(end_time)
             
-            text_clips.append(clip)
+            overlay.add_clip(clip)
+            clip.close()
         
-        logger.info(f"处理了 {len(text_clips)} 段字幕")
+        logger.info(f"处理了 {len(overlay)} 段字幕")
         
-        # 创建一个新的视频剪辑，包含所有字幕
-        video_clip = CompositeVideoClip([video_clip, *text_clips])
+        # 按时间区间索引叠加字幕，每帧只混合当前显示的字幕
+        video_clip = video_clip.fl(overlay.apply)
+
+    if not with_audio:
+        return video_clip.without_audio(), vf, source_clips
+
+    # 处理新的音频文件
+    new_audio = AudioFileClip(audio_path).volumex(params.voice_volume)
 
     # 背景音乐处理部分
     bgm_file = get_bgm_file(bgm_type=params.bgm_type, bgm_file=params.bgm_file)
     
-    # 合并音频轨道
-    audio_tracks = [original_audio, new_audio]
+    # 合并音频轨道，所有片段都不保留原声时原始音轨为空
+    audio_tracks = [track for track in [original_audio, new_audio] if track is not None]
     
     if bgm_file:
         try:
@@ -437,64 +825,674 @@ def generate_video_v2(
     final_audio = CompositeAudioClip(audio_tracks)
 
     video_clip = video_clip.set_audio(final_audio)
-    video_clip.write_videofile(
-        output_file,
-        audio_codec="aac",
-        temp_audiofile_path=output_dir,
+    return video_clip, vf, source_clips
+
+
+def render_video_chunked(
+        video_path: Union[str, List[EditDecision]],
+        audio_path: str,
+        subtitle_path: str,
+        output_file: str,
+        params: VideoClipParams,
+        workers: int,
+        progress: RenderProgress = None,
+) -> bool:
+    """
+    将时间线按 GOP 对齐切分为多段，在多个进程中并行渲染画面，再用 concat demuxer 无损拼接
+    音轨在主进程中完整合成一次后直接封装，避免分段编码 AAC 在拼接处产生静音间隙
+    Args:
+        video_path: 视频路径或剪辑决策列表
+        audio_path: 单个音频文件路径
+        subtitle_path: 字幕文件路径
+        output_file: 输出文件路径
+        params: 视频参数
+        workers: 并行进程数
+        progress: 渲染进度，汇总各分段已写入的帧数
+
+    Returns:
+        是否渲染成功，失败时调用方应回退到单进程渲染
+    """
+    fps = 30
+    gop = fps * _CHUNK_GOP_SECONDS
+    # params.n_threads 为任务分到的 CPU 预算，由各分段进程平分，进程数 × 编码线程数不超过预算
+    threads = params.n_threads or os.cpu_count() or 1
+    workers = max(min(workers, threads), 1)
+
+    video_clip, _, source_clips = compose_video_v2(video_path, audio_path, "", output_file, params)
+    total_frames = int(video_clip.duration * fps)
+    # 每段帧数取 GOP 的整数倍，分段边界恰好落在关键帧上
+    chunk_frames = max(math.ceil(total_frames / workers / gop), 1) * gop
+    if workers < 2 or total_frames <= chunk_frames:
+        logger.info("视频时长不足以分段，使用单进程渲染")
+        video_clip.close()
+        for clip in source_clips:
+            clip.close()
+        return False
+
+    # 分段和音轨写入中间文件目录，拼接后删除
+    base_name = scratch.temp_path(output_file, "")
+    chunks = []
+    for index, start_frame in enumerate(range(0, total_frames, chunk_frames)):
+        frames = min(chunk_frames, total_frames - start_frame)
+        chunks.append((f"{base_name}.part{index:03d}.mp4", start_frame / fps, frames))
+    audio_file = f"{base_name}.audio.m4a"
+    chunk_params = params.model_copy(update={"n_threads": max(threads // len(chunks), 1)})
+    logger.info(f"并行渲染: {len(chunks)} 段, 每段 {chunk_frames} 帧, 每段 {chunk_params.n_threads} 个编码线程")
+
+    try:
+        context = multiprocessing.get_context("spawn")
+        # 各分段已写入的帧数，子进程写入，主进程汇总为渲染进度
+        frames_written = context.Array("i", len(chunks), lock=False)
+        with rendering(output_file), ProcessPoolExecutor(
+            max_workers=len(chunks),
+            mp_context=context,
+            initializer=_init_chunk_worker,
+            initargs=(frames_written,),
+        ) as executor:
+            futures = [
+                executor.submit(
+                    _render_chunk, video_path, audio_path, subtitle_path, chunk_file, chunk_params, start, frames, index
+                )
+                for index, (chunk_file, start, frames) in enumerate(chunks)
+            ]
+            if progress:
+                progress.begin(total_frames / fps)
+            # 子进程渲染画面的同时，主进程写入完整音轨
+            video_clip.audio.write_audiofile(
+                audio_file,
+                fps=44100,
+                nbytes=4,
+                codec="aac",
+                bitrate=encoder_kwargs(params.encoder_profile)["audio_bitrate"],
+                logger=None,
+            )
+            pending = set(futures)
+            while pending:
+                done, pending = wait(pending, timeout=progress.interval if progress else None)
+                for future in done:
+                    future.result()
+                if progress:
+                    progress.update(sum(frames_written))
+
+            ffmpeg_utils.run_ffmpeg(
+                [
+                    "-f", "concat",
+                    "-safe", "0",
+                    "-protocol_whitelist", "file,pipe",
+                    "-i", "pipe:0",
+                    "-i", audio_file,
+                    "-map", "0:v:0",
+                    "-map", "1:a:0",
+                    "-c", "copy",
+                    output_file,
+                ],
+                input_data=ffmpeg_utils.concat_list([chunk[0] for chunk in chunks]),
+            )
+        if progress:
+            progress.finish()
+        return True
+    except Exception as e:
+        logger.error(f"并行渲染失败，回退到单进程渲染: {ffmpeg_utils.ffmpeg_error_text(e)}")
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        return False
+    finally:
+        video_clip.close()
+        for clip in source_clips:
+            clip.close()
+        for path in [audio_file] + [f for chunk in chunks for f in (chunk[0], f"{os.path.splitext(chunk[0])[0]}.ass")]:
+            if os.path.exists(path):
+                os.remove(path)
+
+
+# 子进程中各分段已写入的帧数，由 _init_chunk_worker 设置
+_chunk_frames = None
+
+
+def _init_chunk_worker(frames_written):
+    global _chunk_frames
+    _chunk_frames = frames_written
+
+
+class _ChunkProgress(proglog.ProgressBarLogger):
+    """
+    分段渲染进程的 moviepy logger，把已写入的帧数写入共享数组
+    """
+
+    def __init__(self, index: int):
+        super().__init__(ignored_bars=("chunk",))
+        self.index = index
+
+    def bars_callback(self, bar, attr, value, old_value=None):
+        if bar == "t" and attr == "index":
+            _chunk_frames[self.index] = int(value)
+
+
+def _render_chunk(
+        video_path: Union[str, List[EditDecision]],
+        audio_path: str,
+        subtitle_path: str,
+        chunk_file: str,
+        params: VideoClipParams,
+        start: float,
+        frames: int,
+        index: int = 0,
+):
+    """
+    在子进程中渲染一段画面（不含音轨），已写入的帧数记录到共享数组的第 index 项
+    """
+    fps = 30
+    end = start + frames / fps
+    video_clip, vf, source_clips = compose_video_v2(
+        video_path, audio_path, subtitle_path, chunk_file, params, with_audio=False, time_range=(start, end)
+    )
+    # moviepy 按 int(duration * fps) 计算帧数，多留半帧避免浮点误差少写一帧
+    chunk = video_clip.subclip(start, min(end, video_clip.duration)).set_duration((frames + 0.5) / fps)
+    ffmpeg_params = ["-g", str(fps * _CHUNK_GOP_SECONDS)]
+    if vf:
+        # 分段的时间戳从 0 开始，烧录 ASS 字幕前先平移回原时间线
+        ffmpeg_params += ["-vf", f"setpts=PTS+{start:.6f}/TB,{vf},setpts=PTS-STARTPTS"]
+    chunk.write_videofile(
+        chunk_file,
+        audio=False,
         threads=params.n_threads,
-        logger=None,
-        fps=30,
+        logger=_ChunkProgress(index) if _chunk_frames is not None else None,
+        fps=fps,
+        **encoder_kwargs(params.encoder_profile, ffmpeg_params),
     )
+    chunk.close()
     video_clip.close()
-    del video_clip
-    logger.success("完成")
+    for clip in source_clips:
+        clip.close()
+    return chunk_file
+
+
+def _audio_format(label: str) -> str:
+    # 与 moviepy 写入音轨时的采样率和声道数一致，各路音频格式统一后才能拼接和混音
+    return f"aresample=44100,aformat=sample_fmts=fltp:channel_layouts=stereo[{label}]"
+
+
+def build_filter_graph(
+        edl: List[EditDecision],
+        video_width: int,
+        video_height: int,
+        fps: int = 30,
+        stretch: bool = False,
+):
+    """
+    将剪辑决策列表编译为 ffmpeg filter_complex：逐段 trim/setpts/fps/scale/pad，再 concat 为一路画面和一路原声
+    缩放和黑边的位置与 edl_to_clips 一致；不保留原声或没有音轨的片段用等长静音填充
+    Args:
+        edl: 剪辑决策列表，第 i 个片段对应第 i 个输入
+        video_width: 输出宽度
+        video_height: 输出高度
+        fps: 输出帧率
+        stretch: 直接拉伸到输出尺寸，与 generate_video_v2 处理单个视频文件时的 resize 一致
+
+    Returns:
+        (filters, has_original_audio, duration)，画面输出标签为 [vcat]；有原声时原声输出标签为 [acat]
+    """
+    filters = []
+    audio_filters = []
+    has_original_audio = False
+    duration = 0.0
+    for i, item in enumerate(edl):
+        info = probe.media_info(item.path)
+        start = max(item.start, 0)
+        end = min(item.end, info.duration) if info.duration else item.end
+        length = max(end - start, 0)
+        duration += length
+
+        video_chain = [f"trim=start={start:.6f}:end={end:.6f}", "setpts=PTS-STARTPTS", f"fps={fps}"]
+        clip_w, clip_h = info.width, info.height
+        if (clip_w, clip_h) != (video_width, video_height):
+            if stretch:
+                new_width, new_height = video_width, video_height
+            else:
+                new_width, new_height = ffmpeg_utils.fit_size(clip_w, clip_h, video_width, video_height)
+            # 与 letterbox_frame 的插值方式一致：放大用双线性，缩小用区域插值
+            flags = "bilinear" if new_width > clip_w or new_height > clip_h else "area"
+            video_chain.append(f"scale={new_width}:{new_height}:flags={flags}")
+            if (new_width, new_height) != (video_width, video_height):
+                x = int((video_width - new_width) / 2)
+                y = int((video_height - new_height) / 2)
+                video_chain.append(f"pad={video_width}:{video_height}:{x}:{y}:black")
+        video_chain.append("setsar=1")
+        filters.append(f"[{i}:v]{','.join(video_chain)}[v{i}]")
+
+        if item.ost and info.has_audio:
+            has_original_audio = True
+            audio_filters.append(
+                f"[{i}:a]atrim=start={start:.6f}:end={end:.6f},asetpts=PTS-STARTPTS,{_audio_format(f'a{i}')}"
+            )
+        else:
+            audio_filters.append(
+                f"anullsrc=r=44100:cl=stereo,atrim=duration={length:.6f},{_audio_format(f'a{i}')}"
+            )
+
+    if has_original_audio:
+        filters += audio_filters
+        segments = "".join(f"[v{i}][a{i}]" for i in range(len(edl)))
+        filters.append(f"{segments}concat=n={len(edl)}:v=1:a=1[vcat][acat]")
+    else:
+        # 没有任何原声时只拼接画面，否则 [acat] 没有被使用，ffmpeg 会拒绝这个 filtergraph
+        segments = "".join(f"[v{i}]" for i in range(len(edl)))
+        filters.append(f"{segments}concat=n={len(edl)}:v=1:a=0[vcat]")
+    return filters, has_original_audio, duration
+
+
+def render_video_ffmpeg(
+        video_path: Union[str, List[EditDecision]],
+        audio_path: str,
+        subtitle_path: str,
+        output_file: str,
+        params: VideoClipParams,
+        progress: RenderProgress = None,
+) -> bool:
+    """
+    ffmpeg 渲染后端：把剪辑决策、字幕、配音和背景音乐编译为一条 filter_complex 命令，
+    解码、缩放、拼接、字幕烧录、混音和编码全部在 ffmpeg 中完成，不经过 Python 逐帧回调
+    字幕统一转换为 ASS 后烧录；混音按 CompositeAudioClip 的方式直接叠加，不做归一化
+    Args:
+        video_path: 视频路径或剪辑决策列表
+        audio_path: 单个音频文件路径
+        subtitle_path: 字幕文件路径
+        output_file: 输出文件路径
+        params: 视频参数
+        progress: 渲染进度，通过 ffmpeg -progress 更新
+
+    Returns:
+        是否渲染成功，失败时调用方应回退到 moviepy 渲染
+    """
+    fps = 30
+    params, video_width, video_height = render_params(params)
+    stretch = isinstance(video_path, str)
+    if stretch:
+        edl = [EditDecision(path=video_path, start=0.0, end=_media_duration(video_path), ost=True,
+                            width=video_width, height=video_height)]
+    else:
+        edl = video_path
+
+    ass_path = scratch.temp_path(output_file, ".ass")
+    try:
+        filters, has_original_audio, video_duration = build_filter_graph(
+            edl, video_width, video_height, fps=fps, stretch=stretch
+        )
+        args = []
+        for item in edl:
+            args += ["-i", item.path]
+
+        # 字幕
+        video_label = "vcat"
+        if subtitle_path and os.path.exists(subtitle_path):
+            if not params.font_name:
+                params.font_name = "STHeitiMedium.ttc"
+            font_path = os.path.join(utils.font_dir(), params.font_name)
+            if params.subtitle_renderer != "ass":
+                logger.info(f"ffmpeg 渲染后端使用 ASS 烧录字幕（字幕渲染方式: {params.subtitle_renderer}）")
+            subtitle_render.srt_to_ass(
+                subtitle_path, ass_path, font_path, params, video_width, video_height, max_duration=video_duration
+            )
+            filters.append(f"[vcat]{subtitle_render.ass_filter(ass_path)}[vout]")
+            video_label = "vout"
+
+        # 音频：原声 + 配音 + 背景音乐
+        audio_labels = ["acat"] if has_original_audio else []
+        input_index = len(edl)
+        args += ["-i", audio_path]
+        filters.append(f"[{input_index}:a]volume={params.voice_volume},{_audio_format('voice')}")
+        audio_labels.append("voice")
+        input_index += 1
+
+        bgm_file = get_bgm_file(bgm_type=params.bgm_type, bgm_file=params.bgm_file)
+        if bgm_file:
+            bgm_duration = probe.media_info(bgm_file).duration
+            if bgm_duration:
+                args += ["-i", bgm_file]
+                # 与 audio_fadeout + audio_loop 一致：先在每一遍的末尾淡出，再循环到视频时长
+                fade = min(3, bgm_duration)
+                filters.append(
+                    f"[{input_index}:a]volume={params.bgm_volume},"
+                    f"afade=t=out:st={bgm_duration - fade:.6f}:d={fade:.6f},"
+                    "aresample=44100,"
+                    f"aloop=loop=-1:size={int(math.ceil(bgm_duration * 44100))},"
+                    f"atrim=duration={video_duration:.6f},"
+                    f"{_audio_format('bgm')}"
+                )
+                audio_labels.append("bgm")
+                input_index += 1
+            else:
+                logger.error(f"添加背景音乐失败: 无法读取时长 {bgm_file}")
 
+        if len(audio_labels) > 1:
+            # CompositeAudioClip 直接叠加各路音频，amix 默认会按输入数量归一化音量
+            filters.append(
+                f"{''.join(f'[{label}]' for label in audio_labels)}"
+                f"amix=inputs={len(audio_labels)}:duration=longest:dropout_transition=0:normalize=0[aout]"
+            )
+            audio_label = "aout"
+        else:
+            audio_label = audio_labels[0]
+
+        kwargs = encoder_kwargs(params.encoder_profile, progressive=True)
+        args += [
+            "-filter_complex", ";".join(filters),
+            "-map", f"[{video_label}]",
+            "-map", f"[{audio_label}]",
+            "-c:v", "libx264",
+            "-preset", kwargs["preset"],
+            *kwargs["ffmpeg_params"],
+            "-pix_fmt", "yuv420p",
+            "-r", str(fps),
+            "-c:a", "aac",
+            *(["-b:a", kwargs["audio_bitrate"]] if kwargs["audio_bitrate"] else []),
+            "-threads", str(params.n_threads or 0),
+            output_file,
+        ]
+        logger.info(f"ffmpeg 渲染: {len(edl)} 个片段, 时长 {video_duration:.2f} s")
+        if progress:
+            progress.begin(video_duration)
+        with rendering(output_file):
+            ffmpeg_utils.run_ffmpeg(args, progress=progress.ffmpeg_callback if progress else None)
+        if progress:
+            progress.finish()
+        return True
+    except Exception as e:
+        logger.error(f"ffmpeg 渲染失败，回退到 moviepy 渲染: {ffmpeg_utils.ffmpeg_error_text(e)}")
+        if os.path.exists(output_file):
+            os.remove(output_file)
+        return False
+
+
+def preprocess_video(materials: List[MaterialInfo], clip_duration=4, method: str = "numpy"):
+    """
+    检查本地素材尺寸，并将图片素材转换为带缓慢放大效果的视频
+    图片素材在多个线程中并行转换，结果按图片内容缓存
+    Args:
+        materials: 素材列表
+        clip_duration: 图片素材转换后的视频时长
+        method: 图片转换方式，numpy 或 zoompan，参见 image_clip.image_to_video
 
-def preprocess_video(materials: List[MaterialInfo], clip_duration=4):
+    Returns:
+        素材列表，图片素材的 url 替换为生成的视频路径
+    """
+    images = []
     for material in materials:
         if not material.url:
             continue
 
         ext = utils.parse_extension(material.url)
-        try:
-            clip = VideoFileClip(material.url)
-        except Exception:
-            clip = ImageClip(material.url)
+        if ext in const.FILE_TYPE_IMAGES:
+            # 图片只读取文件头获取尺寸，不启动 ffmpeg
+            with Image.open(material.url) as image:
+                width, height = image.size
+        else:
+            info = probe.media_info(material.url)
+            width, height = info.width, info.height
 
-        width = clip.size[0]
-        height = clip.size[1]
         if width < 480 or height < 480:
             logger.warning(f"video is too small, width: {width}, height: {height}")
             continue
 
         if ext in const.FILE_TYPE_IMAGES:
             logger.info(f"processing image: {material.url}")
-            # 创建一个图片剪辑，并设置持续时间为3秒钟
-            clip = (
-                ImageClip(material.url)
-                .set_duration(clip_duration)
-                .set_position("center")
+            images.append(material)
+
+    video_files = image_clip.images_to_videos(
+        [material.url for material in images], clip_duration, fps=30, method=method
+    )
+    for material, video_file in zip(images, video_files):
+        if video_file:
+            material.url = video_file
+    return materials
+
+
+def _stream_copy_plan(video_paths: List[str], video_width: int, video_height: int, fps: int = 30):
+    """
+    检查子视频是否可以直接使用 concat demuxer 流复制合并
+    所有视频的编码、尺寸、像素格式、帧率和时间基必须一致，且与目标分辨率和帧率相同
+
+    Returns:
+        可流复制时返回每个视频的 (时长, 是否有音轨) 列表，否则返回 None
+    """
+    plan = []
+    signature = None
+    for video_path in video_paths:
+        try:
+            info = probe.probe(video_path)
+        except Exception as e:
+            logger.warning(f"无法读取视频信息，跳过流复制: {video_path} => {str(e)}")
+            return None
+
+        streams = info.get("streams", [])
+        video_streams = [s for s in streams if s.get("codec_type") == "video"]
+        if not video_streams:
+            return None
+        v = video_streams[0]
+        if not v.get("codec_name"):
+            logger.info(f"读取不到视频编码格式，无法流复制: {video_path}")
+            return None
+        _signature = (
+            v.get("codec_name"),
+            v.get("width"),
+            v.get("height"),
+            v.get("pix_fmt"),
+            v.get("r_frame_rate"),
+            v.get("time_base"),
+        )
+        if signature is None:
+            signature = _signature
+        elif _signature != signature:
+            logger.info(f"视频参数不一致，无法流复制: {video_path}")
+            return None
+
+        if v.get("width") != video_width or v.get("height") != video_height:
+            return None
+        if probe.media_info(video_path).rotation:
+            # 流复制保留原始方向的编码画面，带旋转信息的素材需要重新编码
+            return None
+        if abs(ffmpeg_utils.parse_rate(v.get("r_frame_rate")) - fps) > 0.01:
+            return None
+
+        duration = float(v.get("duration") or info.get("format", {}).get("duration") or 0)
+        if duration <= 0:
+            return None
+        has_audio = any(s.get("codec_type") == "audio" for s in streams)
+        plan.append((duration, has_audio))
+    return plan
+
+
+def concat_clips_stream_copy(combined_video_path: str,
+                             video_paths: List[str],
+                             video_ost_list: List[bool],
+                             video_width: int,
+                             video_height: int,
+                             fps: int = 30,
+                             ) -> bool:
+    """
+    使用 concat demuxer 流复制合并视频，不重新编码画面
+    音轨按 video_ost_list 逐段保留原声或替换为静音后重新拼接，全程不写临时文件
+
+    Returns:
+        是否合并成功，失败时调用方应回退到 moviepy 合并
+    """
+    if not video_paths:
+        return False
+
+    plan = _stream_copy_plan(video_paths, video_width, video_height, fps)
+    if plan is None:
+        return False
+
+    args = [
+        "-f", "concat",
+        "-safe", "0",
+        "-protocol_whitelist", "file,pipe",
+        "-i", "pipe:0",
+    ]
+    filters = []
+    audio_labels = []
+    input_index = 1
+    for index, ((duration, has_audio), video_ost) in enumerate(zip(plan, video_ost_list)):
+        label = f"a{index}"
+        if video_ost and has_audio:
+            args += ["-i", video_paths[index]]
+            filters.append(
+                f"[{input_index}:a:0]aresample=44100,"
+                f"aformat=sample_fmts=fltp:channel_layouts=stereo,"
+                f"apad,atrim=duration={duration:.6f}[{label}]"
             )
-            # 使用resize方法来添加缩放效果。这里使用了lambda函数来使得缩放效果随时间变化。
-            # 假设我们想要从原始大小逐渐放大到120%的大小。
-            # t代表当前时间，clip.duration为视频总时长，这里是3秒。
-            # 注意：1 表示100%的大小，所以1.2表示120%的大小
-            zoom_clip = clip.resize(
-                lambda t: 1 + (clip_duration * 0.03) * (t / clip.duration)
+            input_index += 1
+        else:
+            filters.append(
+                f"anullsrc=channel_layout=stereo:sample_rate=44100,"
+                f"atrim=duration={duration:.6f}[{label}]"
             )
+        audio_labels.append(f"[{label}]")
+    filters.append(f"{''.join(audio_labels)}concat=n={len(audio_labels)}:v=0:a=1[aout]")
+
+    args += [
+        "-filter_complex", ";".join(filters),
+        "-map", "0:v:0",
+        "-map", "[aout]",
+        "-c:v", "copy",
+        "-c:a", "aac",
+        combined_video_path,
+    ]
+    try:
+        ffmpeg_utils.run_ffmpeg(args, input_data=ffmpeg_utils.concat_list(video_paths))
+    except Exception as e:
+        logger.warning(f"流复制合并失败，回退到重新编码: {ffmpeg_utils.ffmpeg_error_text(e)}")
+        if os.path.exists(combined_video_path):
+            os.remove(combined_video_path)
+        return False
+    return True
+
+
+def _media_duration(video_path: str) -> float:
+    """
+    获取视频时长（秒）
+    """
+    try:
+        return probe.media_info(video_path).duration
+    except Exception:
+        clip = VideoFileClip(video_path)
+        duration = clip.duration
+        clip.close()
+        return duration
+
+
+def build_clip_edl(video_paths: List[str],
+                   video_ost_list: List[bool],
+                   video_aspect: VideoAspect = VideoAspect.portrait,
+                   encoder_profile: str = EncoderProfile.standard.value,
+                   ) -> List[EditDecision]:
+    """
+    生成剪辑决策列表（EDL），描述最终时间线而不进行任何编码
+    Args:
+        video_paths: 子视频路径列表
+        video_ost_list: 原声播放列表
+        video_aspect: 屏幕比例
+        encoder_profile: 编码配置，决定目标画面尺寸
 
-            # 如果需要，可以创建一个包含缩放剪辑的复合视频剪辑
-            # （这在您想要在视频中添加其他元素时非常有用）
-            final_clip = CompositeVideoClip([zoom_clip])
+    Returns:
+        每个片段的源文件、入点、出点、是否保留原声以及目标画面尺寸
+    """
+    video_width, video_height, _ = scaled_resolution(video_aspect, encoder_profile)
 
-            # 输出视频
-            video_file = f"{material.url}.mp4"
-            final_clip.write_videofile(video_file, fps=30, logger=None)
-            final_clip.close()
-            del final_clip
-            material.url = video_file
-            logger.success(f"completed: {video_file}")
-    return materials
+    cache_video_path = utils.root_dir()
+    edl = []
+    for video_path, video_ost in zip(video_paths, video_ost_list):
+        source_path = os.path.join(cache_video_path, video_path)
+        edl.append(EditDecision(
+            path=source_path,
+            start=0.0,
+            end=_media_duration(source_path),
+            ost=bool(video_ost),
+            width=video_width,
+            height=video_height,
+        ))
+    return edl
+
+
+def letterbox_frame(new_width: int, new_height: int, video_width: int, video_height: int):
+    """
+    生成逐帧处理函数：将画面等比缩放到 new_width x new_height 后居中放置在 video_width x video_height 的黑色画布上
+    缩放结果直接写入预先分配的画布，黑边只在创建画布时填充一次
+    """
+    # 与 moviepy 合成时 "center" 定位的取整方式一致
+    x = int((video_width - new_width) / 2)
+    y = int((video_height - new_height) / 2)
+    # 画布外的部分会被裁剪
+    src_x, src_y = max(-x, 0), max(-y, 0)
+    x, y = max(x, 0), max(y, 0)
+    w = min(new_width - src_x, video_width - x)
+    h = min(new_height - src_y, video_height - y)
+    canvas = np.zeros((video_height, video_width, 3), dtype=np.uint8)
+
+    def fill(frame):
+        # 与 moviepy resize 的插值方式一致：放大用双线性，缩小用区域插值
+        if new_width > frame.shape[1] or new_height > frame.shape[0]:
+            interpolation = cv2.INTER_LINEAR
+        else:
+            interpolation = cv2.INTER_AREA
+        resized = cv2.resize(frame.astype(np.uint8, copy=False), (new_width, new_height), interpolation=interpolation)
+        canvas[y:y + h, x:x + w] = resized[src_y:src_y + h, src_x:src_x + w, :3]
+        return canvas
+
+    return fill
+
+
+def letterbox_clip(clip, new_width: int, new_height: int, video_width: int, video_height: int):
+    """
+    将视频等比缩放后居中放置在黑色画布上
+    与 ColorClip + CompositeVideoClip 的布局完全一致，但不再每帧分配并混合整幅画面，参见 letterbox_frame
+    Args:
+        clip: 源视频
+        new_width: 缩放后的宽度
+        new_height: 缩放后的高度
+        video_width: 画布宽度
+        video_height: 画布高度
+
+    Returns:
+        尺寸为 video_width x video_height 的视频
+    """
+    return clip.fl_image(letterbox_frame(new_width, new_height, video_width, video_height))
+
+
+def edl_to_clips(edl: List[EditDecision], size: tuple = None) -> list:
+    """
+    根据剪辑决策列表打开源视频并生成按时间线排列的片段
+    调用方负责在渲染完成后关闭返回的片段
+    Args:
+        edl: 剪辑决策列表
+        size: (宽, 高)，指定时覆盖剪辑决策中的目标尺寸，如草稿模式下的低分辨率
+    """
+    clips = []
+    for item in edl:
+        clip = VideoFileClip(item.path)
+        if item.start > 0 or item.end < clip.duration:
+            clip = clip.subclip(item.start, min(item.end, clip.duration))
+        # 通过 ost 字段判断是否播放原声
+        if not item.ost:
+            clip = clip.without_audio()
+        clip = clip.set_fps(30)
+
+        # 并非所有视频的大小都相同，因此我们需要调整它们的大小
+        clip_w, clip_h = clip.size
+        video_width, video_height = size or (item.width, item.height)
+        if clip_w != video_width or clip_h != video_height:
+            new_width, new_height = ffmpeg_utils.fit_size(clip_w, clip_h, video_width, video_height)
+            if (new_width, new_height) == (video_width, video_height):
+                # 等比例缩放
+                clip = clip.resize((video_width, video_height))
+            else:
+                # 等比缩放后居中补黑边
+                clip = letterbox_clip(clip, new_width, new_height, video_width, video_height)
+
+            logger.info(f"将视频 {item.path} 大小调整为 {video_width} x {video_height}, 剪辑尺寸: {clip_w} x {clip_h}")
+
+        clips.append(clip)
+    return clips
 
 
 def combine_clip_videos(combined_video_path: str,
@@ -503,7 +1501,10 @@ def combine_clip_videos(combined_video_path: str,
                         list_script: list,
                         video_aspect: VideoAspect = VideoAspect.portrait,
                         threads: int = 2,
-                        ) -> str:
+                        edl_only: bool = False,
+                        encoder_profile: str = EncoderProfile.standard.value,
+                        progress: RenderProgress = None,
+                        ) -> Union[str, List[EditDecision]]:
     """
     合并子视频
     Args:
@@ -513,84 +1514,49 @@ def combine_clip_videos(combined_video_path: str,
         list_script: 剪辑脚本
         video_aspect: 屏幕比例
         threads: 线程数
+        edl_only: 不重新编码合并视频，无法流复制时只返回剪辑决策列表，交由 generate_video_v2 直接渲染
+        encoder_profile: 编码配置
+        progress: 渲染进度，重新编码合并视频时接收逐帧进度和编码速度
 
     Returns:
-
+        合并后的视频路径；edl_only 为 True 且无法流复制时返回剪辑决策列表
     """
     from app.utils.utils import calculate_total_duration
     audio_duration = calculate_total_duration(list_script)
     logger.info(f"音频的最大持续时间: {audio_duration} s")
-    # 每个剪辑所需的持续时间
-    req_dur = audio_duration / len(video_paths)
-    # req_dur = max_clip_duration
-    # logger.info(f"每个剪辑的最大长度为 {req_dur} s")
-    output_dir = os.path.dirname(combined_video_path)
-
-    aspect = VideoAspect(video_aspect)
-    video_width, video_height = aspect.to_resolution()
-
-    clips = []
-    video_duration = 0
-    # 一遍又一遍地添加下载的剪辑，直到达到音频的持续时间 （max_duration）
-    # while video_duration < audio_duration:
-    for video_path, video_ost in zip(video_paths, video_ost_list):
-        cache_video_path = utils.root_dir()
-        clip = VideoFileClip(os.path.join(cache_video_path, video_path))
-        # 通过 ost 字段判断是否播放原声
-        if not video_ost:
-            clip = clip.without_audio()
-        # # 检查剪辑是否比剩余音频长
-        # if (audio_duration - video_duration) < clip.duration:
-        #     clip = clip.subclip(0, (audio_duration - video_duration))
-        # # 仅当计算出的剪辑长度 （req_dur） 短于实际剪辑时，才缩短剪辑以防止静止图像
-        # elif req_dur < clip.duration:
-        #     clip = clip.subclip(0, req_dur)
-        clip = clip.set_fps(30)
+    output_dir = scratch.work_dir(os.path.dirname(combined_video_path))
 
-        # 并非所有视频的大小都相同，因此我们需要调整它们的大小
-        clip_w, clip_h = clip.size
-        if clip_w != video_width or clip_h != video_height:
-            clip_ratio = clip.w / clip.h
-            video_ratio = video_width / video_height
+    edl = build_clip_edl(video_paths, video_ost_list, video_aspect, encoder_profile)
+    video_width, video_height, _ = scaled_resolution(video_aspect, encoder_profile)
 
-            if clip_ratio == video_ratio:
-                # 等比例缩放
-                clip = clip.resize((video_width, video_height))
-            else:
-                # 等比缩放视频
-                if clip_ratio > video_ratio:
-                    # 按照目标宽度等比缩放
-                    scale_factor = video_width / clip_w
-                else:
-                    # 按照目标高度等比缩放
-                    scale_factor = video_height / clip_h
-
-                new_width = int(clip_w * scale_factor)
-                new_height = int(clip_h * scale_factor)
-                clip_resized = clip.resize(newsize=(new_width, new_height))
-
-                background = ColorClip(size=(video_width, video_height), color=(0, 0, 0))
-                clip = CompositeVideoClip([
-                    background.set_duration(clip.duration),
-                    clip_resized.set_position("center")
-                ])
-
-            logger.info(f"将视频 {video_path} 大小调整为 {video_width} x {video_height}, 剪辑尺寸: {clip_w} x {clip_h}")
+    # 子视频来自同一原视频且已符合目标分辨率和帧率时，直接流复制合并
+    # 流复制不会产生额外的有损编码，edl_only 时同样优先使用，最后一步只需顺序读取一个文件
+    source_paths = [item.path for item in edl]
+    if concat_clips_stream_copy(combined_video_path, source_paths, video_ost_list, video_width, video_height):
+        logger.success(f"流复制合并完成: {combined_video_path}")
+        return combined_video_path
 
-        clips.append(clip)
-        video_duration += clip.duration
+    if edl_only:
+        logger.info(f"生成剪辑决策列表: {len(edl)} 个片段")
+        return edl
 
+    clips = edl_to_clips(edl)
     video_clip = concatenate_videoclips(clips)
     video_clip = video_clip.set_fps(30)
     logger.info(f"合并视频中...")
     video_clip.write_videofile(filename=combined_video_path,
                                threads=threads,
-                               logger=None,
+                               logger=progress,
                                temp_audiofile_path=output_dir,
                                audio_codec="aac",
                                fps=30,
+                               **encoder_kwargs(encoder_profile),
                                )
+    if progress:
+        progress.finish()
     video_clip.close()
+    for clip in clips:
+        clip.close()
     logger.success(f"completed")
     return combined_video_path
 
@@ -0,0 +1,215 @@
+import os
+import json
+import subprocess
+import threading
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Optional, Tuple
+
+from loguru import logger
+
+
+def ffmpeg_binary() -> str:
+    """
+    获取 ffmpeg 可执行文件路径，优先使用 config.toml 中配置的 ffmpeg_path
+    """
+    ffmpeg_path = os.environ.get("IMAGEIO_FFMPEG_EXE", "")
+    if ffmpeg_path and os.path.isfile(ffmpeg_path):
+        return ffmpeg_path
+    try:
+        # 与 moviepy 使用同一个 ffmpeg（imageio-ffmpeg 自带或自动下载的版本）
+        import imageio_ffmpeg
+
+        return imageio_ffmpeg.get_ffmpeg_exe()
+    except Exception:
+        return "ffmpeg"
+
+
+def ffprobe_binary() -> str:
+    """
+    获取 ffprobe 可执行文件路径，默认与 ffmpeg 位于同一目录
+    """
+    ffmpeg_path = ffmpeg_binary()
+    if ffmpeg_path != "ffmpeg":
+        ffmpeg_dir, ffmpeg_name = os.path.split(ffmpeg_path)
+        ffprobe_path = os.path.join(ffmpeg_dir, ffmpeg_name.replace("ffmpeg", "ffprobe"))
+        if os.path.isfile(ffprobe_path):
+            return ffprobe_path
+    return "ffprobe"
+
+
+def run_ffmpeg(
+    args: List[str],
+    input_data: Optional[bytes] = None,
+    progress: Optional[Callable[[Dict[str, str]], None]] = None,
+) -> subprocess.CompletedProcess:
+    """
+    执行 ffmpeg 命令
+    Args:
+        args: ffmpeg 参数（不包含可执行文件本身）
+        input_data: 写入 stdin 的数据，如 concat 列表
+        progress: 进度回调，参数为 ffmpeg -progress 输出的一组字段（frame、fps、bitrate、out_time_us、speed、progress 等）
+
+    Returns:
+        subprocess.CompletedProcess，失败时抛出 subprocess.CalledProcessError
+    """
+    cmd = [ffmpeg_binary(), "-hide_banner", "-nostdin", "-loglevel", "error", "-y", *args]
+    if input_data is not None:
+        # 需要从 stdin 读取数据时不能使用 -nostdin
+        cmd.remove("-nostdin")
+    if progress is not None:
+        cmd[1:1] = ["-progress", "pipe:1", "-nostats"]
+    logger.debug(f"ffmpeg: {' '.join(cmd)}")
+    if progress is None:
+        return subprocess.run(cmd, input=input_data, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+
+    process = subprocess.Popen(
+        cmd,
+        stdin=subprocess.PIPE if input_data is not None else subprocess.DEVNULL,
+        stdout=subprocess.PIPE,
+        stderr=subprocess.PIPE,
+    )
+    # stderr 在单独的线程中读取，避免管道写满后阻塞 ffmpeg
+    stderr_chunks = []
+    stderr_thread = threading.Thread(target=lambda: stderr_chunks.append(process.stderr.read()))
+    stderr_thread.start()
+    if input_data is not None:
+        process.stdin.write(input_data)
+        process.stdin.close()
+
+    fields = {}
+    for line in process.stdout:
+        key, _, value = line.decode("utf-8", "ignore").strip().partition("=")
+        if not key:
+            continue
+        fields[key] = value.strip()
+        # 每组进度以 progress=continue/end 结束
+        if key == "progress":
+            try:
+                progress(fields)
+            except Exception as e:
+                logger.warning(f"ffmpeg 进度回调失败: {str(e)}")
+            fields = {}
+    returncode = process.wait()
+    stderr_thread.join()
+    stderr = b"".join(stderr_chunks)
+    if returncode:
+        raise subprocess.CalledProcessError(returncode, cmd, output=b"", stderr=stderr)
+    return subprocess.CompletedProcess(cmd, returncode, b"", stderr)
+
+
+def ffprobe(path: str) -> dict:
+    """
+    使用 ffprobe 读取媒体文件的 format 和 streams 信息
+    """
+    cmd = [
+        ffprobe_binary(),
+        "-v", "error",
+        "-print_format", "json",
+        "-show_format",
+        "-show_streams",
+        path,
+    ]
+    result = subprocess.run(cmd, stdout=subprocess.PIPE, stderr=subprocess.PIPE, check=True)
+    return json.loads(result.stdout.decode("utf-8"))
+
+
+def parse_rate(rate: str) -> float:
+    """
+    将 ffprobe 的帧率字符串（如 "30000/1001"）转换为浮点数
+    """
+    if not rate:
+        return 0.0
+    if "/" in rate:
+        num, den = rate.split("/", 1)
+        if float(den) == 0:
+            return 0.0
+        return float(num) / float(den)
+    return float(rate)
+
+
+def concat_list(paths: List[str], ranges: List[Tuple[float, float]] = None) -> bytes:
+    """
+    生成 concat demuxer 使用的文件列表，通过 stdin 传入，无需写临时文件
+    从 pipe 读取列表时相对路径会被解析为 pipe: 协议，因此需要显式加上 file: 前缀
+    Args:
+        paths: 文件路径
+        ranges: 每个文件的 (入点, 出点)，流复制时入点需要落在关键帧上
+    """
+    lines = ["ffconcat version 1.0"]
+    for index, path in enumerate(paths):
+        escaped = os.path.abspath(path).replace("'", "'\\''")
+        lines.append(f"file 'file:{escaped}'")
+        if ranges:
+            inpoint, outpoint = ranges[index]
+            lines.append(f"inpoint {inpoint:.6f}")
+            lines.append(f"outpoint {outpoint:.6f}")
+    return ("\n".join(lines) + "\n").encode("utf-8")
+
+
+def _escape(value: str, chars: str) -> str:
+    return "".join(f"\\{c}" if c in chars else c for c in value)
+
+
+def escape_filter_path(path: str) -> str:
+    """
+    转义滤镜参数中的文件路径，兼容 Windows 盘符中的冒号以及路径中的引号、逗号和方括号
+    滤镜参数会被解析两次：先按滤镜选项（: 分隔）转义，再按滤镜图（, ; [ ] 分隔）转义；
+    单引号内无法转义引号，因此不使用引号，全部以反斜杠转义
+    """
+    path = os.path.abspath(path).replace(os.sep, "/")
+    return _escape(_escape(path, "\\':"), "\\'[],;")
+
+
+def ffmpeg_error_text(e: Exception) -> str:
+    """
+    异常信息，ffmpeg 执行失败（subprocess.CalledProcessError）时附带 stderr 输出
+    """
+    stderr = getattr(e, "stderr", b"") or b""
+    if isinstance(stderr, bytes):
+        stderr = stderr.decode("utf-8", "ignore")
+    return f"{str(e)} {stderr}".strip()
+
+
+@contextmanager
+def atomic_output(path: str, suffix: str = ""):
+    """
+    先写入同目录下的临时文件，成功后原子地重命名为 path，失败时删除临时文件
+    每个线程使用各自的临时文件，并发任务不会读取到未写完的文件
+    Args:
+        path: 最终文件路径
+        suffix: 临时文件的扩展名，默认与 path 相同（ffmpeg 和 numpy 根据扩展名判断输出格式）
+
+    Yields:
+        临时文件路径
+    """
+    tmp_file = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp{suffix or os.path.splitext(path)[1]}"
+    try:
+        yield tmp_file
+        os.replace(tmp_file, path)
+    finally:
+        if os.path.exists(tmp_file):
+            os.remove(tmp_file)
+
+
+def even(value: float) -> int:
+    """
+    向下取偶数，libx264 的 yuv420p 要求宽高为偶数
+    """
+    return int(value) // 2 * 2
+
+
+def fit_size(clip_w: int, clip_h: int, video_width: int, video_height: int):
+    """
+    计算等比缩放后的画面尺寸，与 edl_to_clips 的缩放规则一致
+    Returns:
+        (new_width, new_height)，宽高比相同时为画布尺寸
+    """
+    clip_ratio = clip_w / clip_h
+    video_ratio = video_width / video_height
+    if clip_ratio == video_ratio:
+        return video_width, video_height
+    if clip_ratio > video_ratio:
+        scale_factor = video_width / clip_w
+    else:
+        scale_factor = video_height / clip_h
+    return int(clip_w * scale_factor), int(clip_h * scale_factor)
@@ -14,7 +14,8 @@ from datetime import datetime, timedelta
 
 from app.models import const
 from app.utils import check_script
-from app.services import material
+from app.services import material, proxy, thumbnails
+from app.services.cpu_budget import budget
 
 urllib3.disable_warnings()
 
@@ -401,15 +402,19 @@ def cut_video(params, progress_callback=None):
             if progress_callback:
                 progress_callback(progress)
 
+        # 预览用的片段从代理视频裁剪，最终渲染时再从原视频裁剪
         subclip_videos = material.clip_videos(
             task_id=task_id,
             timestamp_terms=time_list,
-            origin_video=params.video_origin_path,
-            progress_callback=clip_progress
+            origin_video=proxy.preview_source(params.video_origin_path),
+            progress_callback=clip_progress,
+            encoder_profile=params.encoder_profile,
         )
 
         if subclip_videos is None:
             raise ValueError("裁剪视频失败")
+        # 生成 Video Check 面板使用的缩略图和雪碧图
+        thumbnails.build_index(task_id, subclip_videos, budget.grant(task_id)["clip_workers"])
 
         st.session_state['subclip_videos'] = subclip_videos
 
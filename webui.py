@@ -26,8 +26,9 @@ import streamlit.components.v1 as components
 from loguru import logger
 
 from app.models.const import FILE_TYPE_VIDEOS
-from app.models.schema import VideoClipParams, VideoAspect, VideoConcatMode
-from app.services import task as tm, llm, voice, material
+from app.models.schema import VideoClipParams, VideoAspect, VideoConcatMode, EncoderProfile
+from app.services import task as tm, llm, voice, material, proxy, thumbnails
+from app.services.cpu_budget import budget
 from app.utils import utils
 
 # # 将项目的根目录添加到系统路径中，以允许从项目导入模块
@@ -355,9 +356,13 @@ with left_panel:
                 # 将文件保存到指定目录
                 with open(video_file_path, "wb") as f:
                     f.write(uploaded_file.read())
-                    st.success(tr("File Uploaded Successfully"))
-                    time.sleep(1)
-                    st.rerun()
+                if proxy.enabled():
+                    # 上传后生成低分辨率代理视频，预览和审查都使用代理
+                    with st.spinner(tr("Generating Proxy Video")):
+                        proxy.preview_source(video_file_path)
+                st.success(tr("File Uploaded Successfully"))
+                time.sleep(1)
+                st.rerun()
         # 视频名称
         video_name = st.text_input(tr("Video Name"))
         # 剧情内容
@@ -474,6 +479,10 @@ with left_panel:
                     status_text.text(f"剪辑进度: {progress}%")
 
                 try:
+                    # 编码配置选择框位于裁剪按钮之后，从 session_state 读取当前的选择，裁剪与最终渲染使用同一配置
+                    params.encoder_profile = EncoderProfile(
+                        st.session_state.get("encoder_profile", EncoderProfile.standard.value)
+                    )
                     utils.cut_video(params, update_progress)
                     time.sleep(0.5)  # 给进度条一点时间到达100%
                     progress_bar.progress(100)
@@ -503,6 +512,41 @@ with middle_panel:
         )
         params.video_aspect = VideoAspect(video_aspect_ratios[selected_index][1])
 
+        # 编码配置，草稿模式以低分辨率快速渲染，用于预览
+        encoder_profiles = {
+            EncoderProfile.standard.value: tr("Standard Quality"),
+            EncoderProfile.draft.value: tr("Draft Quality"),
+            EncoderProfile.archive.value: tr("Archive Quality"),
+        }
+        selected_profile = st.selectbox(
+            tr("Encoder Profile"),
+            options=list(encoder_profiles),
+            format_func=lambda x: encoder_profiles[x],
+            key="encoder_profile",
+        )
+        params.encoder_profile = EncoderProfile(selected_profile)
+
+        # 渲染后端，ffmpeg 后端用一条滤镜图命令完成整个剪辑，不经过 Python 逐帧处理
+        render_backends = [
+            (tr("MoviePy Backend"), "moviepy"),
+            (tr("FFmpeg Backend"), "ffmpeg"),
+        ]
+        selected_index = st.selectbox(
+            tr("Render Backend"),
+            options=range(len(render_backends)),
+            format_func=lambda x: render_backends[x][0],
+        )
+        params.render_backend = render_backends[selected_index][1]
+
+        # 并行渲染进程数，大于 1 时按时间分段在多个进程中渲染，实际进程数不超过任务分到的 CPU 预算
+        params.render_workers = st.number_input(
+            tr("Render Workers"),
+            min_value=1,
+            max_value=os.cpu_count() or 1,
+            value=min(max(int(config.app.get("render_workers", 1)), 1), os.cpu_count() or 1),
+            step=1,
+        )
+
         # params.video_clip_duration = st.selectbox(
         #     tr("Clip Duration"), options=[2, 3, 4, 5, 6, 7, 8, 9, 10], index=1
         # )
@@ -690,6 +734,26 @@ with right_panel:
         with stroke_cols[1]:
             params.stroke_width = st.slider(tr("Stroke Width"), 0.0, 10.0, 1.5)
 
+        subtitle_renderers = [
+            (tr("TextClip Renderer"), "textclip"),
+            (tr("ASS Renderer"), "ass"),
+            (tr("Pillow Renderer"), "pillow"),
+        ]
+        saved_subtitle_renderer = config.ui.get("subtitle_renderer", "textclip")
+        saved_subtitle_renderer_index = 0
+        for i, renderer in enumerate(subtitle_renderers):
+            if renderer[1] == saved_subtitle_renderer:
+                saved_subtitle_renderer_index = i
+                break
+        selected_index = st.selectbox(
+            tr("Subtitle Renderer"),
+            index=saved_subtitle_renderer_index,
+            options=range(len(subtitle_renderers)),
+            format_func=lambda x: subtitle_renderers[x][0],
+        )
+        params.subtitle_renderer = subtitle_renderers[selected_index][1]
+        config.ui["subtitle_renderer"] = params.subtitle_renderer
+
 # 视频编辑面板
 with st.expander(tr("Video Check"), expanded=False):
     try:
@@ -697,17 +761,27 @@ with st.expander(tr("Video Check"), expanded=False):
     except KeyError as e:
         video_list = []
 
-    # 计算列数和行数
+    # 计算列数和行数，分页展示，每页只渲染当前页的片段
     num_videos = len(video_list)
     cols_per_row = 3
-    rows = (num_videos + cols_per_row - 1) // cols_per_row  # 向上取整计算行数
+    page_size = cols_per_row * 3
+    pages = max((num_videos + page_size - 1) // page_size, 1)
+    page = 1
+    if pages > 1:
+        page = st.number_input(tr("Page"), min_value=1, max_value=pages, value=1, step=1, key="video_check_page")
+    page_start = (page - 1) * page_size
+    page_end = min(page_start + page_size, num_videos)
+    rows = (page_end - page_start + cols_per_row - 1) // cols_per_row  # 向上取整计算行数
+
+    # 裁剪时生成的缩略图索引（内存映射），只读取当前页用到的行
+    thumbnail_index = thumbnails.load_index(st.session_state.get('task_id'))
 
     # 使用容器展示视频
     for row in range(rows):
         cols = st.columns(cols_per_row)
         for col in range(cols_per_row):
-            index = row * cols_per_row + col
-            if index < num_videos:
+            index = page_start + row * cols_per_row + col
+            if index < page_end:
                 with cols[col]:
                     video_info = video_list[index]
                     video_path = video_info.get('path')
@@ -716,9 +790,16 @@ with st.expander(tr("Video Check"), expanded=False):
                         initial_picture = video_info['picture']
                         initial_timestamp = video_info['timestamp']
 
-                        with open(video_path, 'rb') as video_file:
-                            video_bytes = video_file.read()
-                            st.video(video_bytes)
+                        # 默认只展示雪碧图，勾选播放后才加载片段
+                        if thumbnail_index and initial_timestamp in thumbnail_index[1]:
+                            st.image(
+                                thumbnails.sprite(thumbnail_index[0], thumbnail_index[1][initial_timestamp]),
+                                use_container_width=True,
+                            )
+                        if st.checkbox(tr("Play Clip"), key=f"play_{index}"):
+                            # st.video 只把字符串当作 URL，本地片段需要读取内容后传入
+                            with open(video_path, "rb") as video_file:
+                                st.video(video_file.read())
 
                         # 可编辑的输入框
                         text_panels = st.columns(2)
@@ -790,7 +871,8 @@ if start_button:
     logger.info(utils.to_json(params))
     scroll_to_bottom()
 
-    result = tm.start_subclip(task_id=task_id, params=params, subclip_path_videos=st.session_state.subclip_videos)
+    with budget.task(task_id):
+        result = tm.start_subclip(task_id=task_id, params=params, subclip_path_videos=st.session_state.subclip_videos)
 
     video_files = result.get("videos", [])
     st.success(tr("视频生成完成"))